@@ -0,0 +1,94 @@
+"""Benchmark archive compression codecs on realistic processing files.
+
+Generates processing logs and registries with the synthetic workload
+generator and writes them to an in-memory archive with each
+available codec and compression level. Reports compression ratio and
+throughput so the best trade-off for the Lambda CPU allotment can be chosen.
+
+Usage: python benchmarks/compression_benchmark.py [--ids N] [--lines N] [--workers N] [--json FILE]
+"""
+
+# Standard imports
+import argparse
+import json
+import pathlib
+import sys
+import tempfile
+import time
+
+# Local imports
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1].joinpath("reporter")))
+from archive import COMPRESSION, write_archive
+from workload import generate_tree, list_tree
+
+# Constants
+LEVELS = {
+    "stored": [None],
+    "deflate": [1, 6, 9],
+    "bzip2": [1, 9],
+    "lzma": [None],
+    "zstd": [3, 10]
+}
+
+class CountingWriter:
+    """Unseekable writer that only counts the bytes written."""
+
+    def __init__(self):
+        self.position = 0
+
+    def write(self, data):
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+def run_benchmark(file_list, workers):
+    """Archive file_list with every codec and level and return results."""
+
+    total_size = sum(file.stat().st_size for file in file_list)
+    results = []
+    for compression in COMPRESSION:
+        for level in LEVELS.get(compression, [None]):
+            for num_workers in sorted({1, workers}):
+                writer = CountingWriter()
+                start = time.perf_counter()
+                write_archive(writer, file_list, compression, level, num_workers)
+                elapsed = time.perf_counter() - start
+                results.append({
+                    "compression": compression,
+                    "level": level,
+                    "workers": num_workers,
+                    "input_bytes": total_size,
+                    "output_bytes": writer.tell(),
+                    "ratio": round(total_size / writer.tell(), 2),
+                    "seconds": round(elapsed, 4),
+                    "mb_per_second": round(total_size / elapsed / 1024**2, 2)
+                })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ids", type=int, default=4, help="Number of unique ids per dataset and processing type")
+    parser.add_argument("--lines", type=int, default=5000, help="Number of lines per file")
+    parser.add_argument("--workers", type=int, default=4, help="Number of compression workers")
+    parser.add_argument("--json", type=pathlib.Path, help="Write results to JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        generate_tree(pathlib.Path(directory), args.ids, args.lines)
+        file_list = list_tree(pathlib.Path(directory))
+        results = run_benchmark(file_list, args.workers)
+
+    print(f"{'compression':<12}{'level':>6}{'workers':>8}{'ratio':>8}{'MB/s':>10}{'seconds':>10}")
+    for result in results:
+        level = "-" if result["level"] is None else result["level"]
+        print(f"{result['compression']:<12}{level:>6}{result['workers']:>8}{result['ratio']:>8}{result['mb_per_second']:>10}{result['seconds']:>10}")
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Benchmark each phase of the reporter pipeline on synthetic workloads.
+
+Generates a processing file tree for each scale, runs reporter.event_handler
+against it with local S3 and SNS stand-ins provided by moto and times each
+phase: discovery, report generation, combination, reconciliation, publishing,
+archiving, sidecar and deletion. Results are written as JSON so runs can be compared between
+commits.
+
+Usage: python benchmarks/pipeline_benchmark.py [--scales small medium backlog] [--json FILE] [--compare FILE]
+"""
+
+# Standard imports
+import argparse
+import functools
+import json
+import logging
+import os
+import pathlib
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+# Third-party imports
+import boto3
+from moto import mock_aws
+
+# Local imports
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1].joinpath("reporter")))
+import clients
+import reporter
+from workload import SCALES, generate_tree
+
+# Constants
+BUCKET = "benchmark-generate-data"
+PHASES = {
+    "discovery": "locate_processing_files",
+    "report_generation": "generate_reports",
+    "combination": "combine_dataset_reports",
+    "reconciliation": "reconcile_processing_files",
+    "publish": "publish_report",
+    "archiving": "archive_processing_files",
+    "sidecar": "write_event_sidecar",
+    "deletion": "remove_processing_files"
+}
+
+def time_phases(timings):
+    """Wrap reporter phase functions to accumulate their wall time."""
+
+    originals = {}
+    for phase, name in PHASES.items():
+        function = getattr(reporter, name)
+        originals[name] = function
+
+        @functools.wraps(function)
+        def timed(*args, _phase=phase, _function=function, **kwargs):
+            start = time.perf_counter()
+            try:
+                return _function(*args, **kwargs)
+            finally:
+                timings[_phase] = timings.get(_phase, 0) + time.perf_counter() - start
+
+        setattr(reporter, name, timed)
+    return originals
+
+def run_scale(scale, num_ids, num_lines, event):
+    """Run the pipeline on one generated tree and return phase timings."""
+
+    with tempfile.TemporaryDirectory() as directory:
+        data_dir = pathlib.Path(directory)
+        start = time.perf_counter()
+        expected = generate_tree(data_dir, num_ids, num_lines)
+        generate_seconds = time.perf_counter() - start
+        input_bytes = sum(file.stat().st_size for file in data_dir.rglob("*") if file.is_file())
+
+        clients._clients.clear()    # Clients must be created inside the mock
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={ "LocationConstraint": os.environ["AWS_DEFAULT_REGION"] })
+        os.environ["REPORTER_TOPIC_ARN"] = boto3.client("sns").create_topic(Name="benchmark-reporter")["TopicArn"]
+        os.environ["FAILURE_TOPIC_ARN"] = boto3.client("sns").create_topic(Name="benchmark-batch-job-failure")["TopicArn"]
+
+        timings = {}
+        originals = time_phases(timings)
+        reporter.DATA_DIR = data_dir
+        try:
+            start = time.perf_counter()
+            reporter.event_handler({ "prefix": BUCKET, **event }, None)
+            total_seconds = time.perf_counter() - start
+        finally:
+            for name, function in originals.items(): setattr(reporter, name, function)
+
+        archive_bytes = sum(obj["Size"] for obj in s3.list_objects_v2(Bucket=BUCKET).get("Contents", []))
+        return {
+            "num_ids": num_ids * len(expected),
+            "num_lines": num_lines,
+            "input_bytes": input_bytes,
+            "archive_bytes": archive_bytes,
+            "workload_seconds": round(generate_seconds, 4),
+            "total_seconds": round(total_seconds, 4),
+            "phases": { phase: round(seconds, 4) for phase, seconds in timings.items() }
+        }
+
+def get_commit():
+    """Return current git commit or None outside a git checkout."""
+
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=pathlib.Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_results(results, baseline=None):
+    """Print phase timings and the change from a baseline run."""
+
+    for scale, result in results["scales"].items():
+        print(f"{scale}: {result['num_ids']} ids, {result['input_bytes']} bytes, total {result['total_seconds']} s")
+        base_phases = baseline["scales"].get(scale, {}).get("phases", {}) if baseline else {}
+        for phase, seconds in result["phases"].items():
+            change = ""
+            if phase in base_phases and base_phases[phase] > 0:
+                change = f" ({(seconds - base_phases[phase]) / base_phases[phase]:+.1%} vs {baseline['commit']})"
+            print(f"    {phase:<20}{seconds:>10.4f} s{change}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", nargs="+", default=list(SCALES), choices=list(SCALES), help="Workload scales to run")
+    parser.add_argument("--ids", type=int, help="Override number of unique ids per dataset and processing type")
+    parser.add_argument("--lines", type=int, help="Override number of lines per file")
+    parser.add_argument("--event", type=json.loads, default={}, help="Additional event payload as JSON")
+    parser.add_argument("--json", type=pathlib.Path, help="Write results to JSON file")
+    parser.add_argument("--compare", type=pathlib.Path, help="JSON results of a previous run to compare against")
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+    logging.disable(logging.INFO)
+    results = { "commit": get_commit(), "python": platform.python_version(), "event": args.event, "scales": {} }
+    for scale in args.scales:
+        num_ids = args.ids or SCALES[scale]["num_ids"]
+        num_lines = args.lines or SCALES[scale]["num_lines"]
+        with mock_aws():
+            results["scales"][scale] = run_scale(scale, num_ids, num_lines, args.event)
+
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    print_results(results, baseline)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
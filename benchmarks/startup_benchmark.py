@@ -0,0 +1,157 @@
+"""Benchmark the import and init time of the reporter Lambda handler.
+
+Imports the handler module in fresh interpreters with `-X importtime`, the
+same work a cold start does before the first invocation, and reports the
+median import time, the slowest modules and the time to create the shared
+AWS clients on first use. Modules that must not be imported at cold start,
+such as boto3, can be forbidden so that a regression fails the run. Results
+are written as JSON so runs can be compared between commits.
+
+Usage: python benchmarks/startup_benchmark.py [--runs N] [--forbid MODULE ...] [--max-ms MS] [--json FILE] [--compare FILE]
+"""
+
+# Standard imports
+import argparse
+import json
+import pathlib
+import platform
+import statistics
+import subprocess
+import sys
+
+# Constants
+REPORTER_DIR = pathlib.Path(__file__).resolve().parents[1].joinpath("reporter")
+HANDLER_MODULE = "reporter"
+DEFAULT_FORBID = ["boto3", "botocore"]
+TOP_MODULES = 10
+CLIENT_SCRIPT = """
+import os, time
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+start = time.perf_counter()
+import clients
+clients.get_client("s3")
+clients.get_client("sns")
+first = time.perf_counter() - start
+start = time.perf_counter()
+clients.get_client("s3")
+clients.get_client("sns")
+print(first, time.perf_counter() - start)
+"""
+
+def parse_importtime(stderr):
+    """Return cumulative microseconds of each top level and nested module.
+
+    Lines look like `import time:   self [us] | cumulative | imported package`
+    with the package name indented by its nesting depth.
+    """
+
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line: continue
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|", 2)
+            modules[name.strip()] = int(cumulative)
+        except ValueError:
+            continue
+    return modules
+
+def time_import():
+    """Import the handler module in a fresh interpreter.
+
+    Returns
+    -------
+    tuple
+        Total import microseconds of the handler module and cumulative
+        microseconds of every module imported.
+    """
+
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {HANDLER_MODULE}"],
+                             capture_output=True, text=True, cwd=REPORTER_DIR)
+    if process.returncode != 0:
+        raise RuntimeError(f"Could not import {HANDLER_MODULE}: {process.stderr.strip().splitlines()[-1]}")
+    modules = parse_importtime(process.stderr)
+    return modules.get(HANDLER_MODULE, 0), modules
+
+def time_clients():
+    """Return seconds to create the shared clients on first use and to reuse
+    them, or None if boto3 is not installed."""
+
+    process = subprocess.run([sys.executable, "-c", CLIENT_SCRIPT], capture_output=True, text=True, cwd=REPORTER_DIR)
+    if process.returncode != 0: return None
+    first, reuse = map(float, process.stdout.split())
+    return { "first_seconds": round(first, 4), "reuse_seconds": round(reuse, 6) }
+
+def run_benchmark(num_runs):
+    """Return median import time, slowest modules and client init time."""
+
+    totals = []
+    module_runs = {}
+    for _ in range(num_runs):
+        total, modules = time_import()
+        totals.append(total)
+        for name, cumulative in modules.items():
+            module_runs.setdefault(name, []).append(cumulative)
+    modules = { name: statistics.median(values) for name, values in module_runs.items() if name != HANDLER_MODULE }
+    top = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:TOP_MODULES]
+    return {
+        "runs": num_runs,
+        "import_ms": round(statistics.median(totals) / 1000, 2),
+        "modules": sorted(module_runs),
+        "top_modules": { name: round(cumulative / 1000, 2) for name, cumulative in top },
+        "clients": time_clients()
+    }
+
+def get_commit():
+    """Return current git commit or None outside a git checkout."""
+
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=pathlib.Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_results(results, baseline=None):
+    """Print import and init times and the change from a baseline run."""
+
+    change = ""
+    if baseline and baseline["import_ms"] > 0:
+        change = f" ({(results['import_ms'] - baseline['import_ms']) / baseline['import_ms']:+.1%} vs {baseline['commit']})"
+    print(f"import {HANDLER_MODULE}: {results['import_ms']} ms median of {results['runs']} runs{change}")
+    for name, milliseconds in results["top_modules"].items():
+        print(f"    {name:<30}{milliseconds:>10.2f} ms")
+    if results["clients"]:
+        print(f"clients: {results['clients']['first_seconds']} s on first use, {results['clients']['reuse_seconds']} s reused")
+    else:
+        print("clients: boto3 is not installed")
+
+def check_results(results, forbid, max_ms):
+    """Return list of regressions of forbidden modules and import time."""
+
+    failures = [ f"{name} is imported at cold start" for name in forbid
+                 if any(module == name or module.startswith(f"{name}.") for module in results["modules"]) ]
+    if max_ms is not None and results["import_ms"] > max_ms:
+        failures.append(f"import took {results['import_ms']} ms, more than {max_ms} ms")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="Number of fresh interpreters to import in")
+    parser.add_argument("--forbid", nargs="*", default=DEFAULT_FORBID, help="Modules that must not be imported at cold start")
+    parser.add_argument("--max-ms", type=float, help="Fail if the median import time is above this many milliseconds")
+    parser.add_argument("--json", type=pathlib.Path, help="Write results to JSON file")
+    parser.add_argument("--compare", type=pathlib.Path, help="JSON results of a previous run to compare against")
+    args = parser.parse_args()
+
+    results = { "commit": get_commit(), "python": platform.python_version(), **run_benchmark(args.runs) }
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    print_results(results, baseline)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+    failures = check_results(results, args.forbid, args.max_ms)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Generate synthetic processing file trees for benchmarks.
+
+Writes processing logs and registries for every dataset and processing type
+under a stand-in for the mounted Processor EFS directory:
+
+    <data_dir>/logs/processing_logs/ghrsst_<dataset>_processing_log_archive_<id>.txt
+    <data_dir>/scratch/ghrsst_master_<dataset>_<type>_list_processed_files_<id>.dat
+
+Processing log lines use the documented format
+`seconds,ascii date,granule,SUCCESS_OVERALL_TOTAL_TIME: n` and registry lines
+use `granule.nc.bz2,epoch,ascii date`. Each granule name carries the
+instrument and processing type so the report search tokens match.
+"""
+
+# Standard imports
+import datetime
+import pathlib
+import random
+import sys
+
+# Local imports
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1].joinpath("reporter")))
+from report_engine import format_ascii_date, get_processing_log, get_registry
+
+# Constants
+DATASETS = ("modis_a", "modis_t", "viirs")
+PROCESSING_TYPES = ("quicklook", "refined")
+SCALES = {
+    "small": { "num_ids": 2, "num_lines": 1000 },
+    "medium": { "num_ids": 10, "num_lines": 5000 },
+    "backlog": { "num_ids": 50, "num_lines": 5000 }
+}
+
+def get_granule(dataset, processing_type, date, index):
+    """Return synthetic L2P granule name."""
+
+    return f"{date:%Y%m%d%H%M%S}-JPL-L2P_GHRSST-SSTskin-{dataset.upper()}-{processing_type.upper()}-{index:07d}-v02.0-fv01.0.nc"
+
+def generate_tree(data_dir, num_ids, num_lines, date=None, seed=0,
+                  other_day_fraction=0.1, duplicate_fraction=0.0):
+    """Write processing logs and registries for every dataset and type.
+
+    Parameters
+    ----------
+    data_dir: pathlib.Path
+        Directory standing in for the mounted Processor EFS directory.
+    num_ids: int
+        Number of unique ids per dataset and processing type.
+    num_lines: int
+        Number of lines per processing log and registry.
+    date: datetime.datetime
+        Local time the lines are processed on, defaults to now.
+    seed: int
+        Random seed so trees are reproducible between commits.
+    other_day_fraction: float
+        Fraction of lines processed on the previous day.
+    duplicate_fraction: float
+        Fraction of granules reprocessed from a previous unique id.
+
+    Returns
+    -------
+    dict
+        Expected number of processing log and registry lines processed on
+        date for each dataset and processing type.
+    """
+
+    rng = random.Random(seed)
+    if date is None: date = datetime.datetime.now()
+    start = date.replace(hour=0, minute=0, second=0, microsecond=0)
+    data_dir.joinpath("logs", "processing_logs").mkdir(parents=True, exist_ok=True)
+    data_dir.joinpath("scratch").mkdir(parents=True, exist_ok=True)
+
+    expected = {}
+    index = 0
+    for dataset in DATASETS:
+        for processing_type in PROCESSING_TYPES:
+            expected[(dataset, processing_type)] = { "processed": 0, "registry": 0 }
+            previous = []
+            for _ in range(num_ids):
+                unique_id = f"{rng.randrange(10**9):09d}"
+                log_lines = []
+                registry_lines = []
+                granules = []
+                for line in range(num_lines):
+                    seconds = int(line * (date - start).total_seconds() / num_lines)
+                    line_date = start + datetime.timedelta(seconds=seconds)
+                    if rng.random() < other_day_fraction:
+                        line_date -= datetime.timedelta(days=1)
+                    else:
+                        expected[(dataset, processing_type)]["processed"] += 1
+                        expected[(dataset, processing_type)]["registry"] += 1
+                    if previous and rng.random() < duplicate_fraction:
+                        granule = rng.choice(previous)
+                    else:
+                        granule = get_granule(dataset, processing_type, line_date, index)
+                        index += 1
+                    granules.append(granule)
+                    epoch = int(line_date.timestamp())
+                    ascii_date = format_ascii_date(line_date)
+                    log_lines.append(f"{epoch},{ascii_date},{granule},SUCCESS_OVERALL_TOTAL_TIME: {rng.lognormvariate(4.5, 0.4):.2f}\n")
+                    registry_lines.append(f"{granule}.bz2,{epoch},{ascii_date}\n")
+                previous = granules
+                get_processing_log(data_dir, dataset, unique_id).write_text("".join(log_lines))
+                get_registry(data_dir, dataset, processing_type, unique_id).write_text("".join(registry_lines))
+    return expected
+
+def list_tree(data_dir):
+    """Return list of processing files written under data_dir."""
+
+    return sorted(data_dir.joinpath("logs", "processing_logs").iterdir()) \
+        + sorted(data_dir.joinpath("scratch").glob("*.dat"))
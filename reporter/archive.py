@@ -0,0 +1,549 @@
+"""Stream the daily archive of processing files straight to S3.
+
+Zip entries are written into an S3 multipart upload as they are compressed so
+the archive is never staged on the EFS and memory use is bounded by the part
+size. Each part is uploaded with a SHA256 checksum that S3 validates and the
+completed object is checked against a manifest of the entries written before
+any processing file is deleted.
+
+The zip format is written by ZipWriter: each entry is a local header, the
+compressed data as it is produced and a data descriptor with the CRC and
+sizes, and the central directory follows the last entry, with Zip64 records
+for entries, offsets or counts over the zip limits. Compressors and
+decompressors are created with the public zlib, bz2 and lzma APIs.
+
+Entries can be compressed in parallel on a thread pool (zlib, bz2 and lzma
+release the GIL). Each thread hands its compressed chunks to the writer
+through a bounded buffer and the writer streams the entries in order, so
+memory is bounded by the workers and their buffers whatever the file sizes.
+"""
+
+# Standard imports
+import base64
+import bz2
+import collections
+import concurrent.futures
+import hashlib
+import io
+import lzma
+import queue
+import struct
+import threading
+import time
+import zipfile
+import zlib
+
+# Constants
+PART_SIZE = 8 * 1024 * 1024    # Minimum S3 part size is 5 MiB
+READ_BUFFER_SIZE = 1024 * 1024
+ENTRY_BUFFER_CHUNKS = 4    # Compressed chunks each thread may hold ahead of the writer
+STOP_POLL_SECONDS = 0.1
+COMPRESSION = {
+    "stored": zipfile.ZIP_STORED,
+    "deflate": zipfile.ZIP_DEFLATED,
+    "bzip2": zipfile.ZIP_BZIP2,
+    "lzma": zipfile.ZIP_LZMA
+}
+if hasattr(zipfile, "ZIP_ZSTANDARD"): COMPRESSION["zstd"] = zipfile.ZIP_ZSTANDARD
+ZIP64_LIMIT = (1 << 31) - 1    # Largest size or offset zipfile writes without Zip64 records
+ZIP_FILECOUNT_LIMIT = (1 << 16) - 1
+EXTRACT_VERSIONS = { zipfile.ZIP_STORED: 20, zipfile.ZIP_DEFLATED: 20, zipfile.ZIP_BZIP2: 46, zipfile.ZIP_LZMA: 63 }
+if hasattr(zipfile, "ZIP_ZSTANDARD"): EXTRACT_VERSIONS[zipfile.ZIP_ZSTANDARD] = 63
+ZIP64_VERSION = 45
+CREATE_SYSTEM = 3    # Unix, so external attributes hold the file mode
+FLAG_LZMA_EOS = 0x02    # LZMA data ends with an end-of-stream marker
+FLAG_DATA_DESCRIPTOR = 0x08    # CRC and sizes follow the data
+FLAG_UTF8 = 0x800
+LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")    # Signature through file name and extra field lengths
+LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+CENTRAL_HEADER = struct.Struct("<4s4B4HL2L5H2L")
+CENTRAL_HEADER_SIGNATURE = b"PK\x01\x02"
+DATA_DESCRIPTOR = struct.Struct("<4sL2L")
+DATA_DESCRIPTOR64 = struct.Struct("<4sL2Q")
+DATA_DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+END_RECORD = struct.Struct("<4s4H2LH")
+END_RECORD_SIGNATURE = b"PK\x05\x06"
+END_RECORD64 = struct.Struct("<4sQ2H2L4Q")
+END_RECORD64_SIGNATURE = b"PK\x06\x06"
+END_LOCATOR64 = struct.Struct("<4sLQL")
+END_LOCATOR64_SIGNATURE = b"PK\x06\x07"
+ZIP64_EXTRA_ID = 0x0001
+LZMA_VERSION = 9    # LZMA SDK version recorded in the header of zip LZMA entries
+LZMA_DICT_SIZE = 8 * 1024 * 1024    # Dictionary of LZMA preset 6, the zipfile default
+
+class ArchiveError(Exception):
+    """Raised when the uploaded archive cannot be verified."""
+
+class S3MultipartWriter(io.RawIOBase):
+    """Write-only file object that uploads to S3 in multipart chunks.
+
+    Bytes are buffered until a part is full and then uploaded with a SHA256
+    checksum. The writer is not seekable so ZipWriter writes entries with data
+    descriptors and never needs to go back to rewrite a header.
+    """
+
+    def __init__(self, s3, bucket, key, part_size=PART_SIZE, extra_args=None):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.position = 0
+        self.parts = []
+        response = s3.create_multipart_upload(Bucket=bucket, Key=key, ChecksumAlgorithm="SHA256", **(extra_args or {}))
+        self.upload_id = response["UploadId"]
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        while len(self.buffer) >= self.part_size:
+            self._upload_part(bytes(self.buffer[:self.part_size]))
+            del self.buffer[:self.part_size]
+        return len(data)
+
+    def _upload_part(self, body):
+        """Upload part and confirm S3 computed the same checksum."""
+
+        part_number = len(self.parts) + 1
+        checksum = base64.b64encode(hashlib.sha256(body).digest()).decode()
+        response = self.s3.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                       PartNumber=part_number, Body=body, ChecksumSHA256=checksum)
+        if response.get("ChecksumSHA256", checksum) != checksum:
+            raise ArchiveError(f"Checksum mismatch for part {part_number} of s3://{self.bucket}/{self.key}.")
+        self.parts.append({ "PartNumber": part_number, "ETag": response["ETag"], "ChecksumSHA256": checksum })
+
+    def complete(self):
+        """Upload the remaining buffer and complete the multipart upload."""
+
+        if len(self.buffer) != 0 or len(self.parts) == 0:
+            self._upload_part(bytes(self.buffer))
+            self.buffer.clear()
+        self.s3.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                          MultipartUpload={ "Parts": self.parts })
+
+    def abort(self):
+        """Abort the multipart upload so no partial object is left behind."""
+
+        self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+class S3RangeReader(io.RawIOBase):
+    """Read-only seekable file object over an S3 object using ranged GETs.
+
+    Wrap in io.BufferedReader so zipfile can read the central directory of an
+    archive without downloading the whole object.
+    """
+
+    def __init__(self, s3, bucket, key, size=None):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.size = size if size is not None else s3.head_object(Bucket=bucket, Key=key)["ContentLength"]
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        else:
+            self.position = self.size + offset
+        return self.position
+
+    def readinto(self, buffer):
+        if self.position >= self.size or len(buffer) == 0: return 0
+        end = min(self.position + len(buffer), self.size) - 1
+        response = self.s3.get_object(Bucket=self.bucket, Key=self.key, Range=f"bytes={self.position}-{end}")
+        data = response["Body"].read()
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+def open_s3_archive(s3, bucket, key, size=None):
+    """Return ZipFile that lazily reads an archive stored in S3."""
+
+    reader = io.BufferedReader(S3RangeReader(s3, bucket, key, size), buffer_size=READ_BUFFER_SIZE)
+    return zipfile.ZipFile(reader)
+
+class LZMACompressor:
+    """Raw LZMA compressor that writes the header of zip LZMA entries.
+
+    The header is the LZMA SDK version, the size of the properties and the
+    properties of the LZMA1 filter: a byte of the lc, lp and pb settings and
+    the dictionary size.
+    """
+
+    def __init__(self, lc=3, lp=0, pb=2, dict_size=LZMA_DICT_SIZE):
+        properties = struct.pack("<BI", (pb * 5 + lp) * 9 + lc, dict_size)
+        self.header = struct.pack("<BBH", LZMA_VERSION, 4, len(properties)) + properties
+        self.compressor = lzma.LZMACompressor(lzma.FORMAT_RAW, filters=[{ "id": lzma.FILTER_LZMA1, "lc": lc, "lp": lp,
+                                                                           "pb": pb, "dict_size": dict_size }])
+
+    def compress(self, data):
+        header, self.header = self.header, b""
+        return header + self.compressor.compress(data)
+
+    def flush(self):
+        return self.header + self.compressor.flush()
+
+class LZMADecompressor:
+    """Raw LZMA decompressor that reads the header of zip LZMA entries."""
+
+    def __init__(self):
+        self.buffer = b""
+        self.decompressor = None
+
+    def decompress(self, data):
+        if self.decompressor is None:
+            self.buffer += data
+            if len(self.buffer) < 4: return b""
+            properties_size = struct.unpack("<H", self.buffer[2:4])[0]
+            if len(self.buffer) < 4 + properties_size: return b""
+            settings, dict_size = struct.unpack("<BI", self.buffer[4:9])
+            self.decompressor = lzma.LZMADecompressor(lzma.FORMAT_RAW, filters=[{ "id": lzma.FILTER_LZMA1,
+                "lc": settings % 9, "lp": settings // 9 % 5, "pb": settings // 45, "dict_size": dict_size }])
+            data, self.buffer = self.buffer[4 + properties_size:], b""
+        return self.decompressor.decompress(data)
+
+def get_compression_levels(compression):
+    """Return range of compression levels of the COMPRESSION key or None if
+    the codec takes no level."""
+
+    if compression == "deflate": return range(-1, 10)
+    if compression == "bzip2": return range(1, 10)
+    if compression == "zstd":
+        from compression import zstd
+        lowest, highest = zstd.CompressionParameter.compression_level.bounds()
+        return range(lowest, highest + 1)
+    return None
+
+def get_compressor(compress_type, compresslevel=None):
+    """Return compressor of zip compression type or None for stored entries.
+
+    Each compressor has compress and flush methods like zlib compressors.
+    """
+
+    if compress_type == zipfile.ZIP_DEFLATED:
+        return zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if compresslevel is None else compresslevel, zlib.DEFLATED, -15)
+    if compress_type == zipfile.ZIP_BZIP2:
+        return bz2.BZ2Compressor(9 if compresslevel is None else compresslevel)
+    if compress_type == zipfile.ZIP_LZMA:
+        return LZMACompressor()
+    if compress_type == getattr(zipfile, "ZIP_ZSTANDARD", None):
+        from compression import zstd
+        return zstd.ZstdCompressor(compresslevel)
+    return None
+
+def get_decompressor(compress_type):
+    """Return decompressor of zip compression type or None for stored
+    entries."""
+
+    if compress_type == zipfile.ZIP_DEFLATED: return zlib.decompressobj(-15)
+    if compress_type == zipfile.ZIP_BZIP2: return bz2.BZ2Decompressor()
+    if compress_type == zipfile.ZIP_LZMA: return LZMADecompressor()
+    if compress_type == getattr(zipfile, "ZIP_ZSTANDARD", None):
+        from compression import zstd
+        return zstd.ZstdDecompressor()
+    return None
+
+class ZipEntry:
+    """Name, attributes, CRC and sizes of a file written to an archive.
+
+    Parameters
+    ----------
+    file: pathlib.Path
+        File the entry is read from, stored under its name.
+    compress_type: int
+        Zip compression method of the entry.
+    """
+
+    def __init__(self, file, compress_type):
+        stat = file.stat()
+        self.name = file.name
+        self.date_time = max(time.localtime(stat.st_mtime)[:6], (1980, 1, 1, 0, 0, 0))
+        self.external_attr = (stat.st_mode & 0xFFFF) << 16
+        self.compress_type = compress_type
+        self.zip64 = stat.st_size * 1.05 > ZIP64_LIMIT    # Room for compression to grow the data, as zipfile allows
+        self.crc = 0
+        self.file_size = 0
+        self.compress_size = 0
+        self.header_offset = 0
+
+    def get_name(self):
+        """Return encoded name and the flag bits of its encoding."""
+
+        try:
+            return self.name.encode("ascii"), 0
+        except UnicodeEncodeError:
+            return self.name.encode("utf-8"), FLAG_UTF8
+
+    def get_header_fields(self):
+        """Return extract version, flag bits and DOS time and date."""
+
+        name, flag_bits = self.get_name()
+        flag_bits |= FLAG_DATA_DESCRIPTOR
+        if self.compress_type == zipfile.ZIP_LZMA: flag_bits |= FLAG_LZMA_EOS
+        version = EXTRACT_VERSIONS[self.compress_type]
+        if self.zip64 or self.header_offset > ZIP64_LIMIT: version = max(version, ZIP64_VERSION)
+        year, month, day, hour, minute, second = self.date_time
+        dos_date = (year - 1980) << 9 | month << 5 | day
+        dos_time = hour << 11 | minute << 5 | second // 2
+        return name, version, flag_bits, dos_time, dos_date
+
+    def local_header(self):
+        """Return local header written before the data.
+
+        The CRC and sizes are left at zero for the data descriptor, with a
+        Zip64 extra field for entries that may pass the zip limits.
+        """
+
+        name, version, flag_bits, dos_time, dos_date = self.get_header_fields()
+        extra = struct.pack("<2H2Q", ZIP64_EXTRA_ID, 16, 0, 0) if self.zip64 else b""
+        size = 0xFFFFFFFF if self.zip64 else 0
+        return LOCAL_HEADER.pack(LOCAL_HEADER_SIGNATURE, version, 0, flag_bits, self.compress_type, dos_time, dos_date,
+                                 0, size, size, len(name), len(extra)) + name + extra
+
+    def data_descriptor(self):
+        """Return data descriptor written after the data."""
+
+        if self.zip64:
+            return DATA_DESCRIPTOR64.pack(DATA_DESCRIPTOR_SIGNATURE, self.crc, self.compress_size, self.file_size)
+        return DATA_DESCRIPTOR.pack(DATA_DESCRIPTOR_SIGNATURE, self.crc, self.compress_size, self.file_size)
+
+    def central_header(self):
+        """Return central directory header of the entry.
+
+        Sizes and the offset over the zip limits are replaced by 0xFFFFFFFF
+        and recorded in a Zip64 extra field in that order.
+        """
+
+        name, version, flag_bits, dos_time, dos_date = self.get_header_fields()
+        values = []
+        file_size, compress_size, header_offset = self.file_size, self.compress_size, self.header_offset
+        if self.zip64 or file_size > ZIP64_LIMIT or compress_size > ZIP64_LIMIT:
+            values += [file_size, compress_size]
+            file_size = compress_size = 0xFFFFFFFF
+        if header_offset > ZIP64_LIMIT:
+            values.append(header_offset)
+            header_offset = 0xFFFFFFFF
+        extra = struct.pack(f"<2H{len(values)}Q", ZIP64_EXTRA_ID, 8 * len(values), *values) if values else b""
+        return CENTRAL_HEADER.pack(CENTRAL_HEADER_SIGNATURE, version, CREATE_SYSTEM, version, 0, flag_bits,
+                                   self.compress_type, dos_time, dos_date, self.crc, compress_size, file_size,
+                                   len(name), len(extra), 0, 0, 0, self.external_attr, header_offset) + name + extra
+
+class ZipWriter:
+    """Write a zip archive of streamed entries to a file object that need not
+    be seekable.
+
+    Parameters
+    ----------
+    fp: file object
+        Writable file object to write the archive to.
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.position = 0
+        self.entries = []
+
+    def write(self, data):
+        self.fp.write(data)
+        self.position += len(data)
+
+    def write_entry(self, entry, chunks):
+        """Write the local header, the compressed chunks and the data
+        descriptor of an entry.
+
+        Raises
+        ------
+        ArchiveError
+            If an entry written without Zip64 records passes the zip limits.
+        """
+
+        entry.header_offset = self.position
+        self.write(entry.local_header())
+        for chunk in chunks:
+            self.write(chunk)
+            entry.compress_size += len(chunk)
+        if not entry.zip64 and max(entry.file_size, entry.compress_size) > ZIP64_LIMIT:
+            raise ArchiveError(f"{entry.name} grew past {ZIP64_LIMIT} bytes while it was archived.")
+        self.write(entry.data_descriptor())
+        self.entries.append(entry)
+
+    def close(self):
+        """Write the central directory and the end of central directory
+        records."""
+
+        start = self.position
+        for entry in self.entries:
+            self.write(entry.central_header())
+        size = self.position - start
+        count = len(self.entries)
+        if count > ZIP_FILECOUNT_LIMIT or start > ZIP64_LIMIT or size > ZIP64_LIMIT:
+            end64 = self.position
+            self.write(END_RECORD64.pack(END_RECORD64_SIGNATURE, END_RECORD64.size - 12, ZIP64_VERSION, ZIP64_VERSION,
+                                         0, 0, count, count, size, start))
+            self.write(END_LOCATOR64.pack(END_LOCATOR64_SIGNATURE, 0, end64, 1))
+            count, size, start = min(count, 0xFFFF), min(size, 0xFFFFFFFF), min(start, 0xFFFFFFFF)
+        self.write(END_RECORD.pack(END_RECORD_SIGNATURE, 0, 0, count, count, size, start, 0))
+
+def compress_chunks(file, entry, compresslevel=None):
+    """Yield compressed chunks of file and record its CRC and size in the
+    entry."""
+
+    compressor = get_compressor(entry.compress_type, compresslevel)
+    with open(file, "rb") as fh:
+        while chunk := fh.read(READ_BUFFER_SIZE):
+            entry.crc = zlib.crc32(chunk, entry.crc)
+            entry.file_size += len(chunk)
+            data = compressor.compress(chunk) if compressor else chunk
+            if data: yield data
+    if compressor:
+        data = compressor.flush()
+        if data: yield data
+
+class ChunkBuffer:
+    """Bounded buffer of the compressed chunks of one entry, filled by a
+    compressing thread and read in order by the archive writer.
+
+    Parameters
+    ----------
+    max_chunks: int
+        Number of chunks held before the compressing thread waits.
+    stop: threading.Event
+        Set when the archive stops being written so waiting threads return.
+    """
+
+    def __init__(self, max_chunks, stop):
+        self.queue = queue.Queue(max_chunks)
+        self.stop = stop
+
+    def put(self, item):
+        """Put item once there is room and return True, or return False if
+        writing stopped."""
+
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=STOP_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def fill(self, chunks):
+        """Put every chunk followed by None, or the exception that stopped
+        compressing."""
+
+        try:
+            for chunk in chunks:
+                if not self.put(chunk): return
+        except Exception as e:
+            self.put(e)
+            return
+        self.put(None)
+
+    def __iter__(self):
+        while (item := self.queue.get()) is not None:
+            if isinstance(item, Exception): raise item
+            yield item
+
+def write_archive(writer, file_list, compression="stored", compresslevel=None, workers=1):
+    """Write files to a zip archive on writer and return entry manifest.
+
+    Parameters
+    ----------
+    writer: file object
+        Writable file object to write archive to.
+    file_list: list
+        List of pathlib.Path files to include in the archive.
+    compression: str
+        Key of COMPRESSION to compress entries with.
+    compresslevel: int
+        Compression level passed to the compressor, None for its default.
+    workers: int
+        Number of entries to compress at the same time.
+
+    Returns
+    -------
+    list
+        Manifest of dictionaries with name, size and CRC of each entry.
+    """
+
+    compress_type = COMPRESSION[compression]
+    archive = ZipWriter(writer)
+    if compress_type == zipfile.ZIP_STORED or workers == 1:
+        for file in file_list:
+            entry = ZipEntry(file, compress_type)
+            archive.write_entry(entry, compress_chunks(file, entry, compresslevel))
+    else:
+        stop = threading.Event()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                pending = collections.deque()
+                for file in file_list:
+                    entry = ZipEntry(file, compress_type)
+                    buffer = ChunkBuffer(ENTRY_BUFFER_CHUNKS, stop)
+                    executor.submit(buffer.fill, compress_chunks(file, entry, compresslevel))
+                    pending.append((entry, buffer))
+                    while len(pending) > workers:    # Only as many entries as threads are compressed ahead
+                        archive.write_entry(*pending.popleft())
+                while pending: archive.write_entry(*pending.popleft())
+            except BaseException:
+                stop.set()    # Threads waiting on a full buffer return and queued files are not compressed
+                executor.shutdown(cancel_futures=True)
+                raise
+    archive.close()
+    return [ { "name": entry.name, "size": entry.file_size, "crc": entry.crc } for entry in archive.entries ]
+
+def verify_archive(s3, bucket, key, size, manifest):
+    """Verify the uploaded archive size and entries against the manifest.
+
+    Raises
+    ------
+    ArchiveError
+        If the object size or any entry does not match.
+    """
+
+    content_length = s3.head_object(Bucket=bucket, Key=key)["ContentLength"]
+    if content_length != size:
+        raise ArchiveError(f"Size of s3://{bucket}/{key} is {content_length} bytes, expected {size} bytes.")
+    with open_s3_archive(s3, bucket, key, content_length) as archive:
+        entries = [ { "name": info.filename, "size": info.file_size, "crc": info.CRC } for info in archive.infolist() ]
+    if entries != manifest:
+        raise ArchiveError(f"Entries in s3://{bucket}/{key} do not match the manifest of {len(manifest)} files written.")
+
+def upload_archive(s3, bucket, key, file_list, extra_args=None, part_size=PART_SIZE, **zip_args):
+    """Stream files to a zip archive in S3 and verify the completed upload.
+
+    Returns
+    -------
+    dict
+        Manifest of entries, number of bytes and number of parts uploaded.
+    """
+
+    writer = S3MultipartWriter(s3, bucket, key, part_size, extra_args)
+    try:
+        manifest = write_archive(writer, file_list, **zip_args)
+        writer.complete()
+    except BaseException as error:
+        try:
+            writer.abort()
+        except Exception as abort_error:    # Raise the error that stopped the upload, not the failed clean up
+            error.add_note(f"Could not abort multipart upload of s3://{bucket}/{key}: {abort_error}")
+        raise
+    verify_archive(s3, bucket, key, writer.tell(), manifest)
+    return { "manifest": manifest, "size": writer.tell(), "parts": len(writer.parts) }
@@ -0,0 +1,217 @@
+"""Persisted byte-offset checkpoints for incremental scanning.
+
+Records the offset, inode, size and running count already consumed for each
+processing log and registry so that intraday runs only read bytes appended
+since the previous run. Checkpoints are stored as JSON on the EFS next to the
+scratch directory and are keyed by dataset, processing type and unique id.
+The latency columns of the processing log lines already consumed are stored
+next to them as one NumPy archive per key, the distinct granule counters
+of the day as one NumPy archive for every dataset and processing type and
+the sorted runs of the granule names counted for reconciliation under a
+directory of the day. The Parquet parts of the granule events of each
+processing file are kept under a directory per key until it is archived.
+"""
+
+# Standard imports
+import json
+import os
+import shutil
+
+# Third-party imports
+import numpy as np
+
+# Local imports
+from dedup import DistinctCounters
+
+# Constants
+CHECKPOINT_DIR = "checkpoints"
+CHECKPOINT_FILE = "reporter_checkpoints.json"
+COLUMNS_DIR = "latency"
+COUNTERS_FILE = "distinct.npz"
+GRANULES_DIR = "granules"
+EVENTS_DIR = "events"
+
+def get_checkpoint_file(data_dir):
+    """Return path to checkpoint store."""
+
+    return data_dir.joinpath(CHECKPOINT_DIR, CHECKPOINT_FILE)
+
+def get_checkpoint_key(dataset, processing_type, unique_id):
+    """Return checkpoint key for dataset, processing type and unique id."""
+
+    return f"{dataset}/{processing_type}/{unique_id}"
+
+def get_columns_file(data_dir, key):
+    """Return path to latency columns stored for checkpoint key."""
+
+    return data_dir.joinpath(CHECKPOINT_DIR, COLUMNS_DIR, f"{key.replace('/', '_')}.npz")
+
+def get_counters_file(data_dir):
+    """Return path to distinct granule counters."""
+
+    return data_dir.joinpath(CHECKPOINT_DIR, COUNTERS_FILE)
+
+def get_granules_dir(data_dir, report_day):
+    """Return directory of the granule name runs of the report day."""
+
+    return data_dir.joinpath(CHECKPOINT_DIR, GRANULES_DIR, report_day)
+
+def get_events_dir(data_dir, key=None):
+    """Return directory of the granule event parts of checkpoint key or of 
+    every key."""
+
+    events_dir = data_dir.joinpath(CHECKPOINT_DIR, EVENTS_DIR)
+    return events_dir.joinpath(key.replace("/", "_")) if key else events_dir
+
+def load_checkpoints(data_dir, report_day, logger):
+    """Load checkpoints for the report day.
+
+    Checkpoints recorded for a different day keep their offsets as the bytes
+    already consumed belong to earlier days but their running counts are
+    reset to zero.
+
+    Parameters
+    ----------
+    data_dir: pathlib.Path
+        Mounted Processor EFS directory.
+    report_day: str
+        ISO format date the running counts belong to.
+    logger: Logger
+        Logger object to log status.
+
+    Returns
+    -------
+    dict
+        Dictionary of checkpoint key and processing log and registry state.
+    """
+
+    checkpoint_file = get_checkpoint_file(data_dir)
+    try:
+        with open(checkpoint_file) as fh:
+            store = json.load(fh)
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        logger.info(f"Ignoring unreadable checkpoint file: {checkpoint_file} - {e}.")
+        return {}
+
+    checkpoints = store["checkpoints"]
+    if store["report_day"] != report_day:
+        for checkpoint in checkpoints.values():
+            for state in checkpoint.values():
+                if state: state["count"] = 0
+        logger.info(f"Reset running counts for checkpoints recorded on {store['report_day']}.")
+    logger.info(f"Loaded {len(checkpoints)} checkpoints from: {checkpoint_file}.")
+    return checkpoints
+
+def save_checkpoints(data_dir, report_day, checkpoints, logger):
+    """Atomically write checkpoints for the report day to the EFS."""
+
+    checkpoint_file = get_checkpoint_file(data_dir)
+    checkpoint_file.parent.mkdir(parents=True, exist_ok=True)
+    temp_file = checkpoint_file.with_suffix(".tmp")
+    with open(temp_file, 'w') as fh:
+        json.dump({ "report_day": report_day, "checkpoints": checkpoints }, fh)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(temp_file, checkpoint_file)
+    logger.info(f"Saved {len(checkpoints)} checkpoints to: {checkpoint_file}.")
+
+def update_checkpoints(checkpoints, report_dict):
+    """Record the checkpoint returned with each report."""
+
+    for dataset, processing_dict in report_dict.items():
+        for processing_type, reports in processing_dict.items():
+            for report in reports:
+                if "checkpoint" in report:
+                    checkpoints[get_checkpoint_key(dataset, processing_type, report["unique_id"])] = report["checkpoint"]
+
+def remove_checkpoints(checkpoints, dataset_dict):
+    """Remove checkpoints for processing files that have been archived."""
+
+    for dataset, processing_dict in dataset_dict.items():
+        for processing_type, file_ids in processing_dict.items():
+            for file_id in file_ids:
+                checkpoints.pop(get_checkpoint_key(dataset, processing_type, file_id), None)
+
+def load_columns(data_dir, key):
+    """Load latency columns and the running count they cover for key.
+
+    Returns None if no columns are stored or they cannot be read.
+    """
+
+    try:
+        with np.load(get_columns_file(data_dir, key)) as npz:
+            return { name: npz[name] for name in ("epochs", "seconds", "slow_seconds", "slow_granules") } | { "count": int(npz["count"]) }
+    except (OSError, KeyError, ValueError):
+        return None
+
+def save_columns(data_dir, report_dict, logger):
+    """Atomically write the latency columns returned with each report."""
+
+    num_saved = 0
+    for dataset, processing_dict in report_dict.items():
+        for processing_type, reports in processing_dict.items():
+            for report in reports:
+                if "latency" not in report: continue
+                columns_file = get_columns_file(data_dir, get_checkpoint_key(dataset, processing_type, report["unique_id"]))
+                columns_file.parent.mkdir(parents=True, exist_ok=True)
+                temp_file = columns_file.with_suffix(".tmp")
+                with open(temp_file, "wb") as fh:
+                    np.savez(fh, count=report["checkpoint"]["log"]["count"], **report["latency"])
+                    fh.flush()
+                    os.fsync(fh.fileno())
+                os.replace(temp_file, columns_file)
+                num_saved += 1
+    logger.info(f"Saved latency columns for {num_saved} processing logs to: {data_dir.joinpath(CHECKPOINT_DIR, COLUMNS_DIR)}.")
+
+def remove_columns(data_dir, dataset_dict):
+    """Remove latency columns for processing files that have been archived."""
+
+    for dataset, processing_dict in dataset_dict.items():
+        for processing_type, file_ids in processing_dict.items():
+            for file_id in file_ids:
+                get_columns_file(data_dir, get_checkpoint_key(dataset, processing_type, file_id)).unlink(missing_ok=True)
+
+def load_counters(data_dir, report_day, logger):
+    """Load distinct granule counters of the report day.
+
+    Counters saved on a different day or that cannot be read are replaced
+    by empty counters.
+    """
+
+    counters_file = get_counters_file(data_dir)
+    counters, values = DistinctCounters.load(counters_file)
+    if counters is None or values.get("report_day") != report_day: return DistinctCounters()
+    logger.info(f"Loaded distinct granule counters from: {counters_file}.")
+    return counters
+
+def save_counters(data_dir, report_day, counters, logger):
+    """Atomically write distinct granule counters of the report day."""
+
+    counters_file = get_counters_file(data_dir)
+    counters.save(counters_file, report_day=report_day)
+    logger.info(f"Saved distinct granule counters to: {counters_file}.")
+
+def remove_counters(data_dir):
+    """Remove distinct granule counters once their files are archived."""
+
+    get_counters_file(data_dir).unlink(missing_ok=True)
+
+def remove_granules(data_dir):
+    """Remove granule name runs once their files are archived."""
+
+    shutil.rmtree(data_dir.joinpath(CHECKPOINT_DIR, GRANULES_DIR), ignore_errors=True)
+
+def remove_events(data_dir, dataset_dict):
+    """Remove granule event parts for processing files that have been 
+    archived."""
+
+    for dataset, processing_dict in dataset_dict.items():
+        for processing_type, file_ids in processing_dict.items():
+            for file_id in file_ids:
+                shutil.rmtree(get_events_dir(data_dir, get_checkpoint_key(dataset, processing_type, file_id)), ignore_errors=True)
+    try:
+        get_events_dir(data_dir).rmdir()
+    except OSError:
+        pass    # Left if files discovered after this run have parts
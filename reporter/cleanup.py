@@ -0,0 +1,101 @@
+"""Parallel removal of processed files from the EFS.
+
+Every unlink on the NFS backed EFS is a round trip so files are removed on a
+bounded pool of threads. Paths come from discovery so nothing is statted
+before it is removed and files that are already gone are counted as missing
+rather than treated as errors.
+"""
+
+# Standard imports
+import concurrent.futures
+import os
+import time
+
+# Constants
+CLEANUP_WORKERS = int(os.getenv("CLEANUP_WORKERS", 16))
+
+def unlink_file(path):
+    """Remove path and return True or False if it did not exist."""
+
+    try:
+        os.unlink(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+def remove_files(file_list, workers=CLEANUP_WORKERS):
+    """Remove files concurrently.
+
+    Every file is attempted before any errors are returned so that a single
+    failure does not leave the batch partially removed.
+
+    Parameters
+    ----------
+    file_list: list
+        Paths of files to remove.
+    workers: int
+        Maximum number of files to remove at the same time, removed on the
+        calling thread when 1.
+
+    Returns
+    -------
+    dict
+        Number of files deleted and already missing, list of path and error
+        for files that could not be removed and the number of seconds taken.
+    """
+
+    start = time.perf_counter()
+    result = { "deleted": 0, "missing": 0, "errors": [], "seconds": 0.0 }
+    if workers == 1:
+        for path in file_list:
+            try:
+                result["deleted" if unlink_file(path) else "missing"] += 1
+            except OSError as e:
+                result["errors"].append((path, e))
+    elif len(file_list) != 0:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(file_list))) as executor:
+            futures = { executor.submit(unlink_file, path): path for path in file_list }
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    result["deleted" if future.result() else "missing"] += 1
+                except OSError as e:
+                    result["errors"].append((futures[future], e))
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+def remove_directory(directory, workers=CLEANUP_WORKERS):
+    """Remove a directory tree, removing the files in each directory
+    concurrently.
+
+    Entries are listed with os.scandir so directories are told apart from
+    files without a stat on file systems that report entry types.
+
+    Returns
+    -------
+    dict
+        Same as remove_files with the directories removed counted as deleted.
+    """
+
+    start = time.perf_counter()
+    file_list = []
+    directories = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                (directories if entry.is_dir(follow_symlinks=False) else file_list).append(entry.path)
+    except FileNotFoundError:
+        return { "deleted": 0, "missing": 1, "errors": [], "seconds": time.perf_counter() - start }
+
+    result = remove_files(file_list, workers)
+    for subdirectory in directories:
+        subresult = remove_directory(subdirectory, workers)
+        for key in ("deleted", "missing", "errors"): result[key] += subresult[key]
+    try:
+        os.rmdir(directory)
+        result["deleted"] += 1
+    except FileNotFoundError:
+        result["missing"] += 1
+    except OSError as e:
+        result["errors"].append((directory, e))
+    result["seconds"] = time.perf_counter() - start
+    return result
@@ -0,0 +1,68 @@
+"""Shared AWS clients and cached SNS topic resolution.
+
+Clients are created once and reused by every call site and across warm
+Lambda invocations. boto3 is only imported when the first client is created
+so invocations that never call AWS do not pay for importing it. SNS topic ARNs
+can be set explicitly in the environment; otherwise they are resolved by
+following every page of ListTopics and cached with a TTL.
+"""
+
+# Standard imports
+import os
+import threading
+import time
+
+# Constants
+TOPIC_CACHE_TTL = int(os.getenv("TOPIC_CACHE_TTL", 3600))    # Seconds
+
+# Module state reused across warm invocations
+_clients = {}
+_topic_arns = {}
+_lock = threading.Lock()
+
+class TopicNotFoundError(Exception):
+    """Raised when no SNS topic ARN matches the topic string."""
+
+def get_client(service):
+    """Return shared boto3 client for the AWS service."""
+
+    with _lock:
+        if service not in _clients:
+            import boto3
+            _clients[service] = boto3.client(service)
+        return _clients[service]
+
+def resolve_topic_arn(topic_string, env_var=None, ttl=TOPIC_CACHE_TTL):
+    """Return ARN of the SNS topic that contains topic_string.
+
+    Parameters
+    ----------
+    topic_string: str
+        String to search for in each topic ARN.
+    env_var: str
+        Environment variable that overrides the lookup with an explicit ARN.
+    ttl: int
+        Number of seconds a resolved ARN is cached for.
+
+    Raises
+    ------
+    TopicNotFoundError
+        If no topic in any page of ListTopics matches topic_string.
+    botocore.exceptions.ClientError
+        If topics cannot be listed.
+    """
+
+    if env_var and os.getenv(env_var): return os.getenv(env_var)
+
+    with _lock:
+        cached = _topic_arns.get(topic_string)
+    if cached and cached[1] > time.monotonic(): return cached[0]
+
+    paginator = get_client("sns").get_paginator("list_topics")
+    for page in paginator.paginate():
+        for topic in page["Topics"]:
+            if topic_string in topic["TopicArn"]:
+                with _lock:
+                    _topic_arns[topic_string] = (topic["TopicArn"], time.monotonic() + ttl)
+                return topic["TopicArn"]
+    raise TopicNotFoundError(f"No SNS Topic found that contains: {topic_string}.")
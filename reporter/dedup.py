@@ -0,0 +1,380 @@
+"""Distinct granule counts across the unique ids of a dataset.
+
+Generate can reprocess a granule under a new unique id so summing the lines
+counted for each id counts it more than once. Each counted processing log
+line is hashed to 64 bits from its granule name while the report engine
+reads the log, and the hashes are added in batches to one counter per dataset
+and processing type shared by the reports of every id. Reports only carry the
+number of lines hashed, so memory is bounded by the counters whatever the
+number of lines.
+
+Counter state is written as NumPy arrays for intraday runs, for the journal
+of a daily run and for the partial results of sharded runs, and counters of
+separate runs are merged.
+
+Hashes are held exactly in a sorted NumPy array while it fits in the memory
+budget. Above that the counter switches to a Bloom filter that uses the
+whole budget; a granule is only counted if the filter has not seen it, so
+the count can only be low, by about the false positive rate of the filter
+times the granules checked against it.
+
+MEMORY_BUDGET is the total for the counters of a run, split evenly between
+the NUM_COUNTERS dataset and processing type pairs so every counter has the
+same budget and Bloom filters of separate runs can be merged. The default
+of 64 MiB gives each counter about 10.7 MiB: about 1.4 million distinct
+granules counted exactly, then a Bloom filter with a 1% false positive rate
+up to about 9 million. Merging pending hashes into the sorted array briefly
+needs up to twice the budget of a counter on top of it.
+"""
+
+# Standard imports
+from array import array
+import hashlib
+import math
+import os
+import threading
+import zipfile
+
+# Third-party imports
+import numpy as np
+
+# Constants
+MEMORY_BUDGET = int(os.getenv("DEDUP_MEMORY_BUDGET", 64 * 1024 * 1024))    # Bytes of every counter of a run
+NUM_COUNTERS = 6    # MODIS_A, MODIS_T and VIIRS quicklook and refined
+COUNTER_BUDGET = MEMORY_BUDGET // NUM_COUNTERS
+BLOOM_HASHES = 7    # Optimal for about 10 bits per granule, a 1% false positive rate
+BLOOM_CHUNK = 1 << 18    # Hashes checked and inserted at a time
+HASH_BATCH = 1 << 16    # Hashes of a log added to its counter at a time
+POPCOUNT = np.array([ bin(value).count("1") for value in range(256) ], dtype=np.uint8)
+
+def hash_granule(name):
+    """Return 64-bit hash of a granule name."""
+
+    return int.from_bytes(hashlib.blake2b(name.strip().encode(), digest_size=8).digest(), "little")
+
+def sorted_unique(hashes):
+    """Return sorted unique hashes.
+
+    Sorting and dropping repeats of the previous value is several times
+    faster than np.unique on large hash arrays.
+    """
+
+    hashes = np.sort(hashes)
+    if hashes.size == 0: return hashes
+    keep = np.empty(hashes.size, dtype=bool)
+    keep[0] = True
+    np.not_equal(hashes[1:], hashes[:-1], out=keep[1:])
+    return hashes[keep]
+
+class DistinctCounter:
+    """Count distinct granule hashes within a memory budget.
+
+    Parameters
+    ----------
+    memory_budget: int
+        Number of bytes the exact hashes or the Bloom filter may use.
+    num_hashes: int
+        Number of bit positions set for each granule in the Bloom filter.
+    """
+
+    def __init__(self, memory_budget=COUNTER_BUDGET, num_hashes=BLOOM_HASHES):
+        self.memory_budget = memory_budget
+        self.num_hashes = num_hashes
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.pending = []
+        self.pending_bytes = 0
+        self.bloom = None
+        self.num_bits = 0
+        self.num_bloom = 0
+        self.num_checked = 0
+        self.lock = threading.Lock()    # Reports of a dataset add hashes from several threads
+
+    @classmethod
+    def from_arrays(cls, columns, memory_budget=COUNTER_BUDGET):
+        """Return counter of the state written by to_arrays."""
+
+        if "bloom" not in columns:
+            counter = cls(memory_budget)
+            counter.add(columns["hashes"])
+            return counter
+        num_hashes, num_bloom, num_checked = (int(value) for value in columns["bloom_counts"])
+        counter = cls(columns["bloom"].size, num_hashes)
+        counter.bloom = np.array(columns["bloom"], dtype=np.uint8)
+        counter.num_bits = counter.bloom.size * 8
+        counter.num_bloom = num_bloom
+        counter.num_checked = num_checked
+        return counter
+
+    def to_arrays(self):
+        """Return state of the counter as a dictionary of NumPy arrays."""
+
+        with self.lock:
+            if self.exact:
+                self.compact()
+                return { "hashes": self.hashes }
+            return { "bloom": self.bloom.copy(),
+                     "bloom_counts": np.array([self.num_hashes, self.num_bloom, self.num_checked], dtype=np.int64) }
+
+    def add(self, hashes):
+        """Add an array of granule hashes.
+
+        While counting exactly, arrays are only merged into the sorted
+        unique hashes once the pending arrays would take them over the
+        budget. The counter switches to the Bloom filter if the unique
+        hashes alone are over it. Adding hashes that were already added does
+        not change the count.
+        """
+
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        with self.lock:
+            if self.exact:
+                self.pending.append(hashes)
+                self.pending_bytes += hashes.nbytes
+                if self.hashes.nbytes + self.pending_bytes <= self.memory_budget: return
+                self.compact()
+                if self.hashes.nbytes <= self.memory_budget: return
+                self.bloom = np.zeros(self.memory_budget, dtype=np.uint8)
+                self.num_bits = self.memory_budget * 8
+                hashes, self.hashes = self.hashes, np.empty(0, dtype=np.uint64)
+            self.insert_bloom(hashes)
+
+    def merge(self, other):
+        """Add the granules counted by another counter.
+
+        Exact hashes are added like any other hashes. A Bloom filter is
+        combined bit by bit with one of the same size and the distinct count
+        of the union is estimated from the number of bits set.
+
+        Raises
+        ------
+        ValueError
+            If both counters use Bloom filters of different sizes.
+        """
+
+        columns = other.to_arrays()
+        if "hashes" in columns:
+            self.add(columns["hashes"])
+            return
+        other = DistinctCounter.from_arrays(columns)
+        with self.lock:
+            if self.exact:
+                self.compact()
+                hashes = self.hashes
+                self.hashes = np.empty(0, dtype=np.uint64)
+                self.bloom, self.num_bits, self.num_hashes = other.bloom, other.num_bits, other.num_hashes
+                self.num_bloom, self.num_checked = other.num_bloom, other.num_checked
+                self.insert_bloom(hashes)
+                return
+            if self.bloom.size != other.bloom.size or self.num_hashes != other.num_hashes:
+                raise ValueError(f"Bloom filters of {self.bloom.size} and {other.bloom.size} bytes cannot be merged.")
+            np.bitwise_or(self.bloom, other.bloom, out=self.bloom)
+            num_set = int(POPCOUNT[self.bloom].sum(dtype=np.int64))
+            estimate = -self.num_bits / self.num_hashes * math.log1p(-min(num_set, self.num_bits - 1) / self.num_bits)
+            self.num_bloom = max(self.num_bloom, other.num_bloom, round(estimate))
+            self.num_checked += other.num_checked
+
+    def insert_bloom(self, hashes):
+        """Insert hashes into the Bloom filter in chunks."""
+
+        hashes = sorted_unique(hashes)
+        for start in range(0, hashes.size, BLOOM_CHUNK):
+            self.add_bloom(hashes[start:start + BLOOM_CHUNK])
+
+    def compact(self):
+        """Merge pending arrays into the sorted unique hashes."""
+
+        if len(self.pending) == 0: return
+        self.hashes = sorted_unique(np.concatenate([self.hashes, *self.pending]))
+        self.pending = []
+        self.pending_bytes = 0
+
+    def add_bloom(self, hashes):
+        """Check unique hashes against the Bloom filter, count the ones it has
+        not seen and insert them all."""
+
+        # Double hashing of the low and high 32 bits into num_hashes positions
+        low = hashes & np.uint64(0xFFFFFFFF)
+        high = (hashes >> np.uint64(32)) | np.uint64(1)
+        positions = (low[:, None] + np.arange(self.num_hashes, dtype=np.uint64)[None, :] * high[:, None]) % np.uint64(self.num_bits)
+        indices = positions >> np.uint64(3)
+        masks = np.left_shift(np.uint8(1), (positions & np.uint64(7)).astype(np.uint8))
+
+        seen = ((self.bloom[indices] & masks) != 0).all(axis=1)
+        self.num_bloom += int(hashes.size - seen.sum())
+        self.num_checked += int(hashes.size)
+        np.bitwise_or.at(self.bloom, indices.ravel(), masks.ravel())
+
+    @property
+    def exact(self):
+        """True while the hashes are held exactly."""
+
+        return self.bloom is None
+
+    @property
+    def count(self):
+        """Number of distinct granule hashes added."""
+
+        with self.lock:
+            if self.exact:
+                self.compact()
+                return int(self.hashes.size)
+            return self.num_bloom
+
+    def false_positive_rate(self):
+        """Return probability the Bloom filter reports an unseen granule as
+        seen, or 0 while hashes are held exactly."""
+
+        if self.exact: return 0.0
+        return (1 - math.exp(-self.num_hashes * self.num_bloom / self.num_bits)) ** self.num_hashes
+
+class GranuleHashes:
+    """Hash the granule of each counted processing log line and add the
+    hashes to a counter in batches.
+
+    Parameters
+    ----------
+    counter: DistinctCounter
+        Counter of the dataset and processing type of the log.
+    batch_size: int
+        Number of hashes held before they are added to the counter.
+    """
+
+    def __init__(self, counter, batch_size=HASH_BATCH):
+        self.counter = counter
+        self.batch_size = batch_size
+        self.batch = array("Q")
+
+    def append(self, line):
+        """Hash the granule of a processing log line.
+
+        A line without a granule field is hashed whole so every counted line
+        is one granule event.
+        """
+
+        fields = line.split(",", 3)
+        self.batch.append(hash_granule(fields[2] if len(fields) > 2 else line))
+        if len(self.batch) >= self.batch_size: self.flush()
+
+    def flush(self):
+        """Add the hashes held to the counter."""
+
+        if len(self.batch) == 0: return
+        self.counter.add(np.frombuffer(self.batch, dtype=np.uint64))
+        self.batch = array("Q")
+
+class DistinctCounters:
+    """Distinct granule counters of each dataset and processing type.
+
+    Parameters
+    ----------
+    memory_budget: int
+        Number of bytes every counter may use together, split evenly
+        between NUM_COUNTERS counters.
+    """
+
+    def __init__(self, memory_budget=MEMORY_BUDGET):
+        self.memory_budget = memory_budget
+        self.counter_budget = memory_budget // NUM_COUNTERS
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def get(self, dataset, processing_type):
+        """Return counter of dataset and processing type, creating it if it
+        does not exist."""
+
+        with self.lock:
+            if (dataset, processing_type) not in self.counters:
+                self.counters[(dataset, processing_type)] = DistinctCounter(self.counter_budget)
+            return self.counters[(dataset, processing_type)]
+
+    def merge(self, other):
+        """Add the granules counted by other counters."""
+
+        for (dataset, processing_type), counter in other.counters.items():
+            self.get(dataset, processing_type).merge(counter)
+
+    def to_arrays(self):
+        """Return state of every counter as a dictionary of NumPy arrays
+        named <dataset>.<processing_type>.<column>."""
+
+        arrays = {}
+        for (dataset, processing_type), counter in list(self.counters.items()):
+            arrays.update({ f"{dataset}.{processing_type}.{name}": column for name, column in counter.to_arrays().items() })
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, memory_budget=MEMORY_BUDGET):
+        """Return counters of the state written by to_arrays."""
+
+        columns = {}
+        for name, column in arrays.items():
+            dataset, processing_type, column_name = name.split(".")
+            columns.setdefault((dataset, processing_type), {})[column_name] = column
+        counters = cls(memory_budget)
+        counters.counters = { key: DistinctCounter.from_arrays(counter_columns, counters.counter_budget)
+                              for key, counter_columns in columns.items() }
+        return counters
+
+    def save(self, path, **values):
+        """Atomically write the counters and scalar values to a NumPy archive."""
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = path.with_suffix(".tmp")
+        with open(temp_file, "wb") as fh:
+            np.savez(fh, **self.to_arrays(), **values)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(temp_file, path)
+
+    @classmethod
+    def load(cls, path, memory_budget=MEMORY_BUDGET):
+        """Return counters and scalar values read from a NumPy archive.
+
+        Returns None and no values if the archive does not exist or cannot be
+        read.
+        """
+
+        try:
+            with np.load(path) as npz:
+                arrays = { name: npz[name] for name in npz.files }
+        except (OSError, ValueError, zipfile.BadZipFile):
+            return None, {}
+        values = { name: column.item() for name, column in arrays.items() if "." not in name }
+        return cls.from_arrays({ name: column for name, column in arrays.items() if "." in name }, memory_budget), values
+
+def count_distinct(counter, num_events):
+    """Return distinct granule counts of a dataset and processing type.
+
+    Parameters
+    ----------
+    counter: DistinctCounter
+        Counter of the granule hashes of every report.
+    num_events: int
+        Number of processing log lines hashed for the reports.
+
+    Returns
+    -------
+    dict
+        Number of granule events, distinct granules and duplicate rate,
+        whether the count is exact and, for a Bloom filter estimate, its
+        false positive rate and the expected number of granules missed.
+    """
+
+    distinct = counter.count
+    false_positive_rate = counter.false_positive_rate()
+    return {
+        "events": num_events,
+        "distinct": distinct,
+        "duplicate_rate": max(num_events - distinct, 0) / num_events if num_events else 0.0,
+        "exact": counter.exact,
+        "false_positive_rate": false_positive_rate,
+        "undercount": math.ceil(false_positive_rate * counter.num_checked)
+    }
+
+def format_distinct(stats):
+    """Return distinct granule counts as lines of the report email."""
+
+    text = f"Granule events: {stats['events']}, distinct granules: {stats['distinct']}, duplicate rate: {stats['duplicate_rate']:.2%}\n"
+    if not stats["exact"]:
+        text += f"    distinct granules estimated with a Bloom filter (false positive rate: {stats['false_positive_rate']:.3%}, may be low by about {stats['undercount']})\n"
+    return text
@@ -0,0 +1,162 @@
+"""Single-pass discovery of processing files on the EFS.
+
+Scans the registry (scratch) and processing log directories once each with
+os.scandir and parses each filename into a dataset, processing type and
+unique id index. Only the first line of each processing log is read to
+determine whether it belongs to a quicklook or refined run.
+"""
+
+# Standard imports
+import os
+import pathlib
+import re
+
+# Local imports
+from metrics import recorder
+from report_engine import get_processing_log, get_registry
+
+# Constants
+PROCESSING_TYPES = ("quicklook", "refined")
+REGISTRY_PATTERN = re.compile(r"(?P<dataset>modis_a|modis_t|viirs).*(?P<processing_type>quicklook|refined).*\.dat$")
+LOG_PATTERN = re.compile(r"^ghrsst_(?P<dataset>modis_a|modis_t|viirs)_processing_log_archive_.*\.txt$")
+FIRST_LINE_LIMIT = 4096    # Maximum bytes read from each processing log
+
+def get_unique_id(filename):
+    """Return unique identifier from a processing filename."""
+
+    return filename.split('_')[-1].split('.')[0]
+
+def scan_directory(directory, pattern, stats):
+    """Scan directory once and return entries whose name matches pattern.
+
+    Returns
+    -------
+    list
+        List of (re.Match, os.DirEntry) tuples sorted by entry name.
+    """
+
+    matches = []
+    stats["scan_calls"] += 1
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                stats["entries"] += 1
+                if entry.name.startswith('.'): continue
+                match = pattern.search(entry.name)
+                if match: matches.append((match, entry))
+    except FileNotFoundError:
+        pass
+    return sorted(matches, key=lambda match_entry: match_entry[1].name)
+
+def read_first_line(path, stats):
+    """Return the first line of a processing log without reading the rest."""
+
+    with open(path, "rb") as fh:
+        first_line = fh.readline(FIRST_LINE_LIMIT)
+    stats["bytes_read"] += len(first_line)
+    return first_line.decode(errors="replace")
+
+def create_placeholders(paths):
+    """Create empty placeholder files for the list of paths."""
+
+    for path in paths:
+        os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o644))
+
+def locate_processing_files(data_dir, dataset_dict, logger):
+    """Locate quicklook and refined processing files for each dataset.
+
+    Modifies dataset_dict to set each key with list of unique ids. Placeholder
+    processing logs or registries are created when only one of the pair
+    exists so that every unique id has both files. The paths found while
+    scanning are returned so later phases do not need to stat them again.
+
+    Parameters
+    ----------
+    data_dir: pathlib.Path
+        Mounted Processor EFS directory.
+    dataset_dict: dict
+        dictionary of 'modis_a', 'modis_t' and 'viirs' keys with quicklook and
+        refined.
+    logger: Logger
+        Logger object to log status.
+
+    Returns
+    -------
+    int
+        Total number of reports to generate.
+    list
+        Processing log and registry of every unique id in dataset_dict.
+    """
+
+    stats = { "scan_calls": 0, "entries": 0, "bytes_read": 0 }
+    registry_dir = data_dir.joinpath("scratch")
+    log_dir = data_dir.joinpath("logs", "processing_logs")
+
+    # Registry files
+    total_reports = 0
+    registries = { dataset: { "quicklook": [], "refined": [] } for dataset in dataset_dict.keys() }
+    registry_paths = {}
+    for match, entry in scan_directory(registry_dir, REGISTRY_PATTERN, stats):
+        if match["dataset"] in registries:
+            unique_id = get_unique_id(entry.name)
+            registries[match["dataset"]][match["processing_type"]].append(unique_id)
+            registry_paths[(match["dataset"], match["processing_type"], unique_id)] = pathlib.Path(entry.path)
+    for dataset, ptype_dict in registries.items():
+        for processing_type in reversed(PROCESSING_TYPES):
+            unique_ids = ptype_dict[processing_type]
+            if len(unique_ids) != 0:
+                dataset_dict[dataset][processing_type] = unique_ids
+                total_reports += len(unique_ids)
+                logger.info(f"Found {len(unique_ids)} {processing_type} registry files for dataset: {dataset.upper()}.")
+
+    # Processing logs
+    logs = { dataset: {} for dataset in dataset_dict.keys() }
+    for match, entry in scan_directory(log_dir, LOG_PATTERN, stats):
+        if match["dataset"] in logs:
+            logs[match["dataset"]][get_unique_id(entry.name)] = entry.path
+
+    # Handle cases where there is an empty registry and no processing log
+    placeholders = []
+    for dataset, ptype_dict in dataset_dict.items():
+        for unique_ids in ptype_dict.values():
+            for unique_id in unique_ids:
+                if unique_id not in logs[dataset]:
+                    placeholders.append(get_processing_log(data_dir, dataset, unique_id))
+
+    # Handle cases where there is a processing log and no registry
+    for dataset, log_dict in logs.items():
+        qplog = 0
+        rplog = 0
+        for unique_id, processing_file in log_dict.items():
+            first_line = read_first_line(processing_file, stats)
+            if len(first_line) == 0: continue
+            processing_type = "quicklook" if "QUICKLOOK" in first_line else "refined"
+            if processing_type == "quicklook":
+                qplog += 1
+            else:
+                rplog += 1
+            if unique_id not in dataset_dict[dataset][processing_type]:
+                dataset_dict[dataset][processing_type].append(unique_id)
+                total_reports += 1
+                logger.info(f"Found {processing_type} processing log for dataset with no corresponding registry file: {processing_file}.")
+                placeholders.append(get_registry(data_dir, dataset, processing_type, unique_id))
+        logger.info(f"Found {rplog} refined processing logs for dataset: {dataset.upper()}.")
+        logger.info(f"Found {qplog} quicklook processing logs for dataset: {dataset.upper()}.")
+
+    create_placeholders(placeholders)
+
+    # Processing files of every unique id, each processing log listed once
+    file_list = []
+    listed_logs = set()
+    for dataset, ptype_dict in dataset_dict.items():
+        for processing_type, unique_ids in ptype_dict.items():
+            for unique_id in unique_ids:
+                if (dataset, unique_id) not in listed_logs:
+                    listed_logs.add((dataset, unique_id))
+                    file_list.append(pathlib.Path(logs[dataset][unique_id]) if unique_id in logs[dataset] else get_processing_log(data_dir, dataset, unique_id))
+                file_list.append(registry_paths.get((dataset, processing_type, unique_id)) or get_registry(data_dir, dataset, processing_type, unique_id))
+
+    recorder.add("discovery", files=stats["entries"], bytes_read=stats["bytes_read"], scan_calls=stats["scan_calls"])
+    logger.info(f"Discovery I/O - directory scans: {stats['scan_calls']}, entries scanned: {stats['entries']}, "
+                f"bytes read: {stats['bytes_read']}, placeholder files created: {len(placeholders)}.")
+    return total_reports, file_list
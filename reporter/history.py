@@ -0,0 +1,324 @@
+"""Indexed, lazy reader over archived daily zips for trend reports.
+
+Each daily run uploads `archive/reporter/<year>/<YYYYMMDD>_daily_report_files.zip`
+with the `daily_report_<YYYYMMDD>.txt` summary published that day. An index
+mapping each day to its archive and the name, byte offset, sizes and CRC of
+every member is built once from the central directories and persisted next
+to the archives so later runs only index new archives.
+
+Summaries are read with random access: the local header at the recorded
+offset is skipped and only the compressed bytes of the member are read and
+decompressed, which is a single ranged GET for archives in S3. Parsed day
+summaries are kept in an LRU cache so repeated trend queries skip
+decompression. The history of each bucket is kept at module level so warm
+invocations reuse its index and cache. Archives can be read from a local directory or from S3,
+including a local S3 stand-in.
+"""
+
+# Standard imports
+import datetime
+import functools
+import io
+import json
+import pathlib
+import re
+import threading
+import zipfile
+import zlib
+
+# Local imports
+from archive import LOCAL_HEADER, LOCAL_HEADER_SIGNATURE, READ_BUFFER_SIZE, S3RangeReader, get_decompressor
+
+# Constants
+ARCHIVE_PREFIX = "archive/reporter"
+ARCHIVE_PATTERN = re.compile(r"(\d{8})_daily_report_files\.zip$")
+SUMMARY_PATTERN = re.compile(r"daily_report_\d{8}\.txt$")
+INDEX_NAME = "history_index.json"
+INDEX_VERSION = 1
+DAY_CACHE_SIZE = 400
+PRODUCT_PATTERN = re.compile(r"^Product: list of (\w+) (\w+) L2P files processed")
+COUNT_PATTERN = re.compile(r"^Number of files processed from (logs|registry): (\d+)")
+LATENCY_PATTERN = re.compile(r"^Granule latency \(seconds\): p50: ([\d.]+), p95: ([\d.]+), p99: ([\d.]+), max: ([\d.]+)")
+PERIODS = ("week", "month")
+
+# Module state reused across warm invocations
+_histories = {}
+_lock = threading.Lock()
+
+class HistoryError(Exception):
+    """Raised when an archived member cannot be read."""
+
+class LocalArchiveStore:
+    """Archives and index stored under a local directory."""
+
+    def __init__(self, root):
+        self.root = pathlib.Path(root)
+
+    def list_archives(self):
+        """Yield key and size of every daily archive."""
+
+        for path in sorted(self.root.rglob("*_daily_report_files.zip")):
+            yield path.relative_to(self.root).as_posix(), path.stat().st_size
+
+    def open(self, key, size):
+        """Return seekable binary file object of archive."""
+
+        return open(self.root.joinpath(key), "rb")
+
+    def read_index(self):
+        """Return persisted index or None."""
+
+        try:
+            return json.loads(self.root.joinpath(INDEX_NAME).read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def write_index(self, index):
+        """Persist index."""
+
+        temp_file = self.root.joinpath(f"{INDEX_NAME}.tmp")
+        temp_file.write_text(json.dumps(index))
+        temp_file.replace(self.root.joinpath(INDEX_NAME))
+
+class S3ArchiveStore:
+    """Archives and index stored in an S3 bucket."""
+
+    def __init__(self, s3, bucket, prefix=ARCHIVE_PREFIX, extra_args=None):
+        self.s3 = s3
+        self.bucket = bucket
+        self.prefix = prefix
+        self.extra_args = extra_args or {}
+
+    def list_archives(self):
+        """Yield key and size of every daily archive."""
+
+        paginator = self.s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{self.prefix}/"):
+            for obj in page.get("Contents", []):
+                if ARCHIVE_PATTERN.search(obj["Key"]): yield obj["Key"], obj["Size"]
+
+    def open(self, key, size):
+        """Return seekable binary file object that reads with ranged GETs."""
+
+        return io.BufferedReader(S3RangeReader(self.s3, self.bucket, key, size), buffer_size=READ_BUFFER_SIZE)
+
+    def read_index(self):
+        """Return persisted index or None."""
+
+        import botocore.exceptions
+        try:
+            response = self.s3.get_object(Bucket=self.bucket, Key=f"{self.prefix}/{INDEX_NAME}")
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"): return None
+            raise
+        try:
+            return json.loads(response["Body"].read())
+        except ValueError:
+            return None
+
+    def write_index(self, index):
+        """Persist index."""
+
+        self.s3.put_object(Bucket=self.bucket, Key=f"{self.prefix}/{INDEX_NAME}",
+                           Body=json.dumps(index).encode(), **self.extra_args)
+
+def index_archive(fh):
+    """Return members of an archive read from its central directory."""
+
+    with zipfile.ZipFile(fh) as archive:
+        return {
+            info.filename: {
+                "offset": info.header_offset,
+                "compress_size": info.compress_size,
+                "file_size": info.file_size,
+                "compress_type": info.compress_type,
+                "crc": info.CRC
+            } for info in archive.infolist()
+        }
+
+def read_member(fh, member):
+    """Return decompressed bytes of an indexed member.
+
+    Parameters
+    ----------
+    fh: file object
+        Seekable binary file object of the archive.
+    member: dict
+        Offset, compressed size, compression type and CRC from the index.
+
+    Raises
+    ------
+    HistoryError
+        If there is no local header at the offset or the CRC does not match.
+    """
+
+    fh.seek(member["offset"])
+    header = fh.read(LOCAL_HEADER.size)
+    if len(header) != LOCAL_HEADER.size:
+        raise HistoryError(f"Truncated local header at offset {member['offset']}.")
+    fields = LOCAL_HEADER.unpack(header)
+    if fields[0] != LOCAL_HEADER_SIGNATURE:
+        raise HistoryError(f"No local header at offset {member['offset']}.")
+    fh.seek(fields[-2] + fields[-1], io.SEEK_CUR)    # File name and extra field
+    data = fh.read(member["compress_size"])
+    decompressor = get_decompressor(member["compress_type"])
+    if decompressor:
+        data = decompressor.decompress(data)
+        if hasattr(decompressor, "flush"): data += decompressor.flush()
+    if zlib.crc32(data) != member["crc"]:
+        raise HistoryError(f"CRC mismatch for member at offset {member['offset']}.")
+    return data
+
+def parse_day_summary(text):
+    """Return counts and latency for each dataset and processing type.
+
+    Only the Product, file count and latency lines of the daily report are
+    used; every other line is skipped.
+    """
+
+    summary = {}
+    current = None
+    for line in text.splitlines():
+        product = PRODUCT_PATTERN.match(line)
+        if product:
+            current = summary.setdefault(f"{product.group(2).lower()}/{product.group(1).lower()}", { "processed": 0, "registry": 0 })
+            continue
+        if current is None: continue
+        count = COUNT_PATTERN.match(line)
+        if count:
+            current["processed" if count.group(1) == "logs" else "registry"] = int(count.group(2))
+            continue
+        latency = LATENCY_PATTERN.match(line)
+        if latency:
+            current.update(zip(("p50", "p95", "p99", "max"), map(float, latency.groups())))
+    return summary
+
+class ArchiveHistory:
+    """Trend queries over the daily archives of a store.
+
+    Parameters
+    ----------
+    store: LocalArchiveStore or S3ArchiveStore
+        Store the archives and index are read from.
+    cache_size: int
+        Number of parsed day summaries kept in the LRU cache.
+    """
+
+    def __init__(self, store, cache_size=DAY_CACHE_SIZE):
+        self.store = store
+        self.index = store.read_index()
+        if not self.index or self.index.get("version") != INDEX_VERSION:
+            self.index = { "version": INDEX_VERSION, "archives": {} }
+        self.read_day = functools.lru_cache(maxsize=cache_size)(self._read_day)
+
+    def update_index(self):
+        """Index archives that are new or have changed and persist the index.
+
+        Returns
+        -------
+        int
+            Number of archives indexed.
+        """
+
+        archives = self.index["archives"]
+        num_indexed = 0
+        for key, size in self.store.list_archives():
+            day = datetime.datetime.strptime(ARCHIVE_PATTERN.search(key).group(1), "%Y%m%d").date().isoformat()
+            if day in archives and archives[day]["key"] == key and archives[day]["size"] == size: continue
+            with self.store.open(key, size) as fh:
+                archives[day] = { "key": key, "size": size, "members": index_archive(fh) }
+            num_indexed += 1
+        if num_indexed:
+            self.store.write_index(self.index)
+            self.read_day.cache_clear()
+        return num_indexed
+
+    def days(self, start_day, end_day):
+        """Return sorted ISO format days with an archive between two days."""
+
+        return sorted(day for day in self.index["archives"] if start_day.isoformat() <= day <= end_day.isoformat())
+
+    def _read_day(self, day):
+        """Return parsed summary of the daily report archived on day."""
+
+        entry = self.index["archives"][day]
+        names = [ name for name in entry["members"] if SUMMARY_PATTERN.search(name) ]
+        if len(names) == 0: return {}
+        with self.store.open(entry["key"], entry["size"]) as fh:
+            data = read_member(fh, entry["members"][names[0]])
+        return parse_day_summary(data.decode(errors="replace"))
+
+def get_history(name, store):
+    """Return shared history of the archives of store.
+
+    Parameters
+    ----------
+    name: str
+        Name of the bucket or directory the archives are stored in.
+    store: LocalArchiveStore or S3ArchiveStore
+        Store of the archives, only used the first time name is requested.
+    """
+
+    with _lock:
+        if name not in _histories: _histories[name] = ArchiveHistory(store)
+        return _histories[name]
+
+def get_period(day, period):
+    """Return label of the ISO week or month day belongs to."""
+
+    if period == "week":
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    return f"{day.year}-{day.month:02d}"
+
+def get_period_range(today, period, num_periods):
+    """Return first and last day of the complete periods before today."""
+
+    if period == "week":
+        end = today - datetime.timedelta(days=today.weekday())
+        start = end - datetime.timedelta(weeks=num_periods)
+    else:
+        end = today.replace(day=1)
+        months = end.year * 12 + end.month - 1 - num_periods
+        start = datetime.date(months // 12, months % 12 + 1, 1)
+    return start, end - datetime.timedelta(days=1)
+
+def build_trend(history, start_day, end_day, period):
+    """Aggregate day summaries into weekly or monthly trends.
+
+    Returns
+    -------
+    dict
+        For each period label, the number of days archived and, for each
+        dataset and processing type, the granules processed from logs and
+        registries, the mean granules per archived day and the worst daily
+        p95 latency.
+    """
+
+    trend = {}
+    for day in history.days(start_day, end_day):
+        label = get_period(datetime.date.fromisoformat(day), period)
+        row = trend.setdefault(label, { "days": 0, "datasets": {} })
+        row["days"] += 1
+        for key, summary in history.read_day(day).items():
+            totals = row["datasets"].setdefault(key, { "processed": 0, "registry": 0, "p95": None })
+            totals["processed"] += summary["processed"]
+            totals["registry"] += summary["registry"]
+            if "p95" in summary: totals["p95"] = max(totals["p95"] or 0.0, summary["p95"])
+    for row in trend.values():
+        for totals in row["datasets"].values():
+            totals["per_day"] = totals["processed"] / row["days"]
+    return trend
+
+def format_trend(trend, period):
+    """Return trend as text of the report email."""
+
+    text = ""
+    for label, row in sorted(trend.items()):
+        text += "==========================================================================================\n"
+        text += f"{period.capitalize()}: {label}, days archived: {row['days']}\n"
+        text += f"{'Dataset':<20}{'From logs':>12}{'From registry':>16}{'Per day':>10}{'Worst p95':>12}\n"
+        for key, totals in sorted(row["datasets"].items()):
+            p95 = "-" if totals["p95"] is None else f"{totals['p95']:.2f}"
+            text += f"{key.upper():<20}{totals['processed']:>12}{totals['registry']:>16}{totals['per_day']:>10.1f}{p95:>12}\n"
+    return text
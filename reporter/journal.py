@@ -0,0 +1,264 @@
+"""Write-ahead journal of the phases of a daily run on the EFS.
+
+Each phase of a daily run is recorded as started before it runs and as
+completed with its outputs once it has finished, so a retried invocation
+after a timeout or an error can skip the phases that completed:
+
+    discovery       unique ids and processing files found
+    reports         report of every unique id, appended to reports.jsonl as
+                    each one finishes so a retry only generates the rest,
+                    and snapshots of the distinct granule counters
+    reconciliation  reconciliation file and results
+    publish         SNS message id and report file
+    archiving       S3 key and size of the verified archive
+    sidecar         Parquet partitions written
+    deletion        processing files deleted and already missing
+
+Distinct granule counters are written to distinct.npz every SNAPSHOT_SECONDS
+while reports are generated and once they are all generated. A retry only
+uses the reports recorded before the last snapshot and generates the others
+again, which adds their granules to the counters a second time without
+changing the count.
+
+The journal is written atomically to `checkpoints/journal/daily.json` and
+removed once the run completes. A journal left by an earlier day is
+discarded so reports only resume on the day they were started. The merge of
+a sharded run keeps its journal in the run directory instead, where it is
+resumed by a retry of the merge of that run on any day.
+"""
+
+# Standard imports
+import datetime
+import json
+import os
+import pathlib
+import time
+
+# Local imports
+from dedup import DistinctCounters
+from shards import decode_report, encode_report
+
+# Constants
+JOURNAL_DIR = pathlib.Path("checkpoints", "journal")
+JOURNAL_NAME = "daily.json"
+REPORTS_NAME = "reports.jsonl"
+COUNTERS_NAME = "distinct.npz"
+SNAPSHOT_SECONDS = 60
+JOURNAL_VERSION = 1
+
+class PhaseJournal:
+    """Phases completed by a daily run and their outputs.
+
+    Parameters
+    ----------
+    directory: pathlib.Path
+        Directory the journal and the reports of the run are written to, or
+        None to keep the journal in memory only.
+    report_day: str
+        ISO format local day the run reports on.
+    date: datetime.datetime
+        UTC date the run was started at.
+    phases: dict
+        Phases recorded by a previous invocation of the run.
+
+    Attributes
+    ----------
+    counters: DistinctCounters
+        Distinct granule counters snapshotted while reports are recorded.
+    """
+
+    def __init__(self, directory, report_day, date, phases=None):
+        self.directory = pathlib.Path(directory) if directory else None
+        self.report_day = report_day
+        self.date = date
+        self.phases = phases or {}
+        self.counters = None
+        self.num_lines = 0
+        self.snapshot_time = time.monotonic()
+
+    @classmethod
+    def open(cls, data_dir, logger, restart=False):
+        """Return journal of the unfinished run of today or of a new run.
+
+        Parameters
+        ----------
+        data_dir: pathlib.Path
+            Mounted Processor EFS directory.
+        logger: Logger
+            Logger object to log status.
+        restart: bool
+            Discard any unfinished run and start a new one.
+        """
+
+        directory = pathlib.Path(data_dir).joinpath(JOURNAL_DIR)
+        report_day = datetime.datetime.now().date().isoformat()
+        data = read_journal(directory)
+        if data and data["report_day"] == report_day and not restart:
+            journal = cls(directory, report_day, datetime.datetime.fromisoformat(data["date"]), data["phases"])
+            journal.log_resume(logger)
+            return journal
+
+        if data:
+            logger.info(f"Discarding journal of unfinished daily run started at {data.get('date')}.")
+        return cls.create(directory, report_day)
+
+    @classmethod
+    def open_run(cls, directory, logger):
+        """Return journal of a sharded run kept in its run directory or None
+        if the merge of the run has not started one.
+
+        The journal belongs to the run whatever day it is resumed on so it
+        keeps the report day of the run.
+        """
+
+        data = read_journal(directory)
+        if not data: return None
+        journal = cls(directory, data["report_day"], datetime.datetime.fromisoformat(data["date"]), data["phases"])
+        journal.log_resume(logger)
+        return journal
+
+    @classmethod
+    def create(cls, directory, report_day):
+        """Return journal of a new run in directory, removing the reports of
+        any previous run."""
+
+        journal = cls(directory, report_day, datetime.datetime.now(datetime.timezone.utc))
+        journal.directory.joinpath(REPORTS_NAME).unlink(missing_ok=True)
+        journal.directory.joinpath(COUNTERS_NAME).unlink(missing_ok=True)
+        journal.write()
+        return journal
+
+    def log_resume(self, logger):
+        """Log the phases a resumed run completed."""
+
+        completed = [ phase for phase, entry in self.phases.items() if "completed" in entry ]
+        logger.info(f"Resuming run started at {self.date.isoformat()} from journal, completed phases: {', '.join(completed) or 'none'}.")
+
+    def write(self):
+        """Atomically write the journal."""
+
+        if self.directory is None: return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        journal_file = self.directory.joinpath(JOURNAL_NAME)
+        temp_file = journal_file.with_suffix(".tmp")
+        with open(temp_file, "w") as fh:
+            json.dump({ "version": JOURNAL_VERSION, "report_day": self.report_day,
+                        "date": self.date.isoformat(), "phases": self.phases }, fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(temp_file, journal_file)
+
+    def completed(self, phase):
+        """Return outputs of phase if it completed, otherwise None."""
+
+        entry = self.phases.get(phase, {})
+        return entry.get("outputs", {}) if "completed" in entry else None
+
+    def started(self, phase):
+        """Return True if phase was started, whether or not it completed."""
+
+        return phase in self.phases
+
+    def begin(self, phase):
+        """Record that phase has started before it has any side effects."""
+
+        self.phases[phase] = { "started": datetime.datetime.now(datetime.timezone.utc).isoformat() }
+        self.write()
+
+    def complete(self, phase, outputs=None):
+        """Record that phase has completed with its outputs."""
+
+        entry = self.phases.setdefault(phase, {})
+        entry["completed"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        entry["outputs"] = outputs or {}
+        self.write()
+
+    def record_report(self, dataset, processing_type, file_id, report):
+        """Append the report of a unique id so it is not generated again and
+        snapshot the counters if SNAPSHOT_SECONDS have passed since the
+        last snapshot."""
+
+        if self.directory is None: return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        line = json.dumps({ "dataset": dataset, "processing_type": processing_type, "unique_id": file_id,
+                            "report": encode_report(report) if report is not None else None })
+        with open(self.directory.joinpath(REPORTS_NAME), "a") as fh:
+            fh.write(f"{line}\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+        self.num_lines += 1
+        if time.monotonic() - self.snapshot_time >= SNAPSHOT_SECONDS: self.save_counters()
+
+    def save_counters(self):
+        """Write the counters with the number of report lines they cover.
+
+        Hashes of every recorded report were added to the counters before it
+        was recorded, so the snapshot covers every line written so far.
+        """
+
+        self.snapshot_time = time.monotonic()
+        if self.directory is None or self.counters is None: return
+        self.counters.save(self.directory.joinpath(COUNTERS_NAME), num_reports=self.num_lines)
+
+    def load_counters(self):
+        """Return counters of the last snapshot and the number of report
+        lines they cover, or None and no lines if there is no snapshot."""
+
+        if self.directory is None: return None, 0
+        counters, values = DistinctCounters.load(self.directory.joinpath(COUNTERS_NAME))
+        return counters, values.get("num_reports", 0)
+
+    def load_reports(self, num_reports=None):
+        """Return reports recorded so far keyed by dataset, processing type
+        and unique id.
+
+        A line cut short by a crash while it was written is ignored.
+
+        Parameters
+        ----------
+        num_reports: int
+            Only return reports of the first lines covered by a counter 
+            snapshot, None for every line.
+        """
+
+        reports = {}
+        self.num_lines = 0
+        if self.directory is None: return reports
+        try:
+            with open(self.directory.joinpath(REPORTS_NAME)) as fh:
+                for line in fh:
+                    if not line.endswith("\n"): continue
+                    self.num_lines += 1
+                    if num_reports is not None and self.num_lines > num_reports: continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    report = decode_report(entry["report"]) if entry["report"] is not None else None
+                    reports[(entry["dataset"], entry["processing_type"], entry["unique_id"])] = report
+        except FileNotFoundError:
+            pass
+        return reports
+
+    def remove(self):
+        """Remove the journal, the reports of the completed run and the
+        journal directory."""
+
+        if self.directory is None: return
+        self.directory.joinpath(REPORTS_NAME).unlink(missing_ok=True)
+        self.directory.joinpath(COUNTERS_NAME).unlink(missing_ok=True)
+        self.directory.joinpath(JOURNAL_NAME).unlink(missing_ok=True)
+        try:
+            self.directory.rmdir()
+        except OSError:
+            pass    # Left if another file was written to it
+
+def read_journal(directory):
+    """Return journal data written to directory or None if there is none or
+    it was written by another version."""
+
+    try:
+        data = json.loads(pathlib.Path(directory).joinpath(JOURNAL_NAME).read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+    return data if data.get("version") == JOURNAL_VERSION else None
@@ -0,0 +1,142 @@
+"""Granule latency statistics from processing log SUCCESS_OVERALL_TOTAL_TIME.
+
+Processing log lines have the format:
+
+    epoch,ascii date,granule,SUCCESS_OVERALL_TOTAL_TIME: num_seconds
+
+Matching lines are parsed into columns while the report engine reads each
+processing log so no extra pass is needed. Columns hold the epoch and the
+processing seconds of each line. Granule names are only kept for the
+slowest MAX_OUTLIERS lines of each log, which always include the slowest
+outliers of the dataset, so statistics never read a log again.
+Statistics are computed with vectorized NumPy operations over the columns of
+every unique id of a dataset and processing type.
+"""
+
+# Standard imports
+from array import array
+import heapq
+
+# Third-party imports
+import numpy as np
+
+# Constants
+PERCENTILES = (25, 50, 75, 95, 99)
+OUTLIER_IQR_FACTOR = 3.0    # Tukey far-out fence above the upper quartile
+MAX_OUTLIERS = 10
+SECONDS_PER_HOUR = 3600
+
+class LatencyColumns:
+    """Columns of epoch and processing seconds for a log and the granule
+    names of its slowest lines."""
+
+    def __init__(self, max_slowest=MAX_OUTLIERS):
+        self.epochs = array("q")
+        self.seconds = array("d")
+        self.slowest = []    # Min-heap of seconds and granule of the slowest lines
+        self.max_slowest = max_slowest
+
+    def append(self, line):
+        """Parse a processing log line into the columns.
+
+        Lines that do not follow the processing log format are skipped.
+        """
+
+        try:
+            epoch = int(line[:line.index(",")])
+            seconds = float(line[line.rindex(":") + 1:])
+        except ValueError:
+            return
+        self.epochs.append(epoch)
+        self.seconds.append(seconds)
+        if len(self.slowest) < self.max_slowest or seconds > self.slowest[0][0]:
+            fields = line.split(",", 3)
+            entry = (seconds, fields[2] if len(fields) > 2 else "")
+            if len(self.slowest) < self.max_slowest:
+                heapq.heappush(self.slowest, entry)
+            else:
+                heapq.heapreplace(self.slowest, entry)
+
+    def to_arrays(self, prior=None):
+        """Return dictionary of NumPy arrays prefixed by prior arrays.
+
+        The slowest lines of prior arrays and of this log are merged and only
+        the slowest max_slowest are kept.
+        """
+
+        columns = {
+            "epochs": np.frombuffer(self.epochs, dtype=np.int64),
+            "seconds": np.frombuffer(self.seconds, dtype=np.float64)
+        }
+        slow_seconds = np.array([ seconds for seconds, _ in self.slowest ], dtype=np.float64)
+        slow_granules = np.array([ granule for _, granule in self.slowest ], dtype=str)
+        if prior:
+            columns = { name: np.concatenate((prior[name], column)) for name, column in columns.items() }
+            slow_seconds = np.concatenate((prior["slow_seconds"], slow_seconds))
+            slow_granules = np.concatenate((prior["slow_granules"], slow_granules))
+        keep = np.argsort(slow_seconds, kind="stable")[::-1][:self.max_slowest]
+        columns["slow_seconds"] = slow_seconds[keep]
+        columns["slow_granules"] = slow_granules[keep]
+        return columns
+
+def compute_latency_stats(reports, max_outliers=MAX_OUTLIERS):
+    """Compute latency and throughput statistics for a dataset.
+
+    Parameters
+    ----------
+    reports: list
+        List of report dictionaries with latency columns.
+    max_outliers: int
+        Maximum number of slow granules to return.
+
+    Returns
+    -------
+    dict
+        Number of granules, latency percentiles, maximum latency, mean and
+        peak throughput per hour, outlier threshold, number of outliers and
+        the slowest outlier granules; None if no columns were recorded.
+        Outlier granules are chosen from the slowest lines recorded for each
+        report so max_outliers should be at most the number recorded.
+    """
+
+    reports = [ report for report in reports if report.get("latency") and len(report["latency"]["seconds"]) ]
+    if len(reports) == 0: return None
+
+    epochs = np.concatenate([ report["latency"]["epochs"] for report in reports ])
+    seconds = np.concatenate([ report["latency"]["seconds"] for report in reports ])
+    slow_seconds = np.concatenate([ report["latency"].get("slow_seconds", np.empty(0)) for report in reports ])
+    slow_granules = np.concatenate([ report["latency"].get("slow_granules", np.empty(0, dtype=str)) for report in reports ])
+
+    # Latency percentiles and outliers
+    q1, p50, q3, p95, p99 = np.percentile(seconds, PERCENTILES)
+    threshold = q3 + OUTLIER_IQR_FACTOR * (q3 - q1)
+    num_outliers = np.count_nonzero(seconds > threshold)
+    candidates = np.flatnonzero(slow_seconds > threshold)
+    slowest = candidates[np.argsort(slow_seconds[candidates], kind="stable")[::-1][:max_outliers]]
+
+    # Throughput over each hour from the first to the last granule
+    hours = epochs // SECONDS_PER_HOUR
+    per_hour = np.bincount(hours - hours.min())
+
+    return {
+        "count": int(seconds.size),
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+        "max": float(seconds.max()),
+        "throughput_per_hour": float(seconds.size / per_hour.size),
+        "peak_per_hour": int(per_hour.max()),
+        "outlier_threshold": float(threshold),
+        "num_outliers": int(num_outliers),
+        "outliers": [ (str(slow_granules[index]), float(slow_seconds[index])) for index in slowest ]
+    }
+
+def format_latency_stats(stats):
+    """Return latency statistics as lines of the report email."""
+
+    text = f"Granule latency (seconds): p50: {stats['p50']:.2f}, p95: {stats['p95']:.2f}, p99: {stats['p99']:.2f}, max: {stats['max']:.2f}\n"
+    text += f"Throughput (granules per hour): mean: {stats['throughput_per_hour']:.1f}, peak: {stats['peak_per_hour']}\n"
+    text += f"Slow granules (> {stats['outlier_threshold']:.2f} seconds): {stats['num_outliers']}\n"
+    for granule, seconds in stats["outliers"]:
+        text += f"    {granule}: {seconds:.2f}\n"
+    return text
@@ -0,0 +1,128 @@
+"""Per-phase timing and I/O metrics emitted as CloudWatch Embedded Metric Format.
+
+Records wall time, file counts, bytes read and written and subprocess counts
+for every phase of a run and for every dataset and processing type pair.
+Metrics are printed as EMF JSON log lines so CloudWatch extracts them without
+any extra API calls. A cProfile dump of the run can be produced for
+debugging; cProfile only sees the thread that enabled it, so a profiled run
+does all of its work on that thread.
+"""
+
+# Standard imports
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+
+# Constants
+NAMESPACE = os.getenv("METRICS_NAMESPACE", "GenerateReporter")
+METRICS = {
+    "duration": ("Duration", "Seconds"),
+    "files": ("Files", "Count"),
+    "bytes_read": ("BytesRead", "Bytes"),
+    "bytes_written": ("BytesWritten", "Bytes"),
+    "subprocesses": ("Subprocesses", "Count"),
+    "scan_calls": ("ScanCalls", "Count")
+}
+PROFILE_FILE = "/tmp/reporter.prof"
+PROFILE_LINES = 25
+
+class MetricsRecorder:
+    """Thread-safe accumulator of metrics keyed by phase, dataset and type.
+
+    Durations recorded for a dataset and processing type are summed across
+    worker threads so they measure time spent rather than wall time; the wall
+    time of each phase is recorded without a dataset.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def reset(self):
+        """Remove metrics recorded by a previous invocation."""
+
+        with self.lock:
+            self.entries = {}
+
+    def add(self, phase, dataset=None, processing_type=None, **values):
+        """Add values to the metrics recorded for phase."""
+
+        key = (phase, dataset, processing_type)
+        with self.lock:
+            entry = self.entries.setdefault(key, {})
+            for name, value in values.items():
+                entry[name] = entry.get(name, 0) + value
+
+    @contextlib.contextmanager
+    def phase(self, phase, dataset=None, processing_type=None):
+        """Record the wall time spent in the block."""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, dataset, processing_type, duration=time.perf_counter() - start)
+
+    def emit(self, mode=None, stream=None):
+        """Print one EMF log line per phase and dataset and type pair."""
+
+        stream = stream or sys.stdout
+        timestamp = int(time.time() * 1000)
+        with self.lock:
+            entries = list(self.entries.items())
+        for (phase, dataset, processing_type), values in entries:
+            dimensions = ["Phase"]
+            record = { "Phase": phase }
+            if dataset:
+                dimensions += ["Dataset", "ProcessingType"]
+                record.update({ "Dataset": dataset, "ProcessingType": processing_type })
+            if mode: record["Mode"] = mode
+            metrics = []
+            for name, value in values.items():
+                metric_name, unit = METRICS[name]
+                metrics.append({ "Name": metric_name, "Unit": unit })
+                record[metric_name] = round(value, 6) if isinstance(value, float) else value
+            record["_aws"] = {
+                "Timestamp": timestamp,
+                "CloudWatchMetrics": [{ "Namespace": NAMESPACE, "Dimensions": [dimensions], "Metrics": metrics }]
+            }
+            stream.write(json.dumps(record) + "\n")
+        stream.flush()
+
+# Shared recorder for the invocation
+recorder = MetricsRecorder()
+
+# Set while the invocation is profiled so work is not handed to other threads
+profiling = threading.Event()
+
+@contextlib.contextmanager
+def profile_run(enabled, logger, profile_file=PROFILE_FILE):
+    """Profile the block with cProfile and dump the stats when enabled.
+
+    Only the calling thread is profiled so profiling is set for the block
+    and callers run one worker on it rather than a pool of threads.
+    """
+
+    if not enabled:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiling.set()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiling.clear()
+        profiler.dump_stats(profile_file)
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(PROFILE_LINES)
+        logger.info(f"cProfile stats written to: {profile_file}.")
+        for line in summary.getvalue().splitlines():
+            if line.strip(): logger.info(line)
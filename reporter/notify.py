@@ -9,12 +9,12 @@ Pusblishes error message to SNS Topic.
 import os
 import sys
 
-# Third-party imports
-import boto3
-import botocore
+# Local imports
+from clients import TopicNotFoundError, get_client, resolve_topic_arn
 
 # Constants
 TOPIC_STRING = "batch-job-failure"
+TOPIC_ARN_ENV = "FAILURE_TOPIC_ARN"    # Overrides topic lookup when set
 
 def notify(logger, sigevent_type, sigevent_description, sigevent_data=""):
     """Handles error events."""
@@ -24,18 +24,21 @@ def notify(logger, sigevent_type, sigevent_description, sigevent_data=""):
 def publish_event(sigevent_type, sigevent_description, sigevent_data, logger):
     """Publish event to SNS Topic."""
     
-    sns = boto3.client("sns")
+    import botocore.exceptions
+    
+    sns = get_client("sns")
     
     # Get topic ARN
     try:
-        topics = sns.list_topics()
+        topic_arn = resolve_topic_arn(TOPIC_STRING, TOPIC_ARN_ENV)
     except botocore.exceptions.ClientError as e:
         logger.info("Failed to list SNS Topics.")
         logger.error(f"Error - {e}")
         sys.exit(1)
-    for topic in topics["Topics"]:
-        if TOPIC_STRING in topic["TopicArn"]:
-            topic_arn = topic["TopicArn"]
+    except TopicNotFoundError as e:
+        logger.info(f"Failed to locate SNS Topic: {TOPIC_STRING}.")
+        logger.error(f"Error - {e}")
+        sys.exit(1)
             
     # Publish to topic
     subject = f"Generate Reporter Lambda Failure"
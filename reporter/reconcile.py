@@ -0,0 +1,293 @@
+"""Granule-level reconciliation of processing logs against registries.
+
+Joins the granule names of the processing log lines counted for a report
+against the registry lines counted for the same unique id and lists the
+granules that only appear on one side. Names are normalized so that the
+`.nc` granules of the processing logs match the `.nc.bz2` granules of the
+registries.
+
+Each side is reduced to a sorted stream of unique names and the two streams
+are merge-joined. Names are collected in a hashed set; above a size threshold
+the set is written out as a sorted run and the runs are merged back with
+heapq so memory stays bounded on large backlogs.
+
+The names are collected while the reports count the lines, by a
+GranuleCollector for each processing log and registry, and their runs are
+kept on the EFS under the report day with the checkpoints. Intraday runs
+and retries that resume counting add runs for the lines they read, so the
+files are not read again to reconcile them. Reports of the Perl engine do
+not collect names and their files are read when they are reconciled.
+"""
+
+# Standard imports
+import heapq
+import os
+import tempfile
+
+# Local imports
+from report_engine import get_processing_log, get_registry, match_processing_log, match_registry
+
+# Constants
+RUN_SUFFIX = ".run"
+MAX_SET_SIZE = int(os.getenv("RECONCILE_MAX_SET_SIZE", 1000000))    # Names held in memory per side
+SUFFIXES = (".bz2", ".nc")
+LOG_FIELD = 2
+REGISTRY_FIELD = 0
+ONLY_LOG = "only_log"
+ONLY_REGISTRY = "only_registry"
+
+def normalize_granule(name):
+    """Return granule name without the .nc and .nc.bz2 suffixes."""
+
+    name = name.strip()
+    for suffix in SUFFIXES:
+        if name.endswith(suffix): name = name[:-len(suffix)]
+    return name
+
+def read_granules(path, match, field):
+    """Yield normalized granule names of the lines in path that match.
+
+    A missing file yields no granules.
+    """
+
+    try:
+        with open(path, "rb") as fh:
+            for raw_line in fh:
+                line = raw_line.decode(errors="replace")
+                if match(line):
+                    fields = line.split(",")
+                    if len(fields) > field: yield normalize_granule(fields[field])
+    except FileNotFoundError:
+        return
+
+def write_run(names, temp_dir):
+    """Write sorted names to a run file and return its path.
+
+    The run is renamed into place once written so a run stopped part way
+    is never read.
+    """
+
+    fd, temp_path = tempfile.mkstemp(dir=temp_dir, suffix=".tmp")
+    with os.fdopen(fd, "w") as fh:
+        for name in sorted(names):
+            fh.write(f"{name}\n")
+    path = temp_path[:-len(".tmp")] + RUN_SUFFIX
+    os.replace(temp_path, path)
+    return path
+
+def read_run(path):
+    """Yield names from a run file."""
+
+    with open(path) as fh:
+        for line in fh:
+            yield line[:-1]
+
+def sorted_unique(names, temp_dir, max_set_size=MAX_SET_SIZE):
+    """Yield names in sorted order without duplicates.
+
+    Names are held in a set until it reaches max_set_size, after which the
+    set is spilled to a sorted run and the runs are merged.
+    """
+
+    chunk = set()
+    runs = []
+    for name in names:
+        chunk.add(name)
+        if len(chunk) >= max_set_size:
+            runs.append(write_run(chunk, temp_dir))
+            chunk = set()
+    if len(runs) == 0:
+        yield from sorted(chunk)
+        return
+
+    if chunk: runs.append(write_run(chunk, temp_dir))
+    yield from merge_runs(runs)
+
+def merge_runs(runs):
+    """Yield names of sorted runs in sorted order without duplicates."""
+
+    previous = None
+    for name in heapq.merge(*[ read_run(run) for run in runs ]):
+        if name != previous: yield name
+        previous = name
+
+class GranuleCollector:
+    """Collect the normalized granule names of the lines counted from a
+    processing log or registry into sorted runs.
+
+    Parameters
+    ----------
+    run_dir: pathlib.Path
+        Directory the runs of the file are written to.
+    field: int
+        Index of the comma separated granule field.
+    max_set_size: int
+        Number of names held in memory before a run is written.
+    """
+
+    def __init__(self, run_dir, field, max_set_size=MAX_SET_SIZE):
+        self.run_dir = run_dir
+        self.field = field
+        self.max_set_size = max_set_size
+        self.names = set()
+        self.runs = set()
+
+    def append(self, line):
+        """Add the granule name of a counted line."""
+
+        fields = line.split(",", self.field + 1)
+        if len(fields) > self.field: self.names.add(normalize_granule(fields[self.field]))
+        if len(self.names) >= self.max_set_size: self.flush()
+
+    def flush(self):
+        """Write the names held to a run."""
+
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+        if self.names: self.runs.add(os.path.basename(write_run(self.names, self.run_dir)))
+        self.names = set()
+
+    def finish(self, resumed):
+        """Write the names held to a run once the file is counted.
+
+        Runs written by earlier runs are removed unless counting resumed 
+        from the lines they were written for.
+        """
+
+        self.flush()
+        if resumed: return
+        for run in self.run_dir.glob(f"*{RUN_SUFFIX}"):
+            if run.name not in self.runs: run.unlink(missing_ok=True)
+
+class GranuleRuns:
+    """Runs of the granule names counted for the reports of a day.
+
+    Parameters
+    ----------
+    directory: pathlib.Path
+        Directory of the report day the runs of each report are written 
+        under.
+    max_set_size: int
+        Number of names each collector holds in memory before writing a 
+        run.
+    """
+
+    def __init__(self, directory, max_set_size=MAX_SET_SIZE):
+        self.directory = directory
+        self.max_set_size = max_set_size
+
+    def get_run_dir(self, dataset, processing_type, unique_id, side):
+        """Return directory of the runs of the processing log or registry."""
+
+        return self.directory.joinpath(dataset, processing_type, unique_id, side)
+
+    def collectors(self, dataset, processing_type, unique_id):
+        """Return collectors of the processing log and registry names."""
+
+        return (GranuleCollector(self.get_run_dir(dataset, processing_type, unique_id, "log"), LOG_FIELD, self.max_set_size),
+                GranuleCollector(self.get_run_dir(dataset, processing_type, unique_id, "registry"), REGISTRY_FIELD, self.max_set_size))
+
+    def read(self, dataset, processing_type, unique_id, side):
+        """Return sorted stream of unique names of the processing log or 
+        registry or None if its names were not collected."""
+
+        run_dir = self.get_run_dir(dataset, processing_type, unique_id, side)
+        if not run_dir.is_dir(): return None
+        return merge_runs(sorted(run_dir.glob(f"*{RUN_SUFFIX}")))
+
+def merge_join(log_names, registry_names):
+    """Yield (side, granule) for names in only one of two sorted streams."""
+
+    log_name = next(log_names, None)
+    registry_name = next(registry_names, None)
+    while log_name is not None or registry_name is not None:
+        if registry_name is None or (log_name is not None and log_name < registry_name):
+            yield ONLY_LOG, log_name
+            log_name = next(log_names, None)
+        elif log_name is None or registry_name < log_name:
+            yield ONLY_REGISTRY, registry_name
+            registry_name = next(registry_names, None)
+        else:
+            log_name = next(log_names, None)
+            registry_name = next(registry_names, None)
+
+def reconcile_unique_id(data_dir, dataset, processing_type, unique_id, date_token, year_token,
+                        runs=None, max_set_size=MAX_SET_SIZE):
+    """Yield (side, granule) for granules in only the log or the registry.
+
+    Parameters
+    ----------
+    data_dir: pathlib.Path
+        Mounted Processor EFS directory.
+    dataset: str
+        "modis_a", "modis_t", "viirs"
+    processing_type: str
+        "quicklook" or "refined"
+    unique_id: str
+        Unique identifier of Generate execution.
+    date_token: str
+        Date search token like "Jan 28" or "Feb  2".
+    year_token: str
+        Year search token.
+    runs: GranuleRuns
+        Runs of the names collected while the reports were counted, read
+        instead of the files they were collected from.
+    max_set_size: int
+        Number of names held in memory per side before spilling to disk.
+    """
+
+    instrument = dataset.upper()
+    log_names = runs.read(dataset, processing_type, unique_id, "log") if runs else None
+    registry_names = runs.read(dataset, processing_type, unique_id, "registry") if runs else None
+    with tempfile.TemporaryDirectory(prefix="reconcile_") as temp_dir:
+        if log_names is None:
+            log_names = sorted_unique(read_granules(get_processing_log(data_dir, dataset, unique_id),
+                                                    match_processing_log(date_token, year_token, instrument, processing_type.upper()),
+                                                    LOG_FIELD), temp_dir, max_set_size)
+        if registry_names is None:
+            registry_names = sorted_unique(read_granules(get_registry(data_dir, dataset, processing_type, unique_id),
+                                                         match_registry(date_token, year_token, instrument), REGISTRY_FIELD),
+                                           temp_dir, max_set_size)
+        yield from merge_join(log_names, registry_names)
+
+def reconcile_dataset(data_dir, dataset, processing_type, unique_ids, date_token, year_token,
+                      writer, top=10, runs=None, max_set_size=MAX_SET_SIZE):
+    """Reconcile every unique id of a dataset and processing type.
+
+    Discrepancies are written to writer as
+    `dataset,processing_type,unique_id,side,granule` lines.
+
+    Returns
+    -------
+    dict
+        Number of granules only in the processing logs, number only in the
+        registries and the first top discrepancies as (unique id, side,
+        granule) tuples.
+    """
+
+    result = { ONLY_LOG: 0, ONLY_REGISTRY: 0, "top": [] }
+    for unique_id in unique_ids:
+        for side, granule in reconcile_unique_id(data_dir, dataset, processing_type, unique_id,
+                                                 date_token, year_token, runs, max_set_size):
+            result[side] += 1
+            if len(result["top"]) < top: result["top"].append((unique_id, side, granule))
+            writer.write(f"{dataset},{processing_type},{unique_id},{side},{granule}\n")
+    return result
+
+def format_reconciliation(result):
+    """Return reconciliation result as lines of the report email."""
+
+    text = f"Granules only in processing logs: {result[ONLY_LOG]}, only in registry: {result[ONLY_REGISTRY]}\n"
+    for unique_id, side, granule in result["top"]:
+        location = "processing log" if side == ONLY_LOG else "registry"
+        text += f"    only in {location}: {granule} (unique id: {unique_id})\n"
+    return text
+
+def merge_results(results, top=10):
+    """Return sum of reconciliation results with the first top discrepancies."""
+
+    merged = { ONLY_LOG: 0, ONLY_REGISTRY: 0, "top": [] }
+    for result in results:
+        merged[ONLY_LOG] += result[ONLY_LOG]
+        merged[ONLY_REGISTRY] += result[ONLY_REGISTRY]
+        merged["top"].extend(tuple(discrepancy) for discrepancy in result["top"][:top - len(merged["top"])])
+    return merged
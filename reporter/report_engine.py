@@ -0,0 +1,419 @@
+"""In-process daily report engine.
+
+Replaces the print_*_daily_report.csh -> Perl -> grep subprocess chain. Each
+processing log and registry is read once and matching lines are counted with
+the same search tokens the Perl scripts pass to grep:
+1. Processing log lines containing the date token, the year,
+   SUCCESS_OVERALL_TOTAL_TIME, the instrument and the data type.
+2. Registry lines containing the date token, the year and the instrument.
+
+Counting can resume from a byte offset recorded by a previous run so that only
+bytes appended since then are read. Matching processing log lines are parsed
+into latency columns and their granules hashed into a distinct counter in the
+same pass, and the granule names and events of the lines read are collected
+for reconciliation and the event sidecar.
+
+Backfill reports over a range of days read each file once and bucket lines
+by the UTC day of their epoch column instead of matching the local time
+ascii date.
+"""
+
+# Standard imports
+import datetime
+import os
+import pathlib
+
+# Local imports
+from dedup import GranuleHashes
+from latency import LatencyColumns
+
+# Constants
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+SUCCESS_STRING = "SUCCESS_OVERALL_TOTAL_TIME"
+DATA_TYPES = ("QUICKLOOK", "REFINED")
+SECONDS_PER_DAY = 86400
+LOG_EPOCH_FIELD = 0
+REGISTRY_EPOCH_FIELD = 1
+
+class ReportError(Exception):
+    """Raised when a daily report cannot be generated for a unique id."""
+
+    def __init__(self, sigevent_description, sigevent_data):
+        super().__init__(sigevent_description)
+        self.sigevent_description = sigevent_description
+        self.sigevent_data = sigevent_data
+
+def get_search_tokens(report_date="today", report_year=None, now=None):
+    """Return date and year search tokens matching the Perl scripts.
+
+    Days less than 10 are separated from the month by two spaces to match the
+    ascii date written to the processing logs and registries.
+
+    Parameters
+    ----------
+    report_date: str
+        "today" or a date string like "Jan 28" or "Feb  2".
+    report_year: int or str
+        Year of report, ignored if report_date is "today".
+    now: datetime.datetime
+        Local time the report is printed at, defaults to now.
+    """
+
+    if now is None: now = datetime.datetime.now()
+    if report_date == "today":
+        date_token = f"{MONTHS[now.month - 1]} {now.day:>2}"
+        year_token = str(now.year)
+    else:
+        date_token = report_date
+        year_token = str(report_year) if report_year else str(now.year)
+    return date_token, year_token
+
+def format_ascii_date(date):
+    """Return date formatted like Perl's scalar localtime."""
+
+    return f"{date:%a} {MONTHS[date.month - 1]} {date.day:>2} {date:%H:%M:%S} {date.year}"
+
+def get_processing_log(data_dir, dataset, unique_id):
+    """Return path to processing log archive for dataset and unique id."""
+
+    return pathlib.Path(data_dir).joinpath("logs", "processing_logs", f"ghrsst_{dataset}_processing_log_archive_{unique_id}.txt")
+
+def get_registry(data_dir, dataset, processing_type, unique_id):
+    """Return path to processed file registry for dataset and unique id."""
+
+    return pathlib.Path(data_dir).joinpath("scratch", f"ghrsst_master_{dataset}_{processing_type}_list_processed_files_{unique_id}.dat")
+
+def match_processing_log(date_token, year_token, instrument, data_type):
+    """Return function matching successful processing log lines for the day."""
+
+    def match(line):
+        return date_token in line and year_token in line and SUCCESS_STRING in line \
+            and instrument in line and data_type in line
+    
+    return match
+
+def match_registry(date_token, year_token, instrument):
+    """Return function matching registry lines for the day."""
+
+    def match(line):
+        return date_token in line and year_token in line and instrument in line
+    
+    return match
+
+def can_resume(state, inode, size):
+    """Return True if counting can resume from state for the file."""
+
+    return bool(state) and state["inode"] == inode and state["offset"] <= size
+
+def count_lines(path, match, state=None, collect=None, record=None):
+    """Count lines in a file for which match returns True.
+    
+    If state from a previous call is given and the file still has the same 
+    inode and has not been truncated, counting resumes from the recorded 
+    offset and adds to the recorded count. A trailing line without a newline 
+    is counted but not consumed so that it is read again once complete.
+    
+    Parameters
+    ----------
+    path: pathlib.Path
+        Path to processing log or registry.
+    match: function
+        Returns True if the line should be counted.
+    state: dict
+        Offset, inode, size and count returned by a previous call.
+    collect: function
+        Called with each complete matching line.
+    record: function
+        Called with each complete line whether it matches or not.
+        
+    Returns
+    -------
+    int
+        Number of matching lines.
+    dict
+        Offset, inode, size and count of the complete lines consumed.
+    int
+        Number of bytes read.
+    """
+    
+    offset = 0
+    count = 0
+    partial = 0
+    bytes_read = 0
+    with open(path, "rb") as fh:
+        stat = os.fstat(fh.fileno())
+        if can_resume(state, stat.st_ino, stat.st_size):
+            offset = state["offset"]
+            count = state["count"]
+            fh.seek(offset)
+        for raw_line in fh:
+            bytes_read += len(raw_line)
+            line = raw_line.decode(errors="replace")
+            if raw_line.endswith(b"\n"):
+                if record: record(line)
+                if match(line):
+                    count += 1
+                    if collect: collect(line)
+                offset += len(raw_line)
+            elif match(line):
+                partial += 1
+    return count + partial, { "offset": offset, "inode": stat.st_ino, "size": stat.st_size, "count": count }, bytes_read
+
+def count_processing_log(log_file, date_token, year_token, instrument, data_type, state=None, columns=None, hashes=None, names=None,
+                         events=None):
+    """Count successfully processed granules in a processing log.
+    
+    Complete matching lines are parsed into columns, their granules hashed 
+    and their granule names collected if given. Every complete line is 
+    passed to events if given, which matches the lines of any day.
+    """
+
+    def collect(line):
+        if columns: columns.append(line)
+        if hashes: hashes.append(line)
+        if names: names.append(line)
+
+    match = match_processing_log(date_token, year_token, instrument, data_type)
+    return count_lines(log_file, match, state, collect if columns or hashes or names else None, events.append if events is not None else None)
+
+def count_registry(registry_file, date_token, year_token, instrument, state=None, names=None, events=None):
+    """Count granules recorded in a processed file registry.
+
+    A missing registry counts as zero granules like the Perl grep pipeline.
+    The granule names of complete matching lines are collected and every 
+    complete line passed to events if given.
+    """
+
+    match = match_registry(date_token, year_token, instrument)
+    try:
+        return count_lines(registry_file, match, state, names.append if names else None, events.append if events is not None else None)
+    except FileNotFoundError:
+        return 0, None, 0
+
+def generate_daily_report(data_dir, dataset, processing_type, unique_id,
+                          report_date="today", report_year=None, checkpoint=None, latency=None, counter=None,
+                          granules=None, events=None):
+    """Generate daily report for a dataset and unique id.
+
+    Parameters
+    ----------
+    data_dir: pathlib.Path
+        Mounted Processor EFS directory.
+    dataset: str
+        "modis_a", "modis_t", "viirs"
+    processing_type: str
+        "quicklook" or "refined"
+    unique_id: str
+        Unique identifier of Generate execution.
+    report_date: str
+        "today" or a date string like "Jan 28".
+    report_year: int or str
+        Year of report, ignored if report_date is "today".
+    checkpoint: dict
+        Processing log and registry state recorded by a previous run to 
+        resume counting from.
+    latency: dict
+        Latency columns recorded with the checkpoint, used if counting 
+        resumes from the same processing log and running count.
+    counter: DistinctCounter
+        Distinct granule counter of the dataset and processing type to add 
+        the granule hash of each processed line to.
+    granules: tuple
+        Collectors of the granule names of the processing log and registry 
+        lines counted, finished once each file is counted.
+    events: tuple
+        Collectors of the granule events of the processing log and registry 
+        lines read, finished once each file is counted.
+
+    Returns
+    -------
+    dict
+        Report with product, date printed, the number of files processed
+        from the processing log and registry, the checkpoint to resume 
+        from in the next run, the number of bytes read, the latency 
+        columns of the processed granules and, with a counter, the number 
+        of granule events hashed including those resumed from.
+    """
+
+    instrument = dataset.upper()
+    data_type = processing_type.upper()
+    if data_type not in DATA_TYPES:
+        raise ReportError(f"Unrecognized processing type: {processing_type}.",
+                          f"Dataset: {instrument}, unique id: {unique_id}.")
+
+    log_file = get_processing_log(data_dir, dataset, unique_id)
+    registry_file = get_registry(data_dir, dataset, processing_type, unique_id)
+    now = datetime.datetime.now()
+    date_token, year_token = get_search_tokens(report_date, report_year, now)
+
+    if checkpoint is None: checkpoint = { "log": None, "registry": None }
+    columns = LatencyColumns()
+    hashes = GranuleHashes(counter) if counter else None
+    log_names, registry_names = granules or (None, None)
+    log_events, registry_events = events or (None, None)
+    try:
+        num_files_processed, log_state, log_bytes = count_processing_log(log_file, date_token, year_token, instrument, data_type, checkpoint["log"], columns, hashes, log_names, log_events)
+    except FileNotFoundError:
+        raise ReportError(f"File {log_file} cannot be found.",
+                          f"Report for {data_type} {instrument} unique id: {unique_id} cannot be created.")
+    if hashes: hashes.flush()
+    resumed = can_resume(checkpoint["log"], log_state["inode"], log_state["size"])
+    if log_names: log_names.finish(resumed)
+    if log_events is not None: log_events.finish(checkpoint["log"]["offset"] if resumed else 0, log_state["offset"], resumed)
+    num_files_registry, registry_state, registry_bytes = count_registry(registry_file, date_token, year_token, instrument, checkpoint["registry"], registry_names, registry_events)
+    registry_resumed = registry_state is not None and can_resume(checkpoint["registry"], registry_state["inode"], registry_state["size"])
+    if registry_names: registry_names.finish(registry_resumed)
+    if registry_events is not None and registry_state is not None:
+        registry_events.finish(checkpoint["registry"]["offset"] if registry_resumed else 0, registry_state["offset"], registry_resumed)
+    
+    # Keep recorded latency columns only if they cover the lines resumed from
+    if not (resumed and latency and latency["count"] == checkpoint["log"]["count"]): latency = None
+
+    report = {
+        "unique_id": unique_id,
+        "product": f"list of {data_type} {instrument} L2P files processed on {date_token}, {now.year}",
+        "extracted_from": str(log_file),
+        "date_printed": format_ascii_date(now),
+        "num_files_processed": num_files_processed,
+        "num_files_registry": num_files_registry,
+        "registry": str(registry_file),
+        "checkpoint": { "log": log_state, "registry": registry_state },
+        "bytes_read": log_bytes + registry_bytes,
+        "latency": columns.to_arrays(latency)
+    }
+    if counter: report["granule_events"] = log_state["count"]
+    return report
+
+def count_lines_by_day(path, match, field, start_day, end_day):
+    """Count lines for which match returns True by the UTC day of their epoch.
+    
+    Parameters
+    ----------
+    path: pathlib.Path
+        Path to processing log or registry.
+    match: function
+        Returns True if the line should be counted.
+    field: int
+        Index of the comma separated epoch field.
+    start_day: datetime.date
+        First day to count.
+    end_day: datetime.date
+        Last day to count.
+        
+    Returns
+    -------
+    dict
+        Number of matching lines for each ISO format day with lines.
+    int
+        Number of bytes read.
+    """
+    
+    epoch_day = datetime.date(1970, 1, 1).toordinal()
+    first = start_day.toordinal() - epoch_day
+    last = end_day.toordinal() - epoch_day
+    day_counts = {}
+    bytes_read = 0
+    with open(path, "rb") as fh:
+        for raw_line in fh:
+            bytes_read += len(raw_line)
+            line = raw_line.decode(errors="replace")
+            if not match(line): continue
+            try:
+                day = int(line.split(",", field + 1)[field]) // SECONDS_PER_DAY
+            except (IndexError, ValueError):
+                continue
+            if first <= day <= last: day_counts[day] = day_counts.get(day, 0) + 1
+    return { datetime.date.fromordinal(day + epoch_day).isoformat(): count for day, count in day_counts.items() }, bytes_read
+
+def generate_backfill_report(data_dir, dataset, processing_type, unique_id, start_day, end_day):
+    """Generate report of granules processed on each day of a date range.
+    
+    Each processing log and registry is read once and lines are grouped by 
+    the UTC day of their epoch column.
+    
+    Parameters
+    ----------
+    data_dir: pathlib.Path
+        Mounted Processor EFS directory.
+    dataset: str
+        "modis_a", "modis_t", "viirs"
+    processing_type: str
+        "quicklook" or "refined"
+    unique_id: str
+        Unique identifier of Generate execution.
+    start_day: datetime.date
+        First day of the report.
+    end_day: datetime.date
+        Last day of the report.
+        
+    Returns
+    -------
+    dict
+        Report with product, date printed, the number of files processed 
+        from the processing log and registry on each ISO format day and the 
+        number of bytes read.
+    """
+    
+    instrument = dataset.upper()
+    data_type = processing_type.upper()
+    if data_type not in DATA_TYPES:
+        raise ReportError(f"Unrecognized processing type: {processing_type}.",
+                          f"Dataset: {instrument}, unique id: {unique_id}.")
+
+    log_file = get_processing_log(data_dir, dataset, unique_id)
+    registry_file = get_registry(data_dir, dataset, processing_type, unique_id)
+    
+    def match_log(line):
+        return SUCCESS_STRING in line and instrument in line and data_type in line
+    
+    def match_registry_line(line):
+        return instrument in line
+    
+    try:
+        processed, log_bytes = count_lines_by_day(log_file, match_log, LOG_EPOCH_FIELD, start_day, end_day)
+    except FileNotFoundError:
+        raise ReportError(f"File {log_file} cannot be found.",
+                          f"Report for {data_type} {instrument} unique id: {unique_id} cannot be created.")
+    try:
+        registry, registry_bytes = count_lines_by_day(registry_file, match_registry_line, REGISTRY_EPOCH_FIELD, start_day, end_day)
+    except FileNotFoundError:
+        registry, registry_bytes = {}, 0
+    
+    days = {}
+    for day in sorted(processed.keys() | registry.keys()):
+        days[day] = { "num_files_processed": processed.get(day, 0), "num_files_registry": registry.get(day, 0) }
+    return {
+        "unique_id": unique_id,
+        "product": f"list of {data_type} {instrument} L2P files processed from {start_day.isoformat()} to {end_day.isoformat()} (UTC)",
+        "extracted_from": str(log_file),
+        "date_printed": format_ascii_date(datetime.datetime.now()),
+        "days": days,
+        "registry": str(registry_file),
+        "bytes_read": log_bytes + registry_bytes
+    }
+
+def read_report_file(report_file, unique_id):
+    """Read report written by the Perl scripts into a report dictionary.
+
+    Used by the Perl compatibility mode so both engines produce the same
+    structure.
+    """
+
+    with open(report_file) as fh:
+        report_lines = fh.read().splitlines()
+    if len(report_lines) == 0: return None
+
+    fields = {}
+    for line in report_lines:
+        if ": " in line:
+            key, value = line.split(": ", 1)
+            fields[key] = value
+    return {
+        "unique_id": unique_id,
+        "product": fields["Product"],
+        "extracted_from": fields["Extracted_from"],
+        "date_printed": fields["Date_printed"],
+        "num_files_processed": int(fields["Num_files_processed"].split(',')[0]),
+        "num_files_registry": int(fields["Num_files_from_registry"].split(',')[0]),
+        "registry": fields["Num_files_from_registry"].split(" = ")[-1]
+    }
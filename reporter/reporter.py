@@ -7,99 +7,617 @@ It performs the following:
    execution of Generate.
 3. Collates the report into one email report and publishes the report to an SNS 
    Topic.
-4. Compresses the files that were processed into an archive and removes 
-   processing files to avoid duplication in following reports.
+4. Streams the files that were processed into an archive in S3 and removes 
+   processing files once the archive is verified to avoid duplication in 
+   following reports.
+
+Backlogs too large for one invocation can be split with the coordinator mode,
+which shards the unique ids over worker invocations and merges their partial
+results into the same report and archive.
 """
 
 # Standard imports
+import concurrent.futures
+import contextlib
 import datetime
-import glob
+import functools
 import logging
 import os
 import pathlib
 import shutil
 import subprocess
-from subprocess import PIPE
 import sys
 import zipfile
 
-# Third-party imports
-import boto3
-import botocore
-
 # Local imports
+from archive import COMPRESSION, ArchiveError, get_compression_levels, upload_archive
+from checkpoint import get_checkpoint_key, get_granules_dir, load_checkpoints, load_columns, load_counters, remove_checkpoints, remove_columns, remove_counters, remove_events, remove_granules, save_checkpoints, save_columns, save_counters, update_checkpoints
+from cleanup import CLEANUP_WORKERS, remove_directory, remove_files
+from clients import TopicNotFoundError, get_client, resolve_topic_arn
+from dedup import DistinctCounters, count_distinct, format_distinct
+from discovery import locate_processing_files
+from journal import PhaseJournal
+from history import ARCHIVE_PREFIX, PERIODS, HistoryError, S3ArchiveStore, build_trend, format_trend, get_history, get_period_range
+from latency import compute_latency_stats, format_latency_stats
+from metrics import profile_run, profiling, recorder
 from notify import notify
+from reconcile import MAX_SET_SIZE, GranuleRuns, format_reconciliation, merge_results, reconcile_dataset
+from report_engine import ReportError, generate_backfill_report, generate_daily_report, get_search_tokens, read_report_file
+from shards import EXECUTORS, JOURNAL_DIR, LOCK_NAME, PLAN_NAME, SHARD_DIR, STORES, LocalShardStore, S3ShardStore, ShardError, count_ids, create_run_id, decode_columns, encode_columns, encode_report, get_executor, get_partial_name, merge_partials, partition_ids, remove_run_directory
+from sidecar import EVENTS_PREFIX, EventParts, SidecarError, write_events
 
 # Constants
 DATA_DIR = pathlib.Path("/mnt/data")    # Mounted Processor EFS directory
 TOPIC_STRING = "reporter"
+TOPIC_ARN_ENV = "REPORTER_TOPIC_ARN"    # Overrides topic lookup when set
 DATASET_DICT = {
     "aqua": "MODIS_A",
     "terra": "MODIS_T",
     "viirs": "VIIRS"
 }
+ENGINES = ("python", "perl", "compare")
+MODES = ("daily", "intraday", "backfill", "trend", "coordinator", "worker", "merge")
+SHARD_MODES = ("coordinator", "worker", "merge")
+DEFAULT_WORKERS = 4
+MAX_WORKERS = 32
+TOP_DISCREPANCIES = 10
+MAX_BACKFILL_DAYS = 366
+DEFAULT_TREND_PERIODS = 4
+DEFAULT_SHARDS = 8
+MAX_SHARDS = 256
 
 def event_handler(event, context):
     """Parse EventBridge schedule input for arguments and generate reports."""
     
     start = datetime.datetime.now()
     
+    logger = get_logger()
     if "debug" in event.keys():
         debug = True
     else:
         debug = False
-    prefix = event["prefix"]
-    logger = get_logger()
+    prefix = event.get("prefix")
+    mode = event.get("mode", "daily")
+    engine = event.get("engine", "python")
+    workers = min(max(get_int(event, "workers", DEFAULT_WORKERS, logger), 1), MAX_WORKERS)
+    compression = event.get("compression", "deflate")
+    compression_level = get_int(event, "compression_level", None, logger) if event.get("compression_level") is not None else None
+    start_date = event.get("start_date")
+    end_date = event.get("end_date", start_date)
+    period = event.get("period", "week")
+    num_periods = get_int(event, "periods", DEFAULT_TREND_PERIODS, logger)
+    num_shards = min(max(get_int(event, "shards", DEFAULT_SHARDS, logger), 1), MAX_SHARDS)
+    run_id = event.get("run_id")
+    shard = event.get("shard")
+    executor = event.get("executor", "lambda")
+    shard_store = event.get("shard_store", "efs")
+    if engine not in ENGINES:
+        handle_error(f"Unrecognized report engine: {engine}.", f"Report engine must be one of: {', '.join(ENGINES)}.", logger)
+    if mode not in MODES:
+        handle_error(f"Unrecognized mode: {mode}.", f"Mode must be one of: {', '.join(MODES)}.", logger)
+    if compression not in COMPRESSION:
+        handle_error(f"Unsupported archive compression: {compression}.", f"Compression must be one of: {', '.join(COMPRESSION)}.", logger)
+    levels = get_compression_levels(compression)
+    if compression_level is not None and (levels is None or compression_level not in levels):
+        handle_error(f"Invalid {compression} compression level: {compression_level}.", f"Compression level must be from {levels[0]} to {levels[-1]}." if levels else f"{compression.capitalize()} compression does not take a compression level.", logger)
+    if engine != "python" and (shutil.which("csh") is None or shutil.which("perl") is None):
+        handle_error(f"Report engine {engine} is not available in this image.", "The perl and compare report engines require an image built with --build-arg PERL_ENGINE=true.", logger)
+    if mode not in ("daily", "trend") and engine != "python":
+        handle_error(f"{mode.capitalize()} mode cannot use report engine: {engine}.", f"{mode.capitalize()} mode requires the python report engine.", logger)
+    if mode == "backfill":
+        date_range = parse_date_range(start_date, end_date, logger)
+    if mode == "trend" and (period not in PERIODS or num_periods < 1):
+        handle_error(f"Invalid trend period: {num_periods} {period}.", f"Trend period must be one of: {', '.join(PERIODS)} and periods must be at least 1.", logger)
+    if mode in SHARD_MODES and (executor not in EXECUTORS or shard_store not in STORES):
+        handle_error(f"Unrecognized shard executor or store: {executor}, {shard_store}.", f"Executor must be one of: {', '.join(EXECUTORS)} and shard store must be one of: {', '.join(STORES)}.", logger)
+    if mode in ("worker", "merge") and (not run_id or (mode == "worker" and not isinstance(shard, int))):
+        handle_error(f"{mode.capitalize()} mode is missing its run.", f"{mode.capitalize()} mode requires the run_id of the coordinator run{' and the shard index' if mode == 'worker' else ''}.", logger)
+    
+    # cProfile only sees the thread that enabled it
+    profile = "profile" in event.keys()
+    if profile and workers != 1:
+        logger.info(f"Profiling the run with 1 worker rather than {workers}.")
+        workers = 1
+    
+    recorder.reset()
+    with profile_run(profile, logger):
+        if mode == "intraday":
+            run_intraday(workers, debug, logger)
+        elif mode == "backfill":
+            run_backfill(date_range, workers, debug, logger)
+        elif mode == "trend":
+            run_trend(prefix, period, num_periods, debug, logger)
+        elif mode == "coordinator":
+            run_coordinator(event, prefix, num_shards, executor, shard_store, debug, logger)
+        elif mode == "worker":
+            run_worker(event, prefix, run_id, shard, executor, shard_store, workers, debug, logger)
+        elif mode == "merge":
+            run_merge(prefix, run_id, shard_store, compression, compression_level, workers, debug, logger)
+        else:
+            run_daily(prefix, engine, workers, compression, compression_level, "restart" in event.keys(), debug, logger)
+    recorder.emit(mode)
+    
+    end = datetime.datetime.now()
+    logger.info(f"Execution time - {end - start}.")
+    
+    # Run invocations queued by a local coordinator or worker
+    if mode in SHARD_MODES:
+        get_executor(executor, event_handler).drain()
+    
+def get_int(event, key, default, logger):
+    """Return integer value of key in the event or handle an error if it is 
+    not an integer."""
+    
+    value = event.get(key, default)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        handle_error(f"Invalid {key}: {value}.", f"{key.replace('_', ' ').capitalize()} must be an integer.", logger)
+    
+def run_daily(prefix, engine, workers, compression, compression_level, restart, debug, logger):
+    """Publish the daily report, archive processing files and remove them.
+    
+    Each phase is recorded in a journal on the EFS so that a retried 
+    invocation resumes after the last phase that completed unless restart 
+    is set.
+    """
+    
+    journal = PhaseJournal.open(DATA_DIR, logger, restart)
+    checkpoints = load_checkpoints(DATA_DIR, journal.report_day, logger) if engine != "perl" else {}
+    granules = get_granule_runs(journal.report_day, workers) if engine != "perl" else None
+    events = EventParts(DATA_DIR) if engine != "perl" else None
+    
+    # Locate unique identifiers
+    discovery = journal.completed("discovery")
+    if discovery is None:
+        dataset_dict, total_reports, file_list = discover_processing_files(logger)
+        journal.complete("discovery", { "dataset_dict": dataset_dict, "total_reports": total_reports, 
+                                        "file_list": [ str(path) for path in file_list ] })
+    else:
+        dataset_dict = discovery["dataset_dict"]
+        total_reports = discovery["total_reports"]
+        file_list = [ pathlib.Path(path) for path in discovery["file_list"] ]
+    
+    # Reports are only generated, combined and reconciled until the report 
+    # is published as a retry may find the processing logs already removed
+    published = journal.completed("publish")
+    if published is None:
+        # Generate reports for unique identifiers without a recorded report, 
+        # starting from the distinct granule counters of the last snapshot or 
+        # of the intraday runs
+        if journal.completed("reports") is None:
+            journal.begin("reports")
+            counters, num_reports = None, None
+            if engine != "perl":
+                counters, num_reports = journal.load_counters()
+                if counters is None: counters = load_counters(DATA_DIR, journal.report_day, logger)
+            completed = journal.load_reports(num_reports)
+            journal.counters = counters
+            logger.info(f"Generating and combining {total_reports} daily reports with {workers} workers, {len(completed)} recorded by a previous run.")
+            with recorder.phase("report_generation"):
+                report_dict = generate_reports(dataset_dict, engine, workers, debug, logger, checkpoints, 
+                                               completed=completed, on_report=journal.record_report, counters=counters,
+                                               granules=granules, events=events)
+            journal.save_counters()
+            journal.complete("reports", { "num_reports": total_reports })
+        else:
+            counters, _ = journal.load_counters()
+            completed = journal.load_reports()
+            report_dict = { dataset: { processing_type: [ completed[(dataset, processing_type, file_id)] for file_id in file_ids 
+                                                          if completed.get((dataset, processing_type, file_id)) is not None ]
+                                       for processing_type, file_ids in processing_dict.items() } 
+                            for dataset, processing_dict in dataset_dict.items() }
+        dataset_email, l2p_dict = combine_reports(report_dict, debug, logger, counters=counters)
+        
+        # Reconcile granules between processing logs and registries
+        reconciliation = journal.completed("reconciliation")
+        if reconciliation is None or not pathlib.Path(reconciliation["file"]).exists():
+            with recorder.phase("reconciliation"):
+                reconciliation_txt, results = reconcile_processing_files(dataset_dict, journal.date, debug, logger, granules=granules)
+            journal.complete("reconciliation", { "file": str(reconciliation_txt), "results": results })
+        else:
+            reconciliation_txt, results = pathlib.Path(reconciliation["file"]), reconciliation["results"]
+        add_reconciliation(dataset_email, results)
+    else:
+        dataset_email, l2p_dict = None, published["l2p_dict"]
+        reconciliation_txt = pathlib.Path(journal.completed("reconciliation")["file"])
+    
+    finish_daily(prefix, dataset_dict, file_list, dataset_email, l2p_dict, [reconciliation_txt], checkpoints, journal, 
+                 compression, compression_level, workers, debug, logger)
+    journal.remove()
+    
+def finish_daily(prefix, dataset_dict, file_list, dataset_email, l2p_dict, report_files, checkpoints, journal, 
+                 compression, compression_level, workers, debug, logger):
+    """Publish the combined daily report, archive the processing files and 
+    remove them and their checkpoints once the archive is verified.
+    
+    Phases already completed in the journal are skipped so the report is 
+    not published again, the archive is not uploaded again and files are 
+    only removed after the archive they are in has been verified. The 
+    email is None once the report has been published.
+    """
+    
+    # Publish report
+    published = journal.completed("publish")
+    if published is None:
+        if journal.started("publish"):
+            logger.info("Publishing daily report again as a previous run stopped while publishing it.")
+        journal.begin("publish")
+        with recorder.phase("publish"):
+            message, message_id = publish_report(dataset_email, journal.date, logger)
+            message_txt = write_message_txt(message, journal.date)
+        journal.complete("publish", { "message_id": message_id, "message_txt": str(message_txt), "l2p_dict": l2p_dict })
+    else:
+        message_txt = pathlib.Path(published["message_txt"])
+        logger.info(f"Daily report already published with message id: {published['message_id']}.")
+    
+    # Stream archive of logs, registries and reports to S3 bucket
+    archive = journal.completed("archiving")
+    if archive is None:
+        journal.begin("archiving")
+        with recorder.phase("archiving"):
+            archive_key = archive_processing_files(prefix, file_list, [message_txt, *report_files], compression, compression_level, workers, debug, logger)
+        journal.complete("archiving", { "key": archive_key })
+    else:
+        archive_key = archive["key"]
+        if archive_key: logger.info(f"Processing files already archived to: s3://{prefix}/{archive_key}.")
+    
+    # Print final log message
+    print_final_log(logger, l2p_dict)
+    
+    # Remove logs and registries once the archive has been verified
+    if archive_key:
+        if journal.completed("sidecar") is None:
+            if journal.started("sidecar"):
+                # Never let a sidecar that stopped a run stop its retry from removing files
+                logger.error(f"Skipping Parquet sidecar of granule events as a previous run stopped while writing it to: s3://{prefix}/{EVENTS_PREFIX}/.")
+                journal.complete("sidecar", { "keys": [], "skipped": True })
+            else:
+                journal.begin("sidecar")
+                with recorder.phase("sidecar"):
+                    sidecar = write_event_sidecar(prefix, dataset_dict, journal.date, logger)
+                journal.complete("sidecar", { "keys": sidecar["keys"] if sidecar else [] })
+        journal.begin("deletion")
+        with recorder.phase("deletion"):
+            deletion = remove_processing_files(file_list, debug, logger)
+            remove_reports_directory(debug, logger)
+        
+        # Remove checkpoints for archived processing files
+        if len(checkpoints) != 0:
+            remove_checkpoints(checkpoints, dataset_dict)
+            save_checkpoints(DATA_DIR, journal.report_day, checkpoints, logger)
+            remove_columns(DATA_DIR, dataset_dict)
+        remove_counters(DATA_DIR)
+        remove_granules(DATA_DIR)
+        remove_events(DATA_DIR, dataset_dict)
+        journal.complete("deletion", { "deleted": deletion["deleted"], "missing": deletion["missing"] })
+            
+def run_intraday(workers, debug, logger):
+    """Add bytes appended since the last run to running daily totals."""
+    
+    report_day = datetime.datetime.now().date().isoformat()
+    checkpoints = load_checkpoints(DATA_DIR, report_day, logger)
+    counters = load_counters(DATA_DIR, report_day, logger)
+    dataset_dict, file_list, report_dict, dataset_email, l2p_dict = create_reports("python", workers, checkpoints, debug, logger, counters=counters,
+                                                                                   granules=get_granule_runs(report_day, workers), events=EventParts(DATA_DIR))
+    save_counters(DATA_DIR, report_day, counters, logger)    # Before checkpoints so they never cover lines the counters do not
+    update_checkpoints(checkpoints, report_dict)
+    save_checkpoints(DATA_DIR, report_day, checkpoints, logger)
+    save_columns(DATA_DIR, report_dict, logger)
+    print_final_log(logger, l2p_dict, "intraday_log")
+    
+def parse_date_range(start_date, end_date, logger):
+    """Return first and last day of backfill from ISO format dates."""
+    
+    try:
+        start_day = datetime.date.fromisoformat(start_date)
+        end_day = datetime.date.fromisoformat(end_date)
+    except (TypeError, ValueError):
+        handle_error(f"Invalid backfill date range: {start_date} to {end_date}.", "Backfill mode requires start_date and optional end_date in YYYY-MM-DD format.", logger)
+    num_days = (end_day - start_day).days + 1
+    if num_days < 1 or num_days > MAX_BACKFILL_DAYS:
+        handle_error(f"Invalid backfill date range: {start_date} to {end_date}.", f"Backfill date range must cover between 1 and {MAX_BACKFILL_DAYS} days.", logger)
+    return start_day, end_day
+    
+def run_backfill(date_range, workers, debug, logger):
+    """Publish one combined report of granules processed on each day of the 
+    date range without archiving or removing processing files."""
+    
+    dataset_dict, file_list, report_dict, dataset_email, l2p_dict = create_reports("python", workers, {}, debug, logger, date_range)
+    with recorder.phase("publish"):
+        date = datetime.datetime.now(datetime.timezone.utc)
+        publish_report(dataset_email, date, logger, f"Backfill ({date_range[0].isoformat()} to {date_range[1].isoformat()})")
+    print_final_log(logger, l2p_dict, "backfill_log")
+    
+def run_trend(prefix, period, num_periods, debug, logger):
+    """Publish weekly or monthly trends of the daily reports archived in 
+    the S3 bucket, or log that there are none to publish."""
+    import botocore.exceptions
+    
+    history = get_history(prefix, S3ArchiveStore(get_client("s3"), prefix, extra_args={"ServerSideEncryption": "aws:kms"}))
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    start_day, end_day = get_period_range(today, period, num_periods)
+    try:
+        with recorder.phase("history_index"):
+            num_indexed = history.update_index()
+        logger.info(f"Indexed {num_indexed} new daily archives in: s3://{prefix}/{ARCHIVE_PREFIX}/.")
+        with recorder.phase("trend"):
+            trend = build_trend(history, start_day, end_day, period)
+    except botocore.exceptions.ClientError as e:
+        handle_error(f"Could not read daily archives in: s3://{prefix}/{ARCHIVE_PREFIX}/.", f"Error - {e}", logger)
+    except (HistoryError, zipfile.BadZipFile) as e:
+        handle_error(f"Could not read daily report from archives in: s3://{prefix}/{ARCHIVE_PREFIX}/.", f"Error - {e}", logger)
+    if debug: logger.info(f"Trend cache holds {history.read_day.cache_info().currsize} daily reports, {history.read_day.cache_info().hits} read from it.")
+    if len(trend) == 0:
+        logger.info(f"No daily archives from {start_day.isoformat()} to {end_day.isoformat()} in: s3://{prefix}/{ARCHIVE_PREFIX}/, trend not published.")
+        return
+    
+    with recorder.phase("publish"):
+        date = datetime.datetime.now(datetime.timezone.utc)
+        title = f"{'Weekly' if period == 'week' else 'Monthly'} Trend ({start_day.isoformat()} to {end_day.isoformat()})"
+        publish_report({ "trend": { period: format_trend(trend, period) } }, date, logger, title)
+    
+def get_shard_store(store, prefix, run_id):
+    """Return store of the plan and partial results of a sharded run."""
+    
+    shard_dir = DATA_DIR.joinpath(SHARD_DIR)
+    if store == "s3":
+        return S3ShardStore(get_client("s3"), prefix, run_id, shard_dir, extra_args={"ServerSideEncryption": "aws:kms"})
+    return LocalShardStore(shard_dir, run_id)
+    
+def read_shard_file(store, name, logger):
+    """Return plan or partial result read from the shard store."""
+    
+    try:
+        return store.read(name)
+    except ShardError as e:
+        handle_error(f"Could not read {name} of sharded run in: {store.describe()}.", f"Error - {e}", logger)
+    
+def write_shard_file(store, name, data, logger):
+    """Write plan or partial result to the shard store."""
+    import botocore.exceptions
+    
+    try:
+        store.write(name, data)
+    except (OSError, botocore.exceptions.ClientError) as e:
+        handle_error(f"Could not write {name} of sharded run to: {store.describe()}.", f"Error - {e}", logger)
+    
+def run_coordinator(event, prefix, num_shards, executor, shard_store, debug, logger):
+    """Partition the unique ids of the daily report into shards and invoke a 
+    worker for each shard.
+    
+    Parameters
+    ----------
+    event: dict
+        Event of the coordinator run, passed on to the workers.
+    prefix: str
+        S3 bucket to archive to and to store shards in.
+    num_shards: int
+        Maximum number of shards to partition unique ids into.
+    executor: str
+        "lambda" to invoke workers asynchronously or "local" to run them 
+        in-process once the coordinator returns.
+    shard_store: str
+        "efs" or "s3" to store the plan and partial results in.
+    """
+    import botocore.exceptions
+    
+    dataset_dict, total_reports, file_list = discover_processing_files(logger)
+    date = datetime.datetime.now(datetime.timezone.utc)
+    run_id = create_run_id(date)
+    shards = partition_ids(dataset_dict, num_shards)
+    store = get_shard_store(shard_store, prefix, run_id)
+    plan = {
+        "run_id": run_id,
+        "date": date.isoformat(),
+        "report_day": datetime.datetime.now().date().isoformat(),
+        "dataset_dict": dataset_dict,
+        "shards": shards,
+        "file_list": [ str(path) for path in file_list ]
+    }
+    with recorder.phase("sharding"):
+        write_shard_file(store, PLAN_NAME, plan, logger)
+    logger.info(f"Partitioned {total_reports} daily reports into {len(shards)} shards of run: {run_id} in: {store.describe()}.")
+    
+    worker_event = { key: value for key, value in event.items() if key != "shards" }
+    for index in range(len(shards)):
+        try:
+            get_executor(executor, event_handler).submit({ **worker_event, "mode": "worker", "run_id": run_id, "shard": index })
+        except botocore.exceptions.ClientError as e:
+            handle_error(f"Could not invoke worker {index} of sharded run: {run_id}.", f"Error - {e}", logger)
+        if debug: logger.info(f"Invoked worker {index} with {count_ids(shards[index])} unique ids.")
+    
+def run_worker(event, prefix, run_id, shard, executor, shard_store, workers, debug, logger):
+    """Generate and reconcile the reports of one shard, write them as a 
+    partial result and invoke the merge once every shard has written one."""
+    import botocore.exceptions
+    
+    store = get_shard_store(shard_store, prefix, run_id)
+    plan = read_shard_file(store, PLAN_NAME, logger)
+    if not 0 <= shard < len(plan["shards"]):
+        handle_error(f"Shard {shard} is not part of sharded run: {run_id}.", f"Run {run_id} has {len(plan['shards'])} shards.", logger)
+    dataset_dict = plan["shards"][shard]
+    
+    checkpoints = load_checkpoints(DATA_DIR, plan["report_day"], logger)
+    counters = DistinctCounters()
+    granules = get_granule_runs(plan["report_day"], workers)
+    logger.info(f"Generating {count_ids(dataset_dict)} daily reports for shard {shard} of run: {run_id} with {workers} workers.")
+    with recorder.phase("report_generation"):
+        report_dict = generate_reports(dataset_dict, "python", workers, debug, logger, checkpoints, counters=counters, granules=granules,
+                                       events=EventParts(DATA_DIR))
+    with recorder.phase("reconciliation"):
+        reconciliation_txt, results = reconcile_processing_files(dataset_dict, datetime.datetime.fromisoformat(plan["date"]), debug, logger, shard, granules)
+    
+    partial = {
+        "shard": shard,
+        "reports": { dataset: { processing_type: [ encode_report(report) for report in reports ] 
+                                for processing_type, reports in processing_dict.items() } 
+                     for dataset, processing_dict in report_dict.items() },
+        "reconciliation": results,
+        "reconciliation_file": str(reconciliation_txt),
+        "counters": encode_columns(counters.to_arrays())
+    }
+    with recorder.phase("sharding"):
+        write_shard_file(store, get_partial_name(shard), partial, logger)
+    logger.info(f"Wrote partial result of shard {shard} to: {store.describe()}.")
+    
+    # The worker that writes the last partial result invokes the merge
+    try:
+        partials = set(store.list())
+        if all(get_partial_name(index) in partials for index in range(len(plan["shards"]))) and store.claim(LOCK_NAME):
+            merge_event = { key: value for key, value in event.items() if key != "shard" }
+            get_executor(executor, event_handler).submit({ **merge_event, "mode": "merge" })
+            logger.info(f"Invoked merge of sharded run: {run_id}.")
+    except (OSError, botocore.exceptions.ClientError) as e:
+        handle_error(f"Could not invoke merge of sharded run: {run_id}.", f"Error - {e}", logger)
+    
+def run_merge(prefix, run_id, shard_store, compression, compression_level, workers, debug, logger):
+    """Combine the partial results of every shard into the daily report, 
+    archive the processing files and remove them and the sharded run.
+    
+    Phases are recorded in a journal in the run directory so that a retried 
+    merge of the run resumes after the last phase that completed. The 
+    journal is removed last so a retry after the run was removed finds 
+    that it completed.
+    """
+    
+    store = get_shard_store(shard_store, prefix, run_id)
+    journal_dir = DATA_DIR.joinpath(SHARD_DIR, run_id, JOURNAL_DIR)
+    journal = PhaseJournal.open_run(journal_dir, logger)
+    if journal is not None and journal.completed("deletion") is not None:
+        remove_sharded_run(store, journal)
+        logger.info(f"Sharded run: {run_id} was already merged.")
+        return
+    
+    plan = read_shard_file(store, PLAN_NAME, logger)
+    names = set(store.list())
+    missing = [ str(index) for index in range(len(plan["shards"])) if get_partial_name(index) not in names ]
+    if len(missing) != 0:
+        handle_error(f"{len(missing)} of {len(plan['shards'])} shards of run {run_id} have not written partial results.", f"Missing shards: {', '.join(missing)}.", logger)
+    if journal is None: journal = PhaseJournal.create(journal_dir, plan["report_day"])
+    
+    # Partials are only combined until the report is published as a retry 
+    # may find the processing logs the counters resumed from removed
+    with recorder.phase("sharding"):
+        partials = [ read_shard_file(store, get_partial_name(index), logger) for index in range(len(plan["shards"])) ]
+    published = journal.completed("publish")
+    if published is None:
+        # Distinct granule counters start from those of the intraday runs 
+        # the workers resumed counting from
+        counters = load_counters(DATA_DIR, plan["report_day"], logger)
+        with recorder.phase("sharding"):
+            report_dict, reconciliation = merge_partials(plan, partials)
+            for partial in partials:
+                counters.merge(DistinctCounters.from_arrays(decode_columns(partial["counters"])))
+        dataset_email, l2p_dict = combine_reports(report_dict, debug, logger, counters=counters)
+        add_reconciliation(dataset_email, { dataset: { processing_type: merge_results(results, TOP_DISCREPANCIES) 
+                                                       for processing_type, results in processing_dict.items() } 
+                                            for dataset, processing_dict in reconciliation.items() })
+    else:
+        dataset_email, l2p_dict = None, published["l2p_dict"]
+    
+    dataset_dict = plan["dataset_dict"]
+    file_list = [ pathlib.Path(path) for path in plan["file_list"] ]
+    report_files = [ pathlib.Path(partial["reconciliation_file"]) for partial in partials ]
+    checkpoints = load_checkpoints(DATA_DIR, plan["report_day"], logger)
+    finish_daily(prefix, dataset_dict, file_list, dataset_email, l2p_dict, report_files, checkpoints, journal, 
+                 compression, compression_level, workers, debug, logger)
+    remove_sharded_run(store, journal)
+    logger.info(f"Merged {len(partials)} shards of run: {run_id}.")
+    
+def remove_sharded_run(store, journal):
+    """Remove the plan and partial results of a merged run, then its journal 
+    and the run directory."""
+    
+    store.remove()
+    journal.remove()
+    remove_run_directory(journal.directory.parent)
+    
+def discover_processing_files(logger):
+    """Locate the unique identifiers and processing files on the EFS.
+    
+    Returns
+    -------
+    dict
+        Dictionary of datasets with quicklook and refined unique ids.
+    int
+        Number of reports to generate.
+    list
+        Processing logs and registries found during discovery.
+    """
     
-    # # Locate unique identifiers
     dataset_dict = { 
         "modis_a": { "quicklook": [], "refined": [] }, 
         "modis_t": { "quicklook": [], "refined": [] }, 
         "viirs":   { "quicklook": [], "refined": [] }
     }
-    total_reports = locate_processing_files(dataset_dict, logger)
+    with recorder.phase("discovery"):
+        total_reports, file_list = locate_processing_files(DATA_DIR, dataset_dict, logger)
+    return dataset_dict, total_reports, file_list
+    
+def create_reports(engine, workers, checkpoints, debug, logger, date_range=None, counters=None, granules=None, events=None):
+    """Locate processing files, generate reports for each unique identifier 
+    and combine them into a single report.
+    
+    Reports cover today unless a backfill date range of the first and last 
+    day is given. Granules are counted distinctly with counters, their names 
+    collected for reconciliation with granules and their events collected 
+    for the sidecar with events if given.
+    
+    Returns
+    -------
+    dict
+        Dictionary of datasets with quicklook and refined unique ids.
+    list
+        Processing logs and registries found during discovery.
+    dict
+        Dictionary of datasets with quicklook and refined lists of reports.
+    dict
+        Dictionary of datasets with quicklook and refined email text.
+    dict
+        Dictionary of L2P granules processed for the final log.
+    """
+    
+    # Locate unique identifiers
+    dataset_dict, total_reports, file_list = discover_processing_files(logger)
     
     # Generate reports for each unique identifier and combine into single report
+    logger.info(f"Generating and combining {total_reports} {'backfill' if date_range else 'daily'} reports with {workers} workers.")
+    with recorder.phase("report_generation"):
+        report_dict = generate_reports(dataset_dict, engine, workers, debug, logger, checkpoints, date_range, counters=counters,
+                                       granules=granules, events=events)
+    dataset_email, l2p_dict = combine_reports(report_dict, debug, logger, date_range, counters)
+    return dataset_dict, file_list, report_dict, dataset_email, l2p_dict
+    
+def combine_reports(report_dict, debug, logger, date_range=None, counters=None):
+    """Combine the reports of every dataset and processing type.
+    
+    Distinct granules are counted with the counter of each dataset and 
+    processing type if counters are given.
+    
+    Returns
+    -------
+    dict
+        Dictionary of datasets with quicklook and refined email text.
+    dict
+        Dictionary of L2P granules processed for the final log.
+    """
+    
     dataset_email = { 
         "modis_a": { "quicklook": "", "refined": "" }, 
         "modis_t": { "quicklook": "", "refined": "" }, 
         "viirs":   { "quicklook": "", "refined": "" }
     }
-    logger.info(f"Generating and combining {total_reports} daily reports.")
     l2p_dict = {"aqua_quicklook_l2p": 0, "aqua_refined_l2p": 0, "terra_quicklook_l2p": 0, "terra_refined_l2p": 0, "viirs_quicklook_l2p": 0, "viirs_refined_l2p": 0}
-    for dataset, processing_dict in dataset_dict.items():
-        for processing_type, dataset_files in processing_dict.items():
-            generate_report(dataset, processing_type, dataset_files, debug, logger)
-            combine_dataset_reports(dataset, processing_type, dataset_files, dataset_email, l2p_dict, debug, logger)
-        
-    # Publish report
-    date = datetime.datetime.now(datetime.timezone.utc)
-    message = publish_report(dataset_email, date, logger)
-    message_txt = write_message_txt(message, date)
-    
-    # Remove logs and registries
-    zipped = remove_processing_files(dataset_dict, message_txt, debug, logger)
-    
-    # Print final log message
-    print_final_log(logger, l2p_dict)
-    
-    # Upload archive to S3 bucket
-    if zipped:
-        upload_archive(prefix, zipped, debug, logger)
-        
-        # Remove reports directory
-        try:
-            reports_dir = DATA_DIR.joinpath("scratch", "reports")
-            shutil.rmtree(reports_dir)
-            logger.info(f"Removed reports directory: {reports_dir}")
-        except OSError as e:
-            report_dir = DATA_DIR.joinpath("scratch", "reports")
-            sigevent_description = f"Could not delete reports directory: {report_dir}."
-            sigevent_data = f"Error - {e}"
-            handle_error(sigevent_description, sigevent_data, logger)
-    
-    end = datetime.datetime.now()
-    logger.info(f"Execution time - {end - start}.")
+    with recorder.phase("combination"):
+        for dataset, processing_dict in report_dict.items():
+            for processing_type, reports in processing_dict.items():
+                if date_range:
+                    combine_backfill_reports(dataset, processing_type, reports, dataset_email, l2p_dict, date_range, debug, logger)
+                else:
+                    combine_dataset_reports(dataset, processing_type, reports, dataset_email, l2p_dict, debug, logger, 
+                                            counters.get(dataset, processing_type) if counters else None)
+    return dataset_email, l2p_dict
     
 def get_logger():
     """Return a formatted logger object."""
@@ -112,6 +630,7 @@ def get_logger():
     # Create a Logger object and set log level
     logger = logging.getLogger(__name__)
     logger.setLevel(logging.DEBUG)
+    if logger.handlers: return logger    # Already configured by an earlier invocation
 
     # Create a handler to console and set level
     console_handler = logging.StreamHandler()
@@ -126,76 +645,97 @@ def get_logger():
     # Return logger
     return logger
 
-def locate_processing_files(dataset_dict, logger):
-    """Locate quicklook and refined processing files for each dataset.
+def generate_reports(dataset_dict, engine, workers, debug, logger, checkpoints=None, date_range=None, 
+                     completed=None, on_report=None, counters=None, granules=None, events=None):
+    """Generate reports for every dataset, processing type and unique id 
+    concurrently.
     
-    Modifies dataset_dict to set each key with list of appropriate processing
-    files.
+    Reports are generated on a bounded pool of worker threads. Every report is
+    allowed to finish before any failures are reported so that a single 
+    failure does not leave the batch partially processed.
     
     Parameters
     ----------
     dataset_dict: dict
-        dictionary of 'aqua', 'terra' and 'viirs' keys with quicklook and refined.
+        dictionary of dataset keys with quicklook and refined unique ids.
+    engine: str
+        "python", "perl" or "compare".
+    workers: int
+        Maximum number of reports to generate at the same time.
+    logger: Logger 
+        Logger object to log status.
+    checkpoints: dict
+        Dictionary of checkpoint key and state to resume counting from.
+    date_range: tuple
+        First and last day of a backfill report.
+    completed: dict
+        Reports recorded by a previous run keyed by dataset, processing type
+        and unique id, which are not generated again.
+    on_report: function
+        Called with the dataset, processing type, unique id and report of 
+        each report as it is generated.
+    counters: DistinctCounters
+        Distinct granule counters the granules of each processing log are 
+        added to.
+    granules: GranuleRuns
+        Runs the granule names of each processing log and registry are 
+        collected into for reconciliation.
+    events: EventParts
+        Parts the granule events of each processing log and registry are 
+        collected into for the sidecar.
+        
+    Returns
+    -------
+    dict
+        Dictionary of dataset keys with quicklook and refined lists of reports
+        in the same order as the unique ids in dataset_dict.
     """
     
-    # Registry files
-    total_reports = 0
-    for dataset in dataset_dict.keys():
-        refined_processing_files = glob.glob(f"{str(DATA_DIR.joinpath('scratch'))}/*{dataset}*refined*.dat")
-        if len(refined_processing_files) != 0:
-            unique_ids = [ processing_file.split('_')[-1].split('.')[0] for processing_file in refined_processing_files ]
-            dataset_dict[dataset]["refined"] = unique_ids
-            total_reports += len(unique_ids)
-            logger.info(f"Found {len(unique_ids)} refined registry files for dataset: {dataset.upper()}.")
-        quicklook_processing_files = glob.glob(f"{str(DATA_DIR.joinpath('scratch'))}/*{dataset}*quicklook*.dat")
-        if len(quicklook_processing_files) != 0:
-            unique_ids = [ processing_file.split('_')[-1].split('.')[0] for processing_file in quicklook_processing_files ]
-            dataset_dict[dataset]["quicklook"] = unique_ids
-            total_reports += len(unique_ids)
-            logger.info(f"Found {len(unique_ids)} quicklook registry files for dataset: {dataset.upper()}.")
-    
-    # Handle cases where there is an empty registry and no processing log        
-    for dataset, ptype_dict in dataset_dict.items():
-        for unique_ids in ptype_dict.values():
-            for unique_id in unique_ids:
-                plog = DATA_DIR.joinpath('logs', 'processing_logs', f"ghrsst_{dataset}_processing_log_archive_{unique_id}.txt")
-                if not plog.exists(): plog.touch()
-                
-    
-    # Processing logs
-    for dataset in dataset_dict.keys():
-        processing_files = glob.glob(f"{str(DATA_DIR.joinpath('logs', 'processing_logs'))}/ghrsst_{dataset}_processing_log_archive_*.txt")
-        qplog = 0
-        rplog = 0
-        if len(processing_files) != 0:
-            for processing_file in processing_files:
-                with open(processing_file) as fh:
-                    data = fh.read().splitlines()
-                    if len(data) > 0:
-                        if "QUICKLOOK" in data[0]:
-                            qplog += 1
-                            unique_id = processing_file.split('_')[-1].split('.')[0]
-                            if unique_id not in dataset_dict[dataset]["quicklook"]:
-                                dataset_dict[dataset]["quicklook"].append(unique_id)
-                                total_reports += 1
-                                logger.info(f"Found quicklook processing log for dataset with no corresponding registry file: {processing_file}.")
-                                plog = DATA_DIR.joinpath('scratch', f"ghrsst_master_{dataset}_quicklook_list_processed_files_{unique_id}.dat")
-                                if not plog.exists(): plog.touch()
-                        else:
-                            rplog += 1
-                            unique_id = processing_file.split('_')[-1].split('.')[0]
-                            if unique_id not in dataset_dict[dataset]["refined"]:
-                                dataset_dict[dataset]["refined"].append(unique_id)
-                                total_reports += 1
-                                logger.info(f"Found refined processing log for dataset with no corresponding registry file: {processing_file}.")
-                                plog = DATA_DIR.joinpath('scratch', f"ghrsst_master_{dataset}_refined_list_processed_files_{unique_id}.dat")
-                                if not plog.exists(): plog.touch()
-        logger.info(f"Found {rplog} refined processing logs for dataset: {dataset.upper()}.")
-        logger.info(f"Found {qplog} quicklook processing logs for dataset: {dataset.upper()}.")
-
-    return total_reports
+    if checkpoints is None: checkpoints = {}
+    results = dict(completed or {})
+    errors = []
+    tasks = {}
+    for dataset, processing_dict in dataset_dict.items():
+        for processing_type, file_ids in processing_dict.items():
+            for file_id in file_ids:
+                if (dataset, processing_type, file_id) in results: continue
+                checkpoint = checkpoints.get(get_checkpoint_key(dataset, processing_type, file_id))
+                counter = counters.get(dataset, processing_type) if counters else None
+                names = granules.collectors(dataset, processing_type, file_id) if granules else None
+                rows = events.collectors(dataset, processing_type, file_id) if events else None
+                tasks[(dataset, processing_type, file_id)] = (dataset, processing_type, file_id, engine, debug, logger, checkpoint, date_range, counter, 
+                                                              names, rows)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) if workers > 1 else contextlib.nullcontext() as executor:
+        if executor is None:
+            # One worker generates the reports on the calling thread
+            outcomes = ( (key, functools.partial(generate_report, *args)) for key, args in tasks.items() )
+        else:
+            futures = { executor.submit(generate_report, *args): key for key, args in tasks.items() }
+            outcomes = ( (futures[future], future.result) for future in concurrent.futures.as_completed(futures) )
+        for (dataset, processing_type, file_id), get_result in outcomes:
+            try:
+                results[(dataset, processing_type, file_id)] = get_result()
+                if on_report: on_report(dataset, processing_type, file_id, results[(dataset, processing_type, file_id)])
+            except ReportError as e:
+                errors.append(e)
+            except Exception as e:
+                errors.append(ReportError(f"Error encountered creating report for {dataset.upper()} {processing_type.upper()} unique id: {file_id}.", f"Error - {e}"))
+    
+    if len(errors) != 0:
+        for error in errors[1:]: logger.error(f"{error.sigevent_description} {error.sigevent_data}")
+        sigevent_description = f"{len(errors)} of {len(tasks)} daily reports could not be created. {errors[0].sigevent_description}"
+        handle_error(sigevent_description, errors[0].sigevent_data, logger)
+    
+    report_dict = {}
+    for dataset, processing_dict in dataset_dict.items():
+        report_dict[dataset] = {}
+        for processing_type, file_ids in processing_dict.items():
+            reports = [ results[(dataset, processing_type, file_id)] for file_id in file_ids ]
+            report_dict[dataset][processing_type] = [ report for report in reports if report is not None ]
+    return report_dict
             
-def generate_report(dataset, processing_type, file_ids, debug, logger):
+def generate_report(dataset, processing_type, file_id, engine, debug, logger, checkpoint=None, date_range=None, counter=None, granules=None, 
+                    events=None):
     """Generate report for the dataset using associated files.
     
     Parameters
@@ -204,35 +744,95 @@ def generate_report(dataset, processing_type, file_ids, debug, logger):
         "modis_a", "modis_t", "viirs"
     processing_type: str
         "quicklook" or "refined"
-    file_ids: list
-        List of processing file ids to generate a report from.
+    file_id: str
+        Processing file id to generate a report from.
+    engine: str
+        "python" to generate reports in-process, "perl" to run the report 
+        scripts or "compare" to run both and log any differences.
     logger: Logger 
         Logger object to log status.
+    checkpoint: dict
+        Processing log and registry state to resume counting from.
+    date_range: tuple
+        First and last day of a backfill report.
+    counter: DistinctCounter
+        Distinct granule counter of the dataset and processing type.
+    granules: tuple
+        Collectors of the granule names of the processing log and registry.
+    events: tuple
+        Collectors of the granule events of the processing log and registry.
+        
+    Returns
+    -------
+    dict
+        Report dictionary or None if the Perl report was empty.
+        
+    Raises
+    ------
+    ReportError
+        If the report could not be created.
     """
     
-    for file_id in file_ids:
-        lambda_task_root = os.getenv('LAMBDA_TASK_ROOT')
-        try:
-            if debug:
-                logger.info(f"Creating report for {dataset.upper()} from unique id: {file_id}.")
-            if dataset == "modis_a" or dataset == "modis_t":
-                completed_process = subprocess.run([f"{lambda_task_root}/print_modis_daily_report.csh", \
-                    file_id, dataset.upper(), processing_type.upper(), "today"], \
-                    cwd=f"{lambda_task_root}", check=True, capture_output=True, text=True)
-            else:
-                completed_process = subprocess.run([f"{lambda_task_root}/print_generic_daily_report.csh", \
-                    file_id, dataset.upper(), processing_type.upper(), "today"], \
-                    cwd=f"{lambda_task_root}", check=True, capture_output=True, text=True) 
-            if debug:
-                console_out = completed_process.stdout.splitlines()
-                for line in console_out: logger.info(line)       
-        except subprocess.CalledProcessError as e:
-            error_msg = e.stderr
-            sigevent_description = error_msg if len(error_msg) != 0 else "Error encountered in print_generic_daily_report.csh"
-            sigevent_data = f"Subprocess Run command: {e.cmd}"
-            handle_error(sigevent_description, sigevent_data, logger)
-    
-def combine_dataset_reports(dataset, processing_type, file_ids, dataset_email, l2p_dict, debug, logger):
+    if debug:
+        logger.info(f"Creating report for {dataset.upper()} from unique id: {file_id}.")
+    with recorder.phase("report_generation", dataset, processing_type):
+        if engine == "perl":
+            return run_perl_report(dataset, processing_type, file_id, debug, logger)
+        if date_range:
+            report = generate_backfill_report(DATA_DIR, dataset, processing_type, file_id, *date_range)
+            recorder.add("report_generation", dataset, processing_type, files=2, bytes_read=report["bytes_read"])
+            return report
+        latency = load_columns(DATA_DIR, get_checkpoint_key(dataset, processing_type, file_id)) if checkpoint else None
+        report = generate_daily_report(DATA_DIR, dataset, processing_type, file_id, checkpoint=checkpoint, latency=latency, counter=counter,
+                                       granules=granules, events=events)
+        recorder.add("report_generation", dataset, processing_type, files=2, bytes_read=report["bytes_read"])
+        if engine == "compare":
+            compare_reports(report, run_perl_report(dataset, processing_type, file_id, debug, logger), logger)
+        return report
+
+def run_perl_report(dataset, processing_type, file_id, debug, logger):
+    """Run Perl report scripts and read the report they write to the EFS."""
+    
+    lambda_task_root = os.getenv('LAMBDA_TASK_ROOT')
+    recorder.add("report_generation", dataset, processing_type, files=2, subprocesses=1)
+    try:
+        if dataset == "modis_a" or dataset == "modis_t":
+            completed_process = subprocess.run([f"{lambda_task_root}/print_modis_daily_report.csh", \
+                file_id, dataset.upper(), processing_type.upper(), "today"], \
+                cwd=f"{lambda_task_root}", check=True, capture_output=True, text=True)
+        else:
+            completed_process = subprocess.run([f"{lambda_task_root}/print_generic_daily_report.csh", \
+                file_id, dataset.upper(), processing_type.upper(), "today"], \
+                cwd=f"{lambda_task_root}", check=True, capture_output=True, text=True) 
+        if debug:
+            console_out = completed_process.stdout.splitlines()
+            for line in console_out: logger.info(line)       
+    except subprocess.CalledProcessError as e:
+        error_msg = e.stderr
+        sigevent_description = error_msg if len(error_msg) != 0 else "Error encountered in print_generic_daily_report.csh"
+        sigevent_data = f"Subprocess Run command: {e.cmd}"
+        raise ReportError(sigevent_description, sigevent_data)
+    
+    report_name = DATA_DIR.joinpath("scratch", "reports", f"daily_report_{dataset.upper()}_{processing_type.upper()}_{file_id}.txt")
+    if not report_name.exists():
+        sigevent_data = f"Cannot locate daily report created by reporter subprocess command: {report_name}. Final combined report cannot be created."
+        sigevent_description = f"Cannot locate daily report: {report_name}."
+        raise ReportError(sigevent_description, sigevent_data)
+    report = read_report_file(report_name, file_id)
+    if debug: logger.info(f"Read and processed report: {report_name}.")
+    return report
+
+def compare_reports(report, perl_report, logger):
+    """Log any differences in counts between in-process and Perl reports."""
+    
+    if perl_report is None:
+        logger.info(f"Perl report for unique id: {report['unique_id']} is empty.")
+        return
+    for key in ("product", "num_files_processed", "num_files_registry"):
+        if report[key] != perl_report[key]:
+            logger.info(f"Report mismatch for unique id: {report['unique_id']} - {key}: python={report[key]}, perl={perl_report[key]}.")
+    
+def combine_dataset_reports(dataset, processing_type, reports, dataset_email, l2p_dict, debug, logger, counter=None):
     """Combine reports produced for a single dataset.
     
     Parameters
@@ -241,39 +841,32 @@ def combine_dataset_reports(dataset, processing_type, file_ids, dataset_email, l
         "modis_a", "modis_t", "viirs"
     processing_type: str
         "quicklook" or "refined"
-    file_ids: list
-        List of processing file ids to generate a report from.
+    reports: list
+        List of report dictionaries produced by generate_report.
     dataset_email: dict
         Dictionary to store email message alongside dataset.
+    l2p_dict: dict
+        Dictionary to store granule counts and latency for the final log.
+    counter: DistinctCounter
+        Distinct granule counter the processing logs of the reports were 
+        hashed into.
     """
     
-    # Create reports directory if it does not exist
-    report_dir = DATA_DIR.joinpath("scratch", "reports")
-    report_dir.mkdir(parents=True, exist_ok=True)
-    
     # Locate refined reports and create email
     num_files_processed = 0
     num_files_registry = 0
     
-    for file_id in file_ids:
-        report_name = report_dir.joinpath(f"daily_report_{dataset.upper()}_{processing_type.upper()}_{file_id}.txt")    
-        if report_name.exists():
-            with open(report_name) as fh:
-                report_lines = fh.read().splitlines()
-                
-            if len(report_lines) != 0:
-                # Beginning of report
-                if dataset_email[dataset][processing_type] == "":
-                    dataset_email[dataset][processing_type] += report_lines[1] + "\n" + report_lines[2] + "\n" + report_lines[5] + "\n"
-                num_files_processed += int(report_lines[6].split(": ")[1].split(',')[0])
-                num_files_registry += int(report_lines[7].split(": ")[1].split(',')[0])
-            if debug: logger.info(f"Read and processed report: {report_name}.")
-        else:
-            sigevent_data = f"Cannot locate daily report created by reporter subprocess command: {report_name}. Final combined report cannot be created."
-            sigevent_description = f"Cannot locate daily report: {report_name}."
-            handle_error(sigevent_description, sigevent_data, logger)
+    for report in reports:
+        # Beginning of report
+        if dataset_email[dataset][processing_type] == "":
+            dataset_email[dataset][processing_type] += "==========================================================================================\n"
+            dataset_email[dataset][processing_type] += f"Product: {report['product']}\n"
+            dataset_email[dataset][processing_type] += f"Date_printed: {report['date_printed']}\n"
+        num_files_processed += report["num_files_processed"]
+        num_files_registry += report["num_files_registry"]
+        if debug: logger.info(f"Combined report for unique id: {report['unique_id']}.")
     
-    if len(file_ids) == 0:    # No reports produced for dataset/processing type
+    if len(reports) == 0:    # No reports produced for dataset/processing type
         date_printed = datetime.datetime.now(datetime.timezone.utc).strftime("%a %b %d %H:%M:%S %Y")
         dataset_email[dataset][processing_type] += "==========================================================================================\n"
         dataset_email[dataset][processing_type] += f"Product: list of {processing_type.upper()} {dataset.upper()} L2P files processed\n"
@@ -283,6 +876,15 @@ def combine_dataset_reports(dataset, processing_type, file_ids, dataset_email, l
     dataset_email[dataset][processing_type] += f"Number of files processed from logs: {num_files_processed}, extracted from processing logs: ghrsst_{dataset}_processing_log_archive_*.txt\n"
     dataset_email[dataset][processing_type] += f"Number of files processed from registry: {num_files_registry}, extracted from registry: ghrsst_master_{dataset}_*_list_processed_files_*.dat\n"
     
+    # Record distinct granules across unique ids and granule latency and 
+    # throughput from the processing logs
+    distinct_stats = None
+    if counter is not None and any("granule_events" in report for report in reports):
+        distinct_stats = count_distinct(counter, sum(report.get("granule_events", 0) for report in reports))
+    if distinct_stats: dataset_email[dataset][processing_type] += format_distinct(distinct_stats)
+    latency_stats = compute_latency_stats(reports)
+    if latency_stats: dataset_email[dataset][processing_type] += format_latency_stats(latency_stats)
+    
     if dataset == "modis_a":
         ds1 = "MODIS Aqua"
         ds2 = "aqua"
@@ -299,29 +901,85 @@ def combine_dataset_reports(dataset, processing_type, file_ids, dataset_email, l
         logger.info(f"{ds1} {processing_type.upper()} registry granules: {num_files_registry}")
     
     l2p_dict[f"{ds2}_{processing_type.lower()}_l2p"] = num_files_processed
+    if distinct_stats:
+        if distinct_stats["distinct"] != distinct_stats["events"]:
+            logger.info(f"{ds1} {processing_type.upper()} distinct L2P granules: {distinct_stats['distinct']} of {distinct_stats['events']} events{'' if distinct_stats['exact'] else ' (Bloom filter estimate)'}")
+        l2p_dict[f"{ds2}_{processing_type.lower()}_distinct"] = distinct_stats["distinct"]
+        l2p_dict[f"{ds2}_{processing_type.lower()}_dup_rate"] = round(distinct_stats["duplicate_rate"], 4)
+    if latency_stats:
+        logger.info(f"{ds1} {processing_type.upper()} latency p50: {latency_stats['p50']:.2f}s, p95: {latency_stats['p95']:.2f}s, p99: {latency_stats['p99']:.2f}s, max: {latency_stats['max']:.2f}s, slow granules: {latency_stats['num_outliers']}")
+        for key in ("p50", "p95", "p99", "max"):
+            l2p_dict[f"{ds2}_{processing_type.lower()}_{key}"] = round(latency_stats[key], 2)
+        l2p_dict[f"{ds2}_{processing_type.lower()}_per_hour"] = round(latency_stats["throughput_per_hour"], 1)
+        l2p_dict[f"{ds2}_{processing_type.lower()}_slow"] = latency_stats["num_outliers"]
+
+def combine_backfill_reports(dataset, processing_type, reports, dataset_email, l2p_dict, date_range, debug, logger):
+    """Combine backfill reports produced for a single dataset into a table 
+    of granules processed on each day of the date range.
+    
+    Parameters
+    ----------
+    dataset: str
+        "modis_a", "modis_t", "viirs"
+    processing_type: str
+        "quicklook" or "refined"
+    reports: list
+        List of report dictionaries produced by generate_report.
+    dataset_email: dict
+        Dictionary to store email message alongside dataset.
+    l2p_dict: dict
+        Dictionary to store granule counts for the final log.
+    date_range: tuple
+        First and last day of the backfill report.
+    """
+    
+    start_day, end_day = date_range
+    days = { (start_day + datetime.timedelta(days=i)).isoformat(): [0, 0] for i in range((end_day - start_day).days + 1) }
+    for report in reports:
+        for day, counts in report["days"].items():
+            days[day][0] += counts["num_files_processed"]
+            days[day][1] += counts["num_files_registry"]
+        if debug: logger.info(f"Combined backfill report for unique id: {report['unique_id']}.")
+    
+    date_printed = datetime.datetime.now(datetime.timezone.utc).strftime("%a %b %d %H:%M:%S %Y")
+    email = "==========================================================================================\n"
+    email += f"Product: list of {processing_type.upper()} {dataset.upper()} L2P files processed from {start_day.isoformat()} to {end_day.isoformat()} (UTC)\n"
+    email += f"Date_printed: {date_printed}\n"
+    email += f"{'Date':<12}{'From logs':>12}{'From registry':>16}\n"
+    for day, (num_files_processed, num_files_registry) in days.items():
+        email += f"{day:<12}{num_files_processed:>12}{num_files_registry:>16}\n"
+    num_files_processed = sum(counts[0] for counts in days.values())
+    num_files_registry = sum(counts[1] for counts in days.values())
+    email += f"{'Total':<12}{num_files_processed:>12}{num_files_registry:>16}\n"
+    dataset_email[dataset][processing_type] += email
+    
+    logger.info(f"{dataset.upper()} {processing_type.upper()} L2P granules processed from {start_day.isoformat()} to {end_day.isoformat()}: {num_files_processed}, registry granules: {num_files_registry}")
+    ds2 = { "modis_a": "aqua", "modis_t": "terra" }.get(dataset, dataset)
+    l2p_dict[f"{ds2}_{processing_type.lower()}_l2p"] = num_files_processed
 
-def publish_report(dataset_email, date, logger):
-    """Publish report to SNS Topic."""
+def publish_report(dataset_email, date, logger, title="Daily"):
+    """Publish report to SNS Topic and return the message and its id."""
+    import botocore.exceptions
     
-    sns = boto3.client("sns")
+    sns = get_client("sns")
     
     # Get topic ARN
     try:
-        topics = sns.list_topics()
+        topic_arn = resolve_topic_arn(TOPIC_STRING, TOPIC_ARN_ENV)
     except botocore.exceptions.ClientError as e:
         sigevent_description = "Failed to list SNS Topics."
         sigevent_data = f"Error - {e}"
         handle_error(sigevent_description, sigevent_data, logger)
-    for topic in topics["Topics"]:
-        if TOPIC_STRING in topic["TopicArn"]:
-            topic_arn = topic["TopicArn"]
+    except TopicNotFoundError as e:
+        sigevent_description = f"Failed to locate SNS Topic: {TOPIC_STRING}."
+        sigevent_data = f"Error - {e}"
+        handle_error(sigevent_description, sigevent_data, logger)
             
     # Publish to topic
     date_str = date.strftime("%a %b %d %H:%M:%S %Y")
-    subject = f"Generate Daily Processing Report {date_str} UTC"
+    subject = f"Generate {title} Processing Report {date_str} UTC"
     # Processing report
     message = f"Generate Processing Report for {date_str} UTC\n\n"
-    line = "==========================================================================================\n"
     for processing_type in dataset_email.values():
         for email in processing_type.values():
             message += email
@@ -337,75 +995,189 @@ def publish_report(dataset_email, date, logger):
         sigevent_data = f"Error - {e}"
         handle_error(sigevent_description, sigevent_data, logger)
     
-    logger.info(f"Daily report published to SNS Topic: {topic_arn}.")   
+    logger.info(f"{title} report published to SNS Topic: {topic_arn}.")   
+    
+    return message, response["MessageId"]
+
+def get_granule_runs(report_day, workers):
+    """Return runs of the granule names counted on the report day, with the 
+    names held in memory split between the workers counting them."""
+    
+    return GranuleRuns(get_granules_dir(DATA_DIR, report_day), max(MAX_SET_SIZE // workers, 1))
+
+def reconcile_processing_files(dataset_dict, date, debug, logger, shard=None, granules=None):
+    """Reconcile granules between each processing log and its registry.
+    
+    Granules found only in a processing log or only in a registry are 
+    written to a reconciliation file so it can be included in the archive. 
+    The names collected while the reports were counted are used if given, 
+    otherwise the processing files are read.
+    
+    Parameters
+    ----------
+    dataset_dict: dict
+        Dictionary of datasets with quicklook and refined unique ids.
+    date: datetime.datetime
+        Date the report is published on.
+    shard: int
+        Shard of a sharded run, added to the name of the reconciliation file.
+    granules: GranuleRuns
+        Runs of the granule names collected while the reports were counted.
+    
+    Returns
+    -------
+    pathlib.Path
+        Path to reconciliation file.
+    dict
+        Dictionary of datasets with quicklook and refined reconciliation 
+        results including the first TOP_DISCREPANCIES.
+    """
+    
+    report_dir = DATA_DIR.joinpath("scratch", "reports")
+    report_dir.mkdir(parents=True, exist_ok=True)
+    shard_suffix = f"_shard_{shard:03d}" if shard is not None else ""
+    reconciliation_txt = report_dir.joinpath(f"reconciliation_{date.strftime('%Y%m%d')}{shard_suffix}.txt")
+    date_token, year_token = get_search_tokens()
+    results = {}
+    with open(reconciliation_txt, 'w') as fh:
+        fh.write("dataset,processing_type,unique_id,side,granule\n")
+        for dataset, processing_dict in dataset_dict.items():
+            results[dataset] = {}
+            for processing_type, file_ids in processing_dict.items():
+                result = reconcile_dataset(DATA_DIR, dataset, processing_type, file_ids, date_token, year_token, fh, TOP_DISCREPANCIES, granules)
+                results[dataset][processing_type] = result
+                if result["only_log"] or result["only_registry"]:
+                    logger.info(f"{dataset.upper()} {processing_type.upper()} granules only in processing logs: {result['only_log']}, only in registry: {result['only_registry']}.")
+                elif debug:
+                    logger.info(f"{dataset.upper()} {processing_type.upper()} processing logs and registries reconciled.")
+    logger.info(f"Wrote reconciliation of processing logs and registries to: {reconciliation_txt}.")
+    return reconciliation_txt, results
+
+def add_reconciliation(dataset_email, results):
+    """Add reconciliation results to each dataset's email."""
     
-    return message
+    for dataset, processing_dict in results.items():
+        for processing_type, result in processing_dict.items():
+            dataset_email[dataset][processing_type] += format_reconciliation(result)
 
 def write_message_txt(message, date):
     """Write message to file so it can be included in archive."""
     
     date_str = date.strftime("%Y%m%d")
-    message_txt = DATA_DIR.joinpath("scratch", "reports", f"daily_report_{date_str}.txt")
+    report_dir = DATA_DIR.joinpath("scratch", "reports")
+    report_dir.mkdir(parents=True, exist_ok=True)
+    message_txt = report_dir.joinpath(f"daily_report_{date_str}.txt")
     with open(message_txt, 'w') as fh:
         fh.write(message)
     return message_txt
     
-def remove_processing_files(dataset_dict, daily_report, debug, logger):
-    """Compress and remove logs (txt) and registry (dat) processing files."""
+def archive_processing_files(prefix, file_list, report_files, compression, compression_level, workers, debug, logger):
+    """Stream archive of processing files and report files to S3 bucket.
     
-    # Generate list of processing files
-    processing = DATA_DIR.joinpath("logs", "processing_logs")
-    registry = DATA_DIR.joinpath("scratch")
-    file_list = []
-    for dataset, processing_dict in dataset_dict.items():
-        for processing_type, file_ids in processing_dict.items():
-            for file_id in file_ids:
-                processing_file = processing.joinpath(f"ghrsst_{dataset}_processing_log_archive_{file_id}.txt")
-                if processing_file.exists(): file_list.append(processing_file)
-                registry_file = registry.joinpath(f"ghrsst_master_{dataset}_{processing_type}_list_processed_files_{file_id}.dat")
-                if registry_file.exists(): file_list.append(registry_file)
-                
-    if len(file_list) > 0:
-        # Compress list
-        archive_dir = DATA_DIR.joinpath("scratch", "reports", "archive")
-        archive_dir.mkdir(parents=True, exist_ok=True)
-        today = datetime.datetime.now().strftime("%Y%m%d")
-        zip_file = archive_dir.joinpath(f"{today}_daily_report_files.zip")
-        with zipfile.ZipFile(zip_file, mode='w') as archive:
-            for file in file_list: archive.write(file, arcname=file.name)
-            archive.write(daily_report, arcname=daily_report.name)    # Include daily report that was generated
-        logger.info(f"Archive of processing files written to: {zip_file}")
-            
-        # Delete all files in list
-        logger.info("Removing processing files from EFS as they have been archived.")
-        for file in file_list: 
-            file.unlink()
-            if debug: logger.info(f"Deleted: {file}.")
-            
-        return zip_file
+    The archive is written straight into a multipart upload and verified 
+    against the part checksums and a manifest of entries before returning.
     
-    else:
+    Parameters
+    ----------
+    prefix: str
+        S3 bucket to upload archive to.
+    file_list: list
+        List of processing files to archive.
+    report_files: list
+        Daily report and reconciliation files to include in the archive.
+    compression: str
+        "stored", "deflate", "bzip2", "lzma" or "zstd" if available.
+    compression_level: int
+        Compression level or None for the compressor default.
+    workers: int
+        Number of archive entries to compress at the same time.
+    
+    Returns
+    -------
+    str
+        S3 key of the archive uploaded and verified or None if there were no
+        processing files to archive.
+    """
+    import botocore.exceptions
+    
+    if len(file_list) == 0:
         logger.info("No processing files to archive or remove from the EFS.")
         return None
-
-def upload_archive(prefix, zipped, debug, logger):
-    """Uploaded archived quarantine files to S3 bucket and then delete zip from 
-    file system."""
     
-    year = datetime.datetime.now().year
+    today = datetime.datetime.now()
+    key = f"archive/reporter/{today.year}/{today.strftime('%Y%m%d')}_daily_report_files.zip"
     try:
-        s3 = boto3.client("s3")
-        
-        # Upload file to S3
-        s3.upload_file(str(zipped), prefix, f"archive/reporter/{year}/{zipped.name}", ExtraArgs={"ServerSideEncryption": "aws:kms"})
-        logger.info(f"Uploaded: s3://{prefix}/archive/reporter/{year}/{zipped.name}.")
-        
-        # Delete file from EFS
-        zipped.unlink()
-        if debug: logger.info(f"File deleted: {zipped}.")
-            
+        s3 = get_client("s3")
+        upload = upload_archive(s3, prefix, key, file_list + report_files, 
+                                extra_args={"ServerSideEncryption": "aws:kms"}, compression=compression,
+                                compresslevel=compression_level, workers=workers)
     except botocore.exceptions.ClientError as e:
-        sigevent_description = f"Error encountered uploading zip files to: s3://{prefix}/archive/{year}/."
+        sigevent_description = f"Error encountered uploading zip files to: s3://{prefix}/archive/reporter/{today.year}/."
+        sigevent_data = f"Error - {e}"
+        handle_error(sigevent_description, sigevent_data, logger)
+    except ArchiveError as e:
+        sigevent_description = f"Could not verify archive uploaded to: s3://{prefix}/{key}. Processing files have not been removed."
+        sigevent_data = f"Error - {e}"
+        handle_error(sigevent_description, sigevent_data, logger)
+    
+    recorder.add("archiving", files=len(upload["manifest"]), bytes_written=upload["size"],
+                 bytes_read=sum(entry["size"] for entry in upload["manifest"]))
+    logger.info(f"Uploaded: s3://{prefix}/{key} ({compression} compression, {upload['size']} bytes).")
+    if debug: logger.info(f"Verified {len(upload['manifest'])} archive entries, {upload['size']} bytes in {upload['parts']} parts.")
+    return key
+
+def write_event_sidecar(prefix, dataset_dict, date, logger):
+    """Write Parquet sidecar of granule events next to the archive.
+    
+    The zip archive remains the record of the processing files so a sidecar 
+    that cannot be written is logged and does not stop the run. Events are 
+    read from the parts collected while the reports were counted and 
+    streamed to the sidecar in batches so memory does not grow with the 
+    size of the processing files.
+    
+    Returns
+    -------
+    dict
+        Rows, bytes and keys written or None if the sidecar was not written.
+    """
+    import botocore.exceptions
+    
+    try:
+        result = write_events(get_client("s3"), prefix, DATA_DIR, dataset_dict, date,
+                              extra_args={"ServerSideEncryption": "aws:kms"}, parts=EventParts(DATA_DIR))
+    except (SidecarError, OSError, botocore.exceptions.ClientError) as e:
+        logger.error(f"Could not write Parquet sidecar of granule events to: s3://{prefix}/{EVENTS_PREFIX}/ - {e}")
+        return None
+    recorder.add("sidecar", files=len(result["keys"]), bytes_written=result["bytes"])
+    logger.info(f"Wrote {result['rows']} granule events to {len(result['keys'])} Parquet partitions in: s3://{prefix}/{EVENTS_PREFIX}/.")
+    return result
+
+def remove_processing_files(file_list, debug, logger):
+    """Remove logs (txt) and registry (dat) processing files found during 
+    discovery and return the number deleted and already missing."""
+    
+    logger.info("Removing processing files from EFS as they have been archived.")
+    result = remove_files(file_list, 1 if profiling.is_set() else CLEANUP_WORKERS)
+    report_cleanup(result, "processing files", debug, logger)
+    return result
+    
+def remove_reports_directory(debug, logger):
+    """Remove reports directory and the reports written to it."""
+    
+    reports_dir = DATA_DIR.joinpath("scratch", "reports")
+    result = remove_directory(reports_dir, 1 if profiling.is_set() else CLEANUP_WORKERS)
+    report_cleanup(result, f"reports directory {reports_dir}", debug, logger)
+    
+def report_cleanup(result, description, debug, logger):
+    """Log and record files removed and handle any that could not be."""
+    
+    recorder.add("deletion", files=result["deleted"])
+    if debug:
+        for path, e in result["errors"]: logger.info(f"Could not delete: {path} - {e}.")
+    logger.info(f"Removed {description} - deleted: {result['deleted']}, already missing: {result['missing']}, errors: {len(result['errors'])} in {result['seconds']:.3f} seconds.")
+    if len(result["errors"]) != 0:
+        path, e = result["errors"][0]
+        sigevent_description = f"Could not delete {len(result['errors'])} entries of {description}, including: {path}."
         sigevent_data = f"Error - {e}"
         handle_error(sigevent_description, sigevent_data, logger)
 
@@ -415,16 +1187,17 @@ def handle_error(sigevent_description, sigevent_data, logger):
     sigevent_type = "ERROR"
     logger.info(sigevent_description)
     logger.error(sigevent_data)
+    recorder.emit("error")
     notify(logger, sigevent_type, sigevent_description, sigevent_data)
     logger.info("Program exit.")
     sys.exit(1)
 
-def print_final_log(logger, l2p_dict):
+def print_final_log(logger, l2p_dict, label="final_log"):
     """Print final log message."""
     
     # Organize file data into a string
     final_log_message = [ f"{key}: {value}" for key,value in l2p_dict.items() ]
-    final_log_message = "final_log: " + " - ".join(final_log_message)
+    final_log_message = f"{label}: " + " - ".join(final_log_message)
     
     # Print final log message and remove temp log file
     logger.info(final_log_message)
@@ -0,0 +1,380 @@
+"""Fan-out and fan-in of the daily report over shards of unique ids.
+
+A coordinator run discovers the unique ids, partitions them into shards and
+writes a plan before invoking one worker run per shard. Each worker
+generates and reconciles the reports of its shard and writes a partial
+result JSON. The worker that writes the last partial claims the merge,
+which combines the partials into the single email, final log and archive.
+
+Partials carry the reports of the shard and the state of its distinct
+granule counters, which the merge combines.
+
+Plans and partials are stored under a run directory on the EFS or in S3:
+
+    <root>/<run_id>/plan.json
+    <root>/<run_id>/shard_<NNN>.json
+    <root>/<run_id>/merge.lock
+
+The merge keeps the journal of its phases in the run directory on the EFS
+and removes it, the run directory and the root once it has completed.
+
+The merge is claimed with an exclusive create of the lock file on the EFS,
+which every worker mounts to read the processing files, so exactly one
+worker invokes it whichever store holds the partials.
+
+Runs are invoked asynchronously through Lambda or, for local runs, queued on
+an in-process executor that calls the handler once the current run returns.
+"""
+
+# Standard imports
+import base64
+import collections
+import json
+import os
+import pathlib
+import uuid
+
+# Third-party imports
+import numpy as np
+
+# Local imports
+from clients import get_client
+
+# Constants
+SHARD_PREFIX = "scratch/reporter/shards"
+SHARD_DIR = pathlib.Path("scratch", "shards")
+JOURNAL_DIR = "journal"
+PLAN_NAME = "plan.json"
+LOCK_NAME = "merge.lock"
+EXECUTORS = ("lambda", "local")
+STORES = ("efs", "s3")
+
+# Module state reused across nested local invocations
+_executors = {}
+
+class ShardError(Exception):
+    """Raised when a plan or partial result cannot be read or written."""
+
+def get_partial_name(shard):
+    """Return name of the partial result of a shard."""
+
+    return f"shard_{shard:03d}.json"
+
+def claim_file(path):
+    """Create path if it does not exist and return True if this call
+    created it."""
+
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    os.close(fd)
+    return True
+
+def create_run_id(date):
+    """Return identifier of a sharded run started at date."""
+
+    return f"{date.strftime('%Y%m%dT%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+class LocalShardStore:
+    """Plan and partial results stored in a run directory on the EFS."""
+
+    def __init__(self, root, run_id):
+        self.directory = pathlib.Path(root).joinpath(run_id)
+
+    def describe(self):
+        """Return location of the run directory for log messages."""
+
+        return str(self.directory)
+
+    def write(self, name, data):
+        """Write JSON data to name, replacing any previous version."""
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temp_file = self.directory.joinpath(f"{name}.tmp")
+        temp_file.write_text(json.dumps(data))
+        temp_file.replace(self.directory.joinpath(name))
+
+    def read(self, name):
+        """Return JSON data of name.
+
+        Raises
+        ------
+        ShardError
+            If name does not exist or is not valid JSON.
+        """
+
+        try:
+            return json.loads(self.directory.joinpath(name).read_text())
+        except (FileNotFoundError, ValueError) as e:
+            raise ShardError(f"Could not read {self.directory.joinpath(name)} - {e}.")
+
+    def list(self):
+        """Return names stored in the run directory."""
+
+        try:
+            return sorted(entry.name for entry in os.scandir(self.directory))
+        except FileNotFoundError:
+            return []
+
+    def claim(self, name):
+        """Create name if it does not exist and return True if this call
+        created it."""
+
+        return claim_file(self.directory.joinpath(name))
+
+    def remove(self):
+        """Remove the files of the run directory, then the run directory and
+        the root unless a journal or another run is left in them."""
+
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if not entry.is_dir(follow_symlinks=False): os.unlink(entry.path)
+        except FileNotFoundError:
+            pass
+        remove_run_directory(self.directory)
+
+class S3ShardStore:
+    """Plan and partial results stored under a run prefix in S3 with the
+    merge lock in a run directory on the EFS."""
+
+    def __init__(self, s3, bucket, run_id, lock_root, prefix=SHARD_PREFIX, extra_args=None):
+        self.s3 = s3
+        self.bucket = bucket
+        self.prefix = f"{prefix}/{run_id}"
+        self.lock_directory = pathlib.Path(lock_root).joinpath(run_id)
+        self.extra_args = extra_args or {}
+
+    def describe(self):
+        """Return location of the run prefix for log messages."""
+
+        return f"s3://{self.bucket}/{self.prefix}/"
+
+    def write(self, name, data):
+        """Write JSON data to name, replacing any previous version."""
+
+        self.s3.put_object(Bucket=self.bucket, Key=f"{self.prefix}/{name}",
+                           Body=json.dumps(data).encode(), **self.extra_args)
+
+    def read(self, name):
+        """Return JSON data of name.
+
+        Raises
+        ------
+        ShardError
+            If name does not exist or is not valid JSON.
+        """
+
+        import botocore.exceptions
+        try:
+            response = self.s3.get_object(Bucket=self.bucket, Key=f"{self.prefix}/{name}")
+            return json.loads(response["Body"].read())
+        except (botocore.exceptions.ClientError, ValueError) as e:
+            raise ShardError(f"Could not read s3://{self.bucket}/{self.prefix}/{name} - {e}.")
+
+    def list(self):
+        """Return names stored under the run prefix."""
+
+        names = []
+        paginator = self.s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{self.prefix}/"):
+            names.extend(obj["Key"][len(self.prefix) + 1:] for obj in page.get("Contents", []))
+        return sorted(names)
+
+    def claim(self, name):
+        """Create name if it does not exist and return True if this call
+        created it."""
+
+        self.lock_directory.mkdir(parents=True, exist_ok=True)
+        return claim_file(self.lock_directory.joinpath(name))
+
+    def remove(self):
+        """Remove every object under the run prefix and the lock directory."""
+
+        for name in self.list():
+            self.s3.delete_object(Bucket=self.bucket, Key=f"{self.prefix}/{name}")
+        LocalShardStore(self.lock_directory.parent, self.lock_directory.name).remove()
+
+def remove_run_directory(directory):
+    """Remove the run directory and the root it is in once they are empty."""
+
+    for path in (directory, directory.parent):
+        try:
+            path.rmdir()
+        except FileNotFoundError:
+            pass
+        except OSError:
+            return    # Not empty
+
+def partition_ids(dataset_dict, num_shards):
+    """Partition unique ids into at most num_shards shards.
+
+    Ids are dealt out in turn so each shard gets a share of every dataset and
+    processing type, keeping the order of the ids within each shard.
+
+    Returns
+    -------
+    list
+        Dictionary of datasets with quicklook and refined unique ids for
+        each shard that has at least one id, or a single empty shard if
+        there are no ids.
+    """
+
+    shards = [ { dataset: { processing_type: [] for processing_type in processing_dict }
+                 for dataset, processing_dict in dataset_dict.items() } for _ in range(num_shards) ]
+    index = 0
+    for dataset, processing_dict in dataset_dict.items():
+        for processing_type, file_ids in processing_dict.items():
+            for file_id in file_ids:
+                shards[index % num_shards][dataset][processing_type].append(file_id)
+                index += 1
+    return shards[:max(min(index, num_shards), 1)]
+
+def count_ids(dataset_dict):
+    """Return number of unique ids in a dictionary of datasets."""
+
+    return sum(len(file_ids) for processing_dict in dataset_dict.values() for file_ids in processing_dict.values())
+
+def encode_columns(columns):
+    """Return dictionary of NumPy arrays encoded so it can be written as
+    JSON."""
+
+    return { name: { "dtype": column.dtype.str, "data": base64.b64encode(column.tobytes()).decode() }
+             for name, column in columns.items() }
+
+def decode_columns(columns):
+    """Return dictionary of NumPy arrays read from JSON."""
+
+    return { name: np.frombuffer(base64.b64decode(column["data"]), dtype=column["dtype"])
+             for name, column in columns.items() }
+
+def encode_report(report):
+    """Return report with latency columns encoded so it can be written as
+    JSON."""
+
+    report = dict(report)
+    if report.get("latency"): report["latency"] = encode_columns(report["latency"])
+    return report
+
+def decode_report(report):
+    """Return report read from JSON with its latency columns decoded."""
+
+    if report.get("latency"): report["latency"] = decode_columns(report["latency"])
+    return report
+
+def merge_partials(plan, partials):
+    """Return reports and reconciliation results of every shard in the order
+    of the unique ids of the plan.
+
+    Parameters
+    ----------
+    plan: dict
+        Plan written by the coordinator.
+    partials: list
+        Partial results written by each worker.
+
+    Returns
+    -------
+    dict
+        Dictionary of datasets with quicklook and refined lists of reports.
+    dict
+        Dictionary of datasets with quicklook and refined lists of
+        reconciliation results, one for each shard.
+    """
+
+    reports = {}
+    reconciliation = {}
+    for partial in partials:
+        for dataset, processing_dict in partial["reports"].items():
+            for processing_type, shard_reports in processing_dict.items():
+                for report in shard_reports:
+                    reports[(dataset, processing_type, report["unique_id"])] = decode_report(report)
+        for dataset, processing_dict in partial["reconciliation"].items():
+            for processing_type, result in processing_dict.items():
+                reconciliation.setdefault(dataset, {}).setdefault(processing_type, []).append(result)
+
+    report_dict = {}
+    for dataset, processing_dict in plan["dataset_dict"].items():
+        report_dict[dataset] = {}
+        for processing_type, file_ids in processing_dict.items():
+            report_dict[dataset][processing_type] = [ reports[(dataset, processing_type, file_id)]
+                                                      for file_id in file_ids if (dataset, processing_type, file_id) in reports ]
+    return report_dict, reconciliation
+
+class InProcessExecutor:
+    """Stand-in for Lambda invocation that runs queued events in-process.
+
+    Events are queued while a run is in progress and handled in order once
+    the outermost run returns, so each invocation runs on its own as it would
+    in Lambda. A run that exits with an error is recorded and does not stop
+    the runs queued after it.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.pending = collections.deque()
+        self.failed = []
+        self.running = False
+
+    def submit(self, event):
+        """Queue event to be handled."""
+
+        self.pending.append(event)
+
+    def drain(self):
+        """Handle queued events, including any they queue, until none are
+        left."""
+
+        if self.running: return
+        self.running = True
+        try:
+            while self.pending:
+                event = self.pending.popleft()
+                try:
+                    self.handler(event, None)
+                except SystemExit:
+                    self.failed.append(event)
+        finally:
+            self.running = False
+
+class LambdaExecutor:
+    """Invoke the Lambda function asynchronously for each event."""
+
+    def __init__(self, lambda_client, function_name):
+        self.lambda_client = lambda_client
+        self.function_name = function_name
+
+    def submit(self, event):
+        """Invoke the function with event without waiting for it to finish.
+
+        Raises
+        ------
+        botocore.exceptions.ClientError
+            If the function could not be invoked.
+        """
+
+        self.lambda_client.invoke(FunctionName=self.function_name, InvocationType="Event",
+                                  Payload=json.dumps(event).encode())
+
+    def drain(self):
+        """Lambda runs each invocation so there is nothing to wait for."""
+
+def get_executor(name, handler):
+    """Return shared executor of name for the handler.
+
+    Parameters
+    ----------
+    name: str
+        "lambda" to invoke the function named by AWS_LAMBDA_FUNCTION_NAME or
+        "local" to run the handler in-process.
+    handler: function
+        Lambda handler called with each event by the local executor.
+    """
+
+    if name not in _executors:
+        if name == "local":
+            _executors[name] = InProcessExecutor(handler)
+        else:
+            _executors[name] = LambdaExecutor(get_client("lambda"), os.getenv("AWS_LAMBDA_FUNCTION_NAME"))
+    return _executors[name]
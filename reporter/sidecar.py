@@ -0,0 +1,462 @@
+"""Columnar Parquet sidecar of granule events for historical queries.
+
+Alongside each zip archive, every processing log and registry line the
+reports count is written as one row of a Parquet dataset with typed columns:
+
+    dataset, processing_type, unique_id, epoch, granule, latency, source
+
+Rows are partitioned by the UTC year and day of their epoch with hive style
+directories so that queries only open the partitions and columns they need:
+
+    s3://<bucket>/archive/reporter/events/year=<YYYY>/day=<YYYY-MM-DD>/<YYYYMMDD>_events.parquet
+
+Lines are matched like the reports match them, with the date left out so
+the lines of every day are kept: successful processing log lines of the
+instrument and data type and registry lines of the instrument.
+
+The rows are collected while the reports count the lines, by an
+EventCollector for each processing file that writes Parquet parts on the EFS
+named by the byte range they cover. Intraday runs and retries that resume
+counting add parts for the lines they read, and a part covering bytes
+already covered by a longer part is skipped. Files whose parts do not cover
+every byte counted from the start, such as those of the Perl engine which
+does not collect events, are read when the sidecar is written.
+
+Rows are read in batches of BATCH_ROWS and each batch is appended to a
+Parquet writer per day in a temporary directory, so memory is bounded by the
+batch size whatever the size of the logs. The day files are uploaded once
+every file has been read.
+
+pyarrow is imported lazily so that modes which do not write or query the
+sidecar do not pay for the import.
+"""
+
+# Standard imports
+import datetime
+import os
+import pathlib
+import shutil
+import tempfile
+import uuid
+
+# Local imports
+from checkpoint import get_checkpoint_key, get_events_dir
+from report_engine import get_processing_log, get_registry, match_processing_log, match_registry
+
+# Constants
+EVENTS_PREFIX = "archive/reporter/events"
+SECONDS_PER_DAY = 86400
+SOURCES = ("processing_log", "registry")
+BATCH_ROWS = 65536
+PART_SUFFIX = ".parquet"
+
+class SidecarError(Exception):
+    """Raised when the sidecar cannot be written or read."""
+
+def import_pyarrow():
+    """Return pyarrow module after importing the submodules used here."""
+
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.dataset
+        import pyarrow.fs
+        import pyarrow.parquet
+    except ImportError as e:
+        raise SidecarError(f"pyarrow is required for the Parquet sidecar - {e}.")
+    return pyarrow
+
+def get_schema(pa):
+    """Return schema of granule event rows."""
+
+    return pa.schema([
+        ("dataset", pa.dictionary(pa.int8(), pa.string())),
+        ("processing_type", pa.dictionary(pa.int8(), pa.string())),
+        ("unique_id", pa.dictionary(pa.int32(), pa.string())),
+        ("epoch", pa.timestamp("s", tz="UTC")),
+        ("granule", pa.string()),
+        ("latency", pa.float64()),
+        ("source", pa.dictionary(pa.int8(), pa.string()))
+    ])
+
+def get_partitioning(pa):
+    """Return hive partitioning of year and ISO format day."""
+
+    return pa.dataset.partitioning(pa.schema([("year", pa.int16()), ("day", pa.string())]), flavor="hive")
+
+def match_events(dataset, processing_type, source):
+    """Return function matching the lines of a processing file the reports
+    count on any day."""
+
+    # Empty date and year tokens are in every line
+    if source == "processing_log": return match_processing_log("", "", dataset.upper(), processing_type.upper())
+    return match_registry("", "", dataset.upper())
+
+class EventRows:
+    """Columns of the granule events of the matching lines of a processing
+    file.
+
+    Lines that do not have an epoch and granule are skipped. Latency is
+    recorded for processing log lines.
+    """
+
+    def __init__(self, dataset, processing_type, unique_id, source):
+        self.dataset = dataset
+        self.processing_type = processing_type
+        self.unique_id = unique_id
+        self.source = source
+        self.match = match_events(dataset, processing_type, source)
+        self.epoch_field, self.granule_field = (0, 2) if source == "processing_log" else (1, 0)
+        self.epochs = []
+        self.granules = []
+        self.latencies = []
+
+    def __len__(self):
+        return len(self.epochs)
+
+    def append(self, line):
+        """Add the granule event of a line if it matches."""
+
+        if not self.match(line): return
+        fields = line.rstrip("\n").split(",")
+        try:
+            epoch = int(fields[self.epoch_field])
+            granule = fields[self.granule_field]
+        except (IndexError, ValueError):
+            return
+        latency = None
+        if self.source == "processing_log":
+            try:
+                latency = float(fields[-1].rsplit(":", 1)[1])
+            except (IndexError, ValueError):
+                pass
+        self.epochs.append(epoch)
+        self.granules.append(granule)
+        self.latencies.append(latency)
+
+    def pop(self):
+        """Return columns of the events held and start a new batch."""
+
+        columns = get_columns(self.dataset, self.processing_type, self.unique_id, self.source,
+                              self.epochs, self.granules, self.latencies)
+        self.epochs, self.granules, self.latencies = [], [], []
+        return columns
+
+class EventCollector(EventRows):
+    """Write the granule events of the lines read by a counting pass to a
+    Parquet part of the processing file.
+
+    The sidecar never stops a run, so a collector that cannot write its part
+    removes every part of the file and the file is read instead when the
+    sidecar is written. A part is written for every pass, without rows if
+    no line matched, so the parts of a file cover every byte counted.
+
+    Parameters
+    ----------
+    part_dir: pathlib.Path
+        Directory the parts of the file are written to.
+    batch_rows: int
+        Number of events held in memory before they are written.
+    """
+
+    def __init__(self, part_dir, dataset, processing_type, unique_id, source, batch_rows=BATCH_ROWS):
+        super().__init__(dataset, processing_type, unique_id, source)
+        self.part_dir = part_dir
+        self.batch_rows = batch_rows
+        self.temp_file = None
+        self.writer = None
+        self.failed = False
+
+    def append(self, line):
+        if self.failed: return
+        EventRows.append(self, line)
+        if len(self.epochs) >= self.batch_rows: self.write_batch()
+
+    def write_batch(self):
+        """Append the events held to the part being written."""
+
+        try:
+            pa = import_pyarrow()
+        except SidecarError:
+            self.failed = True
+            return
+        try:
+            if self.writer is None:
+                self.part_dir.mkdir(parents=True, exist_ok=True)
+                self.temp_file = self.part_dir.joinpath(f"{uuid.uuid4().hex}.tmp")
+                self.writer = pa.parquet.ParquetWriter(self.temp_file, get_schema(pa), compression="zstd")
+            if len(self): self.writer.write_table(pa.Table.from_pydict(self.pop(), schema=get_schema(pa)))
+        except (OSError, pa.ArrowException):
+            self.failed = True
+
+    def finish(self, start, end, resumed):
+        """Write the part of the bytes from start to end once the file is
+        counted.
+
+        Parts written by earlier runs are removed unless counting resumed 
+        from the lines they were written for.
+        """
+
+        if not self.failed: self.write_batch()
+        part = self.part_dir.joinpath(f"{start:015d}_{end:015d}{PART_SUFFIX}")
+        if not self.failed:
+            try:
+                self.writer.close()
+                os.replace(self.temp_file, part)
+            except OSError:
+                self.failed = True
+        if self.failed:
+            shutil.rmtree(self.part_dir, ignore_errors=True)
+            return
+        if resumed: return
+        for path in self.part_dir.iterdir():
+            if path != part: path.unlink(missing_ok=True)
+
+class EventParts:
+    """Parquet parts of the granule events collected for each processing
+    file.
+
+    Parameters
+    ----------
+    data_dir: pathlib.Path
+        Mounted Processor EFS directory the parts are stored on.
+    batch_rows: int
+        Number of events each collector holds in memory.
+    """
+
+    def __init__(self, data_dir, batch_rows=BATCH_ROWS):
+        self.data_dir = data_dir
+        self.batch_rows = batch_rows
+
+    def get_part_dir(self, dataset, processing_type, unique_id, source):
+        """Return directory of the parts of the processing log or registry."""
+
+        return get_events_dir(self.data_dir, get_checkpoint_key(dataset, processing_type, unique_id)).joinpath(source)
+
+    def collectors(self, dataset, processing_type, unique_id):
+        """Return collectors of the processing log and registry events."""
+
+        return tuple(EventCollector(self.get_part_dir(dataset, processing_type, unique_id, source), dataset, processing_type,
+                                    unique_id, source, self.batch_rows) for source in SOURCES)
+
+    def list_parts(self, dataset, processing_type, unique_id, source):
+        """Return parts of the processing log or registry in byte order or 
+        None if they do not cover every byte counted from the start.
+
+        A part of bytes already covered by a longer part, written by a run 
+        that stopped before its checkpoint was saved, is left out.
+        """
+
+        part_dir = self.get_part_dir(dataset, processing_type, unique_id, source)
+        ranges = []
+        for part in part_dir.glob(f"*{PART_SUFFIX}"):
+            start, end = part.name[:-len(PART_SUFFIX)].split("_")
+            ranges.append((int(start), -int(end), part))
+        if len(ranges) == 0: return None
+        parts = []
+        covered = 0
+        for start, end, part in sorted(ranges):
+            if start < covered: continue
+            if start > covered: return None    # Bytes counted by a run whose part was not written
+            parts.append(part)
+            covered = -end
+        return parts
+
+def read_events(path, dataset, processing_type, unique_id, source, batch_rows=BATCH_ROWS):
+    """Yield columns of batches of the granule events recorded in a
+    processing file."""
+
+    rows = EventRows(dataset, processing_type, unique_id, source)
+    with open(path, "rb") as fh:
+        for raw_line in fh:
+            rows.append(raw_line.decode(errors="replace"))
+            if len(rows) == batch_rows: yield rows.pop()
+    if len(rows) != 0: yield rows.pop()
+
+def get_columns(dataset, processing_type, unique_id, source, epochs, granules, latencies):
+    """Return columns of granule events read from one processing file."""
+
+    return {
+        "dataset": [dataset] * len(epochs),
+        "processing_type": [processing_type] * len(epochs),
+        "unique_id": [unique_id] * len(epochs),
+        "epoch": epochs,
+        "granule": granules,
+        "latency": latencies,
+        "source": [source] * len(epochs)
+    }
+
+def read_event_tables(data_dir, dataset_dict, batch_rows=BATCH_ROWS, parts=None):
+    """Yield tables of batches of the granule events in every processing log
+    and registry.
+
+    Events are read from the parts collected while the reports were counted
+    if given and only processing files without parts are read.
+    """
+
+    pa = import_pyarrow()
+    schema = get_schema(pa)
+    for dataset, processing_dict in dataset_dict.items():
+        for processing_type, file_ids in processing_dict.items():
+            for file_id in file_ids:
+                for source, path in zip(SOURCES, (get_processing_log(data_dir, dataset, file_id),
+                                                  get_registry(data_dir, dataset, processing_type, file_id))):
+                    file_parts = parts.list_parts(dataset, processing_type, file_id, source) if parts else None
+                    if file_parts is not None:
+                        for part in file_parts:
+                            for batch in pa.parquet.ParquetFile(part).iter_batches(batch_size=batch_rows):
+                                yield pa.Table.from_batches([batch]).cast(schema)
+                        continue
+                    try:
+                        for columns in read_events(path, dataset, processing_type, file_id, source, batch_rows):
+                            yield pa.Table.from_pydict(columns, schema=schema)
+                    except FileNotFoundError:
+                        continue
+
+def write_day_files(directory, tables):
+    """Append tables of granule events to one Parquet file per UTC day.
+
+    Each table is sorted by epoch and split into its days, and each slice is
+    written as a row group of the file of its day.
+
+    Returns
+    -------
+    dict
+        Number of rows written and the file of each day written.
+    """
+
+    pa = import_pyarrow()
+    writers = {}
+    files = {}
+    num_rows = 0
+    try:
+        for table in tables:
+            num_rows += table.num_rows
+            table = table.sort_by("epoch")
+            days = pa.compute.divide(table["epoch"].cast(pa.int64()), SECONDS_PER_DAY).to_numpy()
+            boundaries = [0] + [ int(index) + 1 for index in (days[1:] != days[:-1]).nonzero()[0] ] + [table.num_rows]
+            for start, end in zip(boundaries[:-1], boundaries[1:]):
+                day = datetime.date(1970, 1, 1) + datetime.timedelta(days=int(days[start]))
+                if day not in writers:
+                    files[day] = directory.joinpath(f"{day.isoformat()}.parquet")
+                    writers[day] = pa.parquet.ParquetWriter(files[day], table.schema, compression="zstd")
+                writers[day].write_table(table.slice(start, end - start))
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return { "rows": num_rows, "files": files }
+
+def write_events(s3, bucket, data_dir, dataset_dict, run_date, extra_args=None, batch_rows=BATCH_ROWS, parts=None):
+    """Write granule events to one Parquet file per year and day partition.
+
+    Parameters
+    ----------
+    s3: botocore.client.S3
+        S3 client to upload with.
+    bucket: str
+        S3 bucket to upload the sidecar to.
+    data_dir: pathlib.Path
+        Mounted Processor EFS directory.
+    dataset_dict: dict
+        Dictionary of datasets with quicklook and refined unique ids.
+    run_date: datetime.datetime
+        Date of the run, used to name the file written to each partition.
+    extra_args: dict
+        Extra arguments passed to PutObject such as server-side encryption.
+    batch_rows: int
+        Number of lines read into memory at a time.
+    parts: EventParts
+        Parts of the events collected while the reports were counted, read
+        instead of the processing files they were collected from.
+
+    Returns
+    -------
+    dict
+        Number of rows and bytes written and the keys uploaded.
+
+    Raises
+    ------
+    SidecarError
+        If pyarrow is not available or the events could not be written.
+    botocore.exceptions.ClientError
+        If a partition could not be uploaded.
+    """
+
+    pa = import_pyarrow()
+    with tempfile.TemporaryDirectory(prefix="sidecar_") as directory:
+        try:
+            written = write_day_files(pathlib.Path(directory), read_event_tables(data_dir, dataset_dict, batch_rows, parts))
+        except (OSError, pa.ArrowException) as e:
+            raise SidecarError(f"Could not write granule events - {e}.")
+        result = { "rows": written["rows"], "bytes": 0, "keys": [] }
+        for day, file in sorted(written["files"].items()):
+            key = f"{EVENTS_PREFIX}/year={day.year}/day={day.isoformat()}/{run_date.strftime('%Y%m%d')}_events.parquet"
+            with open(file, "rb") as fh:
+                s3.put_object(Bucket=bucket, Key=key, Body=fh, **(extra_args or {}))
+            result["bytes"] += file.stat().st_size
+            result["keys"].append(key)
+    return result
+
+def open_events(bucket=None, root=None, filesystem=None):
+    """Return lazy pyarrow dataset of granule events.
+
+    Only file listings are read when the dataset is opened; columns and
+    partitions are read when the dataset is scanned.
+
+    Parameters
+    ----------
+    bucket: str
+        S3 bucket the sidecar is written to.
+    root: str
+        Root of the events dataset on filesystem, used instead of bucket.
+    filesystem: pyarrow.fs.FileSystem
+        Filesystem of root, defaults to the local filesystem.
+    """
+
+    pa = import_pyarrow()
+    if bucket:
+        filesystem, root = pa.fs.FileSystem.from_uri(f"s3://{bucket}/{EVENTS_PREFIX}")
+    return pa.dataset.dataset(root, filesystem=filesystem, format="parquet", partitioning=get_partitioning(pa))
+
+def query_events(start_day, end_day, columns=None, filter=None, **dataset_args):
+    """Return table of granule events between two days inclusive.
+
+    Partitions outside the day range are pruned from their directory names
+    and only the requested columns are read from each file.
+
+    Parameters
+    ----------
+    start_day: datetime.date
+        First UTC day to read.
+    end_day: datetime.date
+        Last UTC day to read.
+    columns: list
+        Columns to read, defaults to every column.
+    filter: pyarrow.compute.Expression
+        Additional row filter, for example on dataset or source.
+    dataset_args:
+        bucket, root or filesystem passed to open_events.
+    """
+
+    pa = import_pyarrow()
+    field = pa.dataset.field
+    expression = (field("year") >= start_day.year) & (field("year") <= end_day.year) \
+        & (field("day") >= start_day.isoformat()) & (field("day") <= end_day.isoformat())
+    if filter is not None: expression = expression & filter
+    return open_events(**dataset_args).to_table(columns=columns, filter=expression)
+
+def daily_throughput(start_day, end_day, source="processing_log", **dataset_args):
+    """Return granules processed or registered per day, dataset and 
+    processing type.
+
+    Only the partition columns and the dataset, processing type and source
+    columns are read.
+    """
+
+    pa = import_pyarrow()
+    table = query_events(start_day, end_day, columns=["day", "dataset", "processing_type"],
+                         filter=pa.dataset.field("source") == source, **dataset_args)
+    table = table.cast(pa.schema([("day", pa.string()), ("dataset", pa.string()), ("processing_type", pa.string())]))
+    table = table.group_by(["day", "dataset", "processing_type"]).aggregate([("dataset", "count")])
+    return table.select(["day", "dataset", "processing_type", "dataset_count"]) \
+        .rename_columns(["day", "dataset", "processing_type", "granules"]).sort_by([("day", "ascending"), ("dataset", "ascending")])
@@ -6,6 +6,12 @@ resource "aws_lambda_function" "aws_lambda_reporter" {
   package_type  = "Image"
   memory_size   = 1024
   timeout       = 900
+  environment {
+    variables = {
+      REPORTER_TOPIC_ARN = aws_sns_topic.aws_sns_topic_reporter.arn
+      FAILURE_TOPIC_ARN  = data.aws_sns_topic.batch_failure_topic.arn
+    }
+  }
   vpc_config {
     subnet_ids         = data.aws_subnets.private_application_subnets.ids
     security_group_ids = data.aws_security_groups.vpc_default_sg.ids
@@ -123,9 +129,27 @@ resource "aws_iam_policy" "aws_lambda_reporter_execution_policy" {
         "Sid" : "AllowPutObject",
         "Effect" : "Allow",
         "Action" : [
-          "s3:PutObject"
+          "s3:PutObject",
+          "s3:GetObject",
+          "s3:AbortMultipartUpload"
         ],
         "Resource" : "${data.aws_s3_bucket.generate_data.arn}/*"
+      },
+      {
+        "Sid" : "AllowDeleteShards",
+        "Effect" : "Allow",
+        "Action" : [
+          "s3:DeleteObject"
+        ],
+        "Resource" : "${data.aws_s3_bucket.generate_data.arn}/scratch/reporter/shards/*"
+      },
+      {
+        "Sid" : "AllowInvokeShards",
+        "Effect" : "Allow",
+        "Action" : [
+          "lambda:InvokeFunction"
+        ],
+        "Resource" : "arn:aws:lambda:${var.aws_region}:${local.account_id}:function:${var.prefix}-reporter"
       }
     ]
   })
@@ -0,0 +1,60 @@
+"""Shared fixtures of the reporter tests.
+
+The reporter modules are imported the way the Lambda handler imports them,
+from the reporter directory, and AWS is stood in for by moto.
+"""
+
+# Standard imports
+import pathlib
+import sys
+
+# Third-party imports
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1].joinpath("reporter")))
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1].joinpath("benchmarks")))
+
+# Constants
+BUCKET = "bucket1"
+REGION = "us-west-2"
+
+@pytest.fixture
+def aws_credentials(monkeypatch):
+    """Fake credentials so no request can reach a real AWS account."""
+
+    for name, value in (("AWS_ACCESS_KEY_ID", "testing"), ("AWS_SECRET_ACCESS_KEY", "testing"),
+                        ("AWS_SESSION_TOKEN", "testing"), ("AWS_DEFAULT_REGION", REGION)):
+        monkeypatch.setenv(name, value)
+
+@pytest.fixture
+def aws(monkeypatch, aws_credentials):
+    """Mocked bucket and report and failure topics.
+
+    Yields the report and failure topic ARNs, which are also set in the
+    environment so they are not looked up.
+    """
+
+    import boto3
+    from moto import mock_aws
+    import clients
+
+    with mock_aws():
+        clients._clients.clear()    # Clients must be created inside the mock
+        clients._topic_arns.clear()
+        sns = boto3.client("sns")
+        boto3.client("s3").create_bucket(Bucket=BUCKET, CreateBucketConfiguration={ "LocationConstraint": REGION })
+        topics = { "report": sns.create_topic(Name="reporter")["TopicArn"],
+                   "failure": sns.create_topic(Name="batch-job-failure")["TopicArn"] }
+        monkeypatch.setenv("REPORTER_TOPIC_ARN", topics["report"])
+        monkeypatch.setenv("FAILURE_TOPIC_ARN", topics["failure"])
+        yield topics
+    clients._clients.clear()
+    clients._topic_arns.clear()
+
+def get_notifications(topic_arn):
+    """Return messages published to a mocked topic."""
+
+    from moto.core import DEFAULT_ACCOUNT_ID
+    from moto.sns.models import sns_backends
+
+    return [ notification[1] for notification in sns_backends[DEFAULT_ACCOUNT_ID][REGION].topics[topic_arn].sent_notifications ]
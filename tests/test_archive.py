@@ -0,0 +1,130 @@
+"""Tests of the archive compression written without zipfile internals."""
+
+# Standard imports
+import io
+import os
+import zipfile
+
+# Third-party imports
+import boto3
+import pytest
+
+# Local imports
+from conftest import BUCKET
+import archive
+import history
+
+@pytest.fixture
+def files(tmp_path):
+    """Processing logs and registries with repetitive and random lines."""
+
+    file_list = []
+    for index in range(6):
+        file = tmp_path.joinpath(f"modis_aqua_processing_log_{index}.txt")
+        file.write_bytes(b"".join(f"granule_{index}_{line:06d}.nc {line * 7 % 977}\n".encode() for line in range(5000)))
+        file_list.append(file)
+    return file_list
+
+@pytest.mark.parametrize("compression", sorted(archive.COMPRESSION))
+@pytest.mark.parametrize("workers", [1, 4])
+def test_write_archive_round_trip(files, compression, workers):
+    writer = io.BytesIO()
+    manifest = archive.write_archive(writer, files, compression=compression, workers=workers)
+
+    with zipfile.ZipFile(io.BytesIO(writer.getvalue())) as zf:
+        assert zf.testzip() is None
+        for file in files:
+            assert zf.read(file.name) == file.read_bytes()
+            assert zf.getinfo(file.name).compress_type == archive.COMPRESSION[compression]
+    assert [ entry["name"] for entry in manifest ] == [ file.name for file in files ]
+
+@pytest.mark.parametrize("compression", sorted(archive.COMPRESSION))
+def test_read_member_of_zipfile_archive(files, compression):
+    """Members compressed by zipfile itself are read back by history."""
+
+    writer = io.BytesIO()
+    with zipfile.ZipFile(writer, mode="w", compression=archive.COMPRESSION[compression]) as zf:
+        for file in files:
+            zf.write(file, arcname=file.name)
+    writer.seek(0)
+    members = history.index_archive(writer)
+    for file in files:
+        assert history.read_member(writer, members[file.name]) == file.read_bytes()
+
+def test_zip64_records(files, monkeypatch):
+    """Entries, offsets and counts over the zip limits are recorded in Zip64
+    records that zipfile and history read back."""
+
+    monkeypatch.setattr(archive, "ZIP64_LIMIT", 1000)
+    monkeypatch.setattr(archive, "ZIP_FILECOUNT_LIMIT", 2)
+    writer = io.BytesIO()
+    archive.write_archive(writer, files, compression="deflate", workers=2)
+
+    with zipfile.ZipFile(io.BytesIO(writer.getvalue())) as zf:
+        assert zf.testzip() is None
+        assert [ info.filename for info in zf.infolist() ] == [ file.name for file in files ]
+    writer.seek(0)
+    members = history.index_archive(writer)
+    for file in files:
+        assert history.read_member(writer, members[file.name]) == file.read_bytes()
+
+def test_entries_streamed_through_bounded_buffers(tmp_path, monkeypatch):
+    """Threads hold at most ENTRY_BUFFER_CHUNKS chunks each ahead of the
+    writer rather than whole compressed entries."""
+
+    workers = 3
+    files = [ tmp_path.joinpath(f"registry_{index}.txt") for index in range(4) ]
+    for file in files:
+        file.write_bytes(os.urandom(2 * 1024 * 1024))
+    monkeypatch.setattr(archive, "READ_BUFFER_SIZE", 1024)
+    monkeypatch.setattr(archive, "ENTRY_BUFFER_CHUNKS", 2)
+    counts = { "produced": 0, "written": 0, "held": 0 }
+    compress_chunks = archive.compress_chunks
+    write_entry = archive.ZipWriter.write_entry
+
+    def counting_chunks(file, entry, compresslevel=None):
+        for chunk in compress_chunks(file, entry, compresslevel):
+            counts["produced"] += 1
+            counts["held"] = max(counts["held"], counts["produced"] - counts["written"])
+            yield chunk
+
+    def counting_entry(self, entry, chunks):
+        def written():
+            for chunk in chunks:
+                counts["written"] += 1
+                yield chunk
+        write_entry(self, entry, written())
+
+    monkeypatch.setattr(archive, "compress_chunks", counting_chunks)
+    monkeypatch.setattr(archive.ZipWriter, "write_entry", counting_entry)
+    writer = io.BytesIO()
+    archive.write_archive(writer, files, compression="deflate", compresslevel=0, workers=workers)
+
+    assert counts["produced"] == counts["written"] > 10 * workers * 3
+    assert counts["held"] <= workers * (2 + 1) + 1    # Buffered, being put and being written
+    with zipfile.ZipFile(io.BytesIO(writer.getvalue())) as zf:
+        assert zf.testzip() is None
+
+def test_compression_error_stops_archive(files, monkeypatch):
+    compress_chunks = archive.compress_chunks
+
+    def failing(file, entry, compresslevel=None):
+        if file == files[1]: raise OSError(f"Could not read {file}")
+        yield from compress_chunks(file, entry, compresslevel)
+    monkeypatch.setattr(archive, "compress_chunks", failing)
+
+    with pytest.raises(OSError, match="Could not read"):
+        archive.write_archive(io.BytesIO(), files, compression="deflate", workers=2)
+
+def test_failed_abort_keeps_upload_error(files, monkeypatch, aws):
+    def fail_write(*args, **kwargs):
+        raise OSError("EFS read failed")
+
+    def fail_abort(self):
+        raise ConnectionError("S3 unreachable")
+
+    monkeypatch.setattr(archive, "write_archive", fail_write)
+    monkeypatch.setattr(archive.S3MultipartWriter, "abort", fail_abort)
+    with pytest.raises(OSError, match="EFS read failed") as error:
+        archive.upload_archive(boto3.client("s3"), BUCKET, "archive/test.zip", files)
+    assert any("S3 unreachable" in note for note in error.value.__notes__)
@@ -0,0 +1,107 @@
+"""Tests of counting resumed from byte-offset checkpoints."""
+
+# Standard imports
+import datetime
+import logging
+import os
+
+# Third-party imports
+import pytest
+
+# Local imports
+import checkpoint
+import report_engine
+import reporter
+from workload import generate_tree
+
+# Constants
+LINE = "1700000000,Tue Nov 14 22:13:20 2023,granule_{index}.nc,SUCCESS_OVERALL_TOTAL_TIME: 1.0\n"
+
+def match(line):
+    return "SUCCESS" in line
+
+@pytest.fixture
+def log_file(tmp_path):
+    """Log with ten complete lines."""
+
+    path = tmp_path.joinpath("log.txt")
+    path.write_text("".join(LINE.format(index=index) for index in range(10)))
+    return path
+
+def test_resume_reads_appended_bytes(log_file):
+    count, state, bytes_read = report_engine.count_lines(log_file, match)
+    assert count == 10 and state["offset"] == bytes_read == log_file.stat().st_size
+    with open(log_file, "a") as fh:
+        fh.write("".join(LINE.format(index=index) for index in range(10, 15)))
+    count, state, bytes_read = report_engine.count_lines(log_file, match, state)
+    assert count == 15
+    assert bytes_read == 5 * len(LINE.format(index=10))
+    assert state["offset"] == log_file.stat().st_size
+
+def test_new_inode_counts_from_start(log_file, tmp_path):
+    _, state, _ = report_engine.count_lines(log_file, match)
+    replacement = tmp_path.joinpath("replacement.txt")
+    replacement.write_text("".join(LINE.format(index=index) for index in range(12)))
+    os.replace(replacement, log_file)
+    count, state, bytes_read = report_engine.count_lines(log_file, match, state)
+    assert count == 12 and bytes_read == log_file.stat().st_size
+
+def test_truncated_file_counts_from_start(log_file):
+    _, state, _ = report_engine.count_lines(log_file, match)
+    with open(log_file, "r+") as fh:
+        fh.truncate(3 * len(LINE.format(index=0)))
+    count, state, bytes_read = report_engine.count_lines(log_file, match, state)
+    assert count == 3 and bytes_read == log_file.stat().st_size
+
+def test_partial_line_counted_once(log_file):
+    partial = LINE.format(index=10)
+    with open(log_file, "a") as fh:
+        fh.write(partial[:20])
+    count, state, _ = report_engine.count_lines(log_file, match)
+    assert count == 10    # The partial line does not match yet
+    with open(log_file, "a") as fh:
+        fh.write(partial[20:-1])
+    count, state, _ = report_engine.count_lines(log_file, match, state)
+    assert count == 11 and state["count"] == 10
+    assert state["offset"] == log_file.stat().st_size - len(partial) + 1
+    with open(log_file, "a") as fh:
+        fh.write("\n")
+    count, state, bytes_read = report_engine.count_lines(log_file, match, state)
+    assert count == 11 and state["count"] == 11
+    assert bytes_read == len(partial) and state["offset"] == log_file.stat().st_size
+
+def test_checkpoints_of_previous_day_reset_counts(tmp_path):
+    logger = logging.getLogger("test")
+    state = { "offset": 100, "inode": 1, "size": 100, "count": 7 }
+    checkpoints = { "modis_a/quicklook/1": { "log": dict(state), "registry": None } }
+    checkpoint.save_checkpoints(tmp_path, "2024-01-01", checkpoints, logger)
+
+    assert checkpoint.load_checkpoints(tmp_path, "2024-01-01", logger) == checkpoints
+    loaded = checkpoint.load_checkpoints(tmp_path, "2024-01-02", logger)
+    assert loaded["modis_a/quicklook/1"]["log"] == dict(state, count=0)
+    assert loaded["modis_a/quicklook/1"]["registry"] is None
+
+def test_intraday_runs_match_a_full_count(tmp_path, monkeypatch):
+    logger = logging.getLogger("test")
+    data_dir = tmp_path.joinpath("efs")
+    generate_tree(data_dir, 2, 300)
+    monkeypatch.setattr(reporter, "DATA_DIR", data_dir)
+    logs = sorted(data_dir.joinpath("logs", "processing_logs").iterdir())
+    contents = { path: path.read_bytes() for path in logs }
+    for path, content in contents.items():
+        path.write_bytes(content[:len(content) // 2])    # Cut mid-line
+    reporter.run_intraday(2, False, logger)
+    for path, content in contents.items():
+        path.write_bytes(content)
+    reporter.run_intraday(2, False, logger)
+
+    report_day = datetime.date.today().isoformat()
+    checkpoints = checkpoint.load_checkpoints(data_dir, report_day, logger)
+    _, _, resumed, _, _ = reporter.create_reports("python", 2, checkpoints, False, logger)
+    _, _, full, _, _ = reporter.create_reports("python", 2, {}, False, logger)
+    for dataset, processing_dict in full.items():
+        for processing_type, reports in processing_dict.items():
+            for report, resumed_report in zip(reports, resumed[dataset][processing_type]):
+                assert resumed_report["num_files_processed"] == report["num_files_processed"]
+                assert resumed_report["num_files_registry"] == report["num_files_registry"]
+                assert resumed_report["bytes_read"] == 0
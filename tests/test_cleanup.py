@@ -0,0 +1,52 @@
+"""Tests of the removal of processed files and directories from the EFS."""
+
+# Standard imports
+import os
+
+# Third-party imports
+import pytest
+
+# Local imports
+import cleanup
+
+def make_files(directory, num_files):
+    """Create num_files files in directory and return their paths."""
+
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = [ directory.joinpath(f"file_{index:03d}.txt") for index in range(num_files) ]
+    for path in paths:
+        path.write_text("line\n")
+    return paths
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_missing_files_counted_as_missing(tmp_path, workers):
+    paths = make_files(tmp_path, 20)
+    for path in paths[::4]:
+        path.unlink()
+    result = cleanup.remove_files(paths, workers)
+    assert (result["deleted"], result["missing"], result["errors"]) == (15, 5, [])
+    assert list(tmp_path.iterdir()) == []
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_errors_do_not_stop_other_removals(tmp_path, workers):
+    paths = make_files(tmp_path, 10)
+    directory = tmp_path.joinpath("not_a_file")
+    directory.mkdir()
+    result = cleanup.remove_files([directory, *paths], workers)
+    assert (result["deleted"], result["missing"]) == (10, 0)
+    assert [ path for path, _ in result["errors"] ] == [directory]
+    assert list(tmp_path.iterdir()) == [directory]
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_directory_removed_recursively(tmp_path, workers):
+    root = tmp_path.joinpath("reports")
+    paths = make_files(root, 3) + make_files(root.joinpath("a"), 2) + make_files(root.joinpath("a", "b"), 4)
+    root.joinpath("empty").mkdir()
+    os.symlink(tmp_path, root.joinpath("a", "link"))    # Removed without following it
+    result = cleanup.remove_directory(root, workers)
+    assert (result["deleted"], result["missing"], result["errors"]) == (len(paths) + 1 + 4, 0, [])
+    assert list(tmp_path.iterdir()) == []
+
+def test_missing_directory_counted_as_missing(tmp_path):
+    result = cleanup.remove_directory(tmp_path.joinpath("reports"))
+    assert (result["deleted"], result["missing"], result["errors"]) == (0, 1, [])
@@ -0,0 +1,67 @@
+"""Tests of the SNS topic ARNs resolved by searching ListTopics.
+
+Topics are created in moto, which returns 100 topics per page like SNS, and
+the ListTopics calls made by the shared SNS client are counted.
+"""
+
+# Standard imports
+import time
+import types
+
+# Third-party imports
+import boto3
+import pytest
+
+# Local imports
+import clients
+
+@pytest.fixture
+def list_calls(aws):
+    """Number of ListTopics calls made by the shared SNS client."""
+
+    calls = []
+    clients.get_client("sns").meta.events.register("before-call.sns.ListTopics", lambda **kwargs: calls.append(kwargs))
+    return calls
+
+def create_topics(num_topics):
+    """Create topics that come before the report topic in ListTopics."""
+
+    sns = boto3.client("sns")
+    for index in range(num_topics):
+        sns.create_topic(Name=f"processing-{index:03d}")
+
+def test_topic_found_past_first_page(aws, list_calls):
+    create_topics(150)
+    arn = boto3.client("sns").create_topic(Name="generate-daily-report")["TopicArn"]
+    assert clients.resolve_topic_arn("daily-report") == arn
+    assert len(list_calls) == 2
+
+def test_resolved_arn_cached_until_ttl_expires(aws, list_calls, monkeypatch):
+    sns = boto3.client("sns")
+    arn = sns.create_topic(Name="generate-daily-report")["TopicArn"]
+    assert clients.resolve_topic_arn("daily-report", ttl=60) == arn
+    assert clients.resolve_topic_arn("daily-report", ttl=60) == arn
+    assert len(list_calls) == 1
+
+    sns.delete_topic(TopicArn=arn)
+    replacement = sns.create_topic(Name="generate-daily-report-v2")["TopicArn"]
+    assert clients.resolve_topic_arn("daily-report", ttl=60) == arn    # Still cached
+    now = time.monotonic()
+    monkeypatch.setattr(clients, "time", types.SimpleNamespace(monotonic=lambda: now + 61))
+    assert clients.resolve_topic_arn("daily-report", ttl=60) == replacement
+    assert len(list_calls) == 2
+
+def test_missing_topic_raises_and_is_not_cached(aws, list_calls):
+    create_topics(120)
+    with pytest.raises(clients.TopicNotFoundError):
+        clients.resolve_topic_arn("daily-report")
+    assert len(list_calls) == 2
+    assert "daily-report" not in clients._topic_arns
+
+    arn = boto3.client("sns").create_topic(Name="generate-daily-report")["TopicArn"]
+    assert clients.resolve_topic_arn("daily-report") == arn
+
+def test_environment_overrides_lookup(aws, list_calls, monkeypatch):
+    monkeypatch.setenv("DAILY_REPORT_TOPIC_ARN", "arn:aws:sns:us-west-2:123456789012:explicit")
+    assert clients.resolve_topic_arn("daily-report", "DAILY_REPORT_TOPIC_ARN") == "arn:aws:sns:us-west-2:123456789012:explicit"
+    assert list_calls == []
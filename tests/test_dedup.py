@@ -0,0 +1,79 @@
+"""Tests of the distinct granule counters shared by the reports of a dataset."""
+
+# Third-party imports
+import numpy as np
+import pytest
+
+# Local imports
+import dedup
+
+@pytest.fixture
+def hashes():
+    """Hashes of 20000 granules, 5000 of them added twice."""
+
+    rng = np.random.default_rng(0)
+    unique = rng.integers(0, 2**63, size=20000, dtype=np.uint64)
+    return unique, np.concatenate([unique, unique[:5000]])
+
+def test_exact_count_of_batches(hashes):
+    unique, events = hashes
+    counter = dedup.DistinctCounter()
+    for start in range(0, events.size, 1000):
+        counter.add(events[start:start + 1000])
+    stats = dedup.count_distinct(counter, events.size)
+    assert stats["exact"] and stats["distinct"] == unique.size and stats["events"] == events.size
+
+def test_bloom_count_over_budget(hashes):
+    unique, events = hashes
+    counter = dedup.DistinctCounter(memory_budget=32 * 1024)
+    counter.add(events)
+    stats = dedup.count_distinct(counter, events.size)
+    assert not stats["exact"]
+    assert unique.size - stats["undercount"] <= stats["distinct"] <= unique.size
+
+def test_granule_hashes_batches():
+    counter = dedup.DistinctCounter()
+    granule_hashes = dedup.GranuleHashes(counter, batch_size=3)
+    lines = [ f"1700000000,Tue Nov 14 22:13:20 2023,granule_{index % 4}.nc,SUCCESS_OVERALL_TOTAL_TIME: 1.0\n" for index in range(10) ]
+    for line in lines:
+        granule_hashes.append(line)
+    granule_hashes.flush()
+    assert counter.count == 4
+
+@pytest.mark.parametrize("memory_budget", [dedup.MEMORY_BUDGET, 32 * 1024 * dedup.NUM_COUNTERS])
+def test_merge_of_split_counters(hashes, memory_budget):
+    unique, events = hashes
+    whole = dedup.DistinctCounters(memory_budget)
+    whole.get("modis_a", "quicklook").add(events)
+    merged = dedup.DistinctCounters(memory_budget)
+    for part in np.array_split(events, 3):
+        counters = dedup.DistinctCounters(memory_budget)
+        counters.get("modis_a", "quicklook").add(part)
+        merged.merge(dedup.DistinctCounters.from_arrays(counters.to_arrays(), memory_budget))
+    count = merged.get("modis_a", "quicklook").count
+    if memory_budget == dedup.MEMORY_BUDGET:
+        assert count == unique.size
+    else:
+        assert abs(count - whole.get("modis_a", "quicklook").count) <= 0.02 * unique.size
+
+def test_budget_split_between_counters(hashes):
+    unique, events = hashes
+    counters = dedup.DistinctCounters(unique.nbytes * dedup.NUM_COUNTERS // 2)
+    for dataset in ("modis_a", "modis_t", "viirs"):
+        for processing_type in ("quicklook", "refined"):
+            counters.get(dataset, processing_type).add(events)
+    assert all(counter.memory_budget == unique.nbytes // 2 and not counter.exact for counter in counters.counters.values())
+    assert sum(counter.bloom.nbytes for counter in counters.counters.values()) <= counters.memory_budget
+    loaded = dedup.DistinctCounters.from_arrays(counters.to_arrays(), counters.memory_budget)
+    loaded.merge(counters)
+    assert abs(loaded.get("viirs", "refined").count - counters.get("viirs", "refined").count) <= 0.01 * unique.size
+
+def test_save_and_load(tmp_path, hashes):
+    unique, events = hashes
+    counters = dedup.DistinctCounters()
+    counters.get("viirs", "refined").add(events)
+    counters.save(tmp_path.joinpath("distinct.npz"), num_reports=12)
+    loaded, values = dedup.DistinctCounters.load(tmp_path.joinpath("distinct.npz"))
+    assert values == { "num_reports": 12 }
+    assert loaded.get("viirs", "refined").count == unique.size
+    assert dedup.DistinctCounters.load(tmp_path.joinpath("missing.npz")) == (None, {})
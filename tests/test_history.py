@@ -0,0 +1,133 @@
+"""Tests of the index of daily archives and the trends built from it.
+
+Archives are written by the archive module with a daily report summary and
+a processing log, locally for the index and trend tests and to the mocked
+bucket for the trend mode of the handler.
+"""
+
+# Standard imports
+import datetime
+import io
+
+# Third-party imports
+import boto3
+import pytest
+
+# Local imports
+from conftest import BUCKET, get_notifications
+import history
+import reporter
+from archive import write_archive
+
+# Constants
+DATASETS = ("modis_a/quicklook", "viirs/refined")
+
+@pytest.fixture(autouse=True)
+def histories(monkeypatch):
+    """Histories kept at module level, emptied for each test."""
+
+    monkeypatch.setattr(history, "_histories", {})
+    return history._histories
+
+def write_day(directory, day, processed, p95):
+    """Write the archive of a day whose summary records processed granules
+    and p95 latency for each dataset and return its key and bytes."""
+
+    text = ""
+    for key in DATASETS:
+        dataset, processing_type = key.split("/")
+        text += f"Product: list of {processing_type.upper()} {dataset.upper()} L2P files processed on {day:%b %d, %Y}\n"
+        text += f"Number of files processed from logs: {processed}, extracted from processing logs: *.txt\n"
+        text += f"Number of files processed from registry: {processed - 1}, extracted from registry: *.dat\n"
+        text += f"Granule latency (seconds): p50: 1.00, p95: {p95:.2f}, p99: {p95 + 1:.2f}, max: {p95 + 2:.2f}\n"
+    directory.mkdir(parents=True, exist_ok=True)
+    summary = directory.joinpath(f"daily_report_{day:%Y%m%d}.txt")
+    summary.write_text(text)
+    log = directory.joinpath(f"processing_log_{day:%Y%m%d}.txt")
+    log.write_text("granule.nc\n" * processed)
+    buffer = io.BytesIO()
+    write_archive(buffer, [log, summary], "deflate")
+    return f"{day.year}/{day:%Y%m%d}_daily_report_files.zip", buffer.getvalue()
+
+def store_days(root, days):
+    """Write archives of days under root, with day i processing 10 + i
+    granules at a p95 of 100 + i seconds."""
+
+    for index, day in enumerate(days):
+        key, data = write_day(root.joinpath("days"), day, 10 + index, 100.0 + index)
+        root.joinpath(key).parent.mkdir(parents=True, exist_ok=True)
+        root.joinpath(key).write_bytes(data)
+
+def test_index_reads_day_summaries(tmp_path):
+    days = [ datetime.date(2026, 3, 2) + datetime.timedelta(days=offset) for offset in range(3) ]
+    store_days(tmp_path, days)
+    archive_history = history.ArchiveHistory(history.LocalArchiveStore(tmp_path))
+    assert archive_history.update_index() == 3
+    assert tmp_path.joinpath(history.INDEX_NAME).exists()
+    assert archive_history.days(days[1], days[2]) == [ day.isoformat() for day in days[1:] ]
+    summary = archive_history.read_day(days[2].isoformat())
+    assert summary["viirs/refined"] == { "processed": 12, "registry": 11, "p50": 1.0, "p95": 102.0, "p99": 103.0, "max": 104.0 }
+
+def test_only_new_and_replaced_archives_are_indexed(tmp_path, monkeypatch):
+    days = [ datetime.date(2026, 3, 2) + datetime.timedelta(days=offset) for offset in range(4) ]
+    store_days(tmp_path, days[:2])
+    archive_history = history.ArchiveHistory(history.LocalArchiveStore(tmp_path))
+    assert archive_history.update_index() == 2
+    assert archive_history.read_day(days[0].isoformat())["modis_a/quicklook"]["processed"] == 10
+
+    key, data = write_day(tmp_path.joinpath("days"), days[0], 500, 100.0)
+    tmp_path.joinpath(key).write_bytes(data)    # First day replaced by a larger archive
+    store_days(tmp_path, days[2:])
+    assert archive_history.update_index() == 3
+    assert archive_history.read_day(days[0].isoformat())["modis_a/quicklook"]["processed"] == 500
+    assert archive_history.read_day(days[3].isoformat())["modis_a/quicklook"]["processed"] == 11
+    indexed_members = { day: entry["members"] for day, entry in archive_history.index["archives"].items() }
+
+    # A new history reads the persisted index and has nothing to index
+    index_archive = history.index_archive
+    indexed = []
+    monkeypatch.setattr(history, "index_archive", lambda fh: indexed.append(fh) or index_archive(fh))
+    reloaded = history.ArchiveHistory(history.LocalArchiveStore(tmp_path))
+    assert reloaded.update_index() == 0 and indexed == []
+    assert { day: entry["members"] for day, entry in reloaded.index["archives"].items() } == indexed_members
+
+@pytest.mark.parametrize("period, expected", [
+    ("week", { "2026-W09": (1, 11, 101.0), "2026-W10": (7, sum(range(12, 19)), 108.0), "2026-W11": (2, 19 + 20, 110.0) }),
+    ("month", { "2026-03": (10, sum(range(11, 21)), 110.0) })
+])
+def test_trend_aggregates_days(tmp_path, period, expected):
+    days = [ datetime.date(2026, 2, 28) + datetime.timedelta(days=offset) for offset in range(11) ]
+    store_days(tmp_path, days)
+    archive_history = history.ArchiveHistory(history.LocalArchiveStore(tmp_path))
+    archive_history.update_index()
+    trend = history.build_trend(archive_history, days[1], days[-1], period)    # February 28 is left out
+    assert sorted(trend) == sorted(expected)
+    for label, (num_days, processed, p95) in expected.items():
+        totals = trend[label]["datasets"]["modis_a/quicklook"]
+        assert trend[label]["days"] == num_days
+        assert (totals["processed"], totals["registry"], totals["p95"]) == (processed, processed - num_days, p95)
+        assert totals["per_day"] == processed / num_days
+    assert f"{period.capitalize()}: {sorted(expected)[0]}, days archived: " in history.format_trend(trend, period)
+
+def test_trend_without_archives_is_not_published(aws):
+    reporter.event_handler({ "prefix": BUCKET, "mode": "trend" }, None)
+    assert get_notifications(aws["report"]) == []
+    assert get_notifications(aws["failure"]) == []
+
+def test_trend_history_reused_across_invocations(aws, tmp_path, histories):
+    start_day, end_day = history.get_period_range(datetime.datetime.now(datetime.timezone.utc).date(), "week", 1)
+    s3 = boto3.client("s3")
+    for offset in range(7):
+        day = start_day + datetime.timedelta(days=offset)
+        key, data = write_day(tmp_path, day, 10, 100.0)
+        s3.put_object(Bucket=BUCKET, Key=f"{history.ARCHIVE_PREFIX}/{key}", Body=data)
+
+    event = { "prefix": BUCKET, "mode": "trend", "periods": 1 }
+    reporter.event_handler(event, None)
+    archive_history = histories[BUCKET]
+    reporter.event_handler(event, None)
+    assert histories[BUCKET] is archive_history
+    assert archive_history.read_day.cache_info().hits == 7
+    notifications = get_notifications(aws["report"])
+    assert len(notifications) == 2
+    assert f"{history.get_period(end_day, 'week')}, days archived: 7" in notifications[-1]
@@ -0,0 +1,123 @@
+"""Tests of daily runs resumed from the phase journal after a crash.
+
+Each test crashes a daily run at one point, retries it and checks that the
+report was published once, the processing files archived once and the EFS
+left empty, as a retried Lambda invocation would.
+"""
+
+# Standard imports
+import logging
+
+# Third-party imports
+import boto3
+import pytest
+
+# Local imports
+from conftest import BUCKET, get_notifications
+import journal
+import reporter
+from dedup import DistinctCounters
+from workload import generate_tree
+
+class Crash(Exception):
+    """Stands in for a Lambda timeout or error part way through a run."""
+
+@pytest.fixture
+def daily(tmp_path, monkeypatch, aws):
+    """Processing file tree on a temporary EFS with a mocked bucket and topic."""
+
+    data_dir = tmp_path.joinpath("efs")
+    generate_tree(data_dir, 3, 400, duplicate_fraction=0.2)
+    monkeypatch.setattr(reporter, "DATA_DIR", data_dir)
+    return data_dir, aws["report"]
+
+def expected_distinct_lines():
+    """Return the distinct granule line of each dataset of an uninterrupted
+    count of the tree on the EFS."""
+
+    logger = logging.getLogger("test")
+    dataset_dict, _, _ = reporter.discover_processing_files(logger)
+    counters = DistinctCounters()
+    report_dict = reporter.generate_reports(dataset_dict, "python", 2, False, logger, counters=counters)
+    dataset_email, _ = reporter.combine_reports(report_dict, False, logger, counters=counters)
+    return [ line for processing_dict in dataset_email.values() for email in processing_dict.values()
+             for line in email.splitlines() if line.startswith("Granule events") ]
+
+def crash_after_phase(monkeypatch, phase):
+    """Crash once right after phase is recorded as completed."""
+
+    complete = journal.PhaseJournal.complete
+    crashed = []
+
+    def crashing(self, name, outputs=None):
+        complete(self, name, outputs)
+        if name == phase and not crashed:
+            crashed.append(name)
+            raise Crash(f"after {name}")
+
+    monkeypatch.setattr(journal.PhaseJournal, "complete", crashing)
+
+def crash_after_call(monkeypatch, owner, name, calls=1):
+    """Crash once right after the function name of owner returns for the
+    calls time."""
+
+    function = getattr(owner, name)
+    count = []
+
+    def crashing(*args, **kwargs):
+        result = function(*args, **kwargs)
+        count.append(name)
+        if len(count) == calls: raise Crash(f"after {name} call {calls}")
+        return result
+
+    monkeypatch.setattr(owner, name, crashing)
+
+def run_daily_with_retry(monkeypatch, data_dir, topic_arn):
+    """Run the daily report until it crashes, retry it and check the result.
+
+    A retry after the report was published must not combine the reports
+    again as the processing logs they were read from may have been removed.
+    """
+
+    expected = expected_distinct_lines()
+    with pytest.raises((Crash, SystemExit)):    # Errors of a report are handled by exiting
+        reporter.event_handler({ "prefix": BUCKET }, None)
+    published = len(get_notifications(topic_arn)) != 0
+
+    combine_reports = reporter.combine_reports
+    combined = []
+
+    def counting(*args, **kwargs):
+        combined.append(args)
+        return combine_reports(*args, **kwargs)
+
+    monkeypatch.setattr(reporter, "combine_reports", counting)
+    reporter.event_handler({ "prefix": BUCKET }, None)
+
+    assert not (published and combined)
+    notifications = get_notifications(topic_arn)
+    assert len(notifications) == 1
+    assert all(line in notifications[0] for line in expected)
+
+    objects = boto3.client("s3").list_objects_v2(Bucket=BUCKET, Prefix="archive/").get("Contents", [])
+    assert len([ obj for obj in objects if obj["Key"].endswith(".zip") ]) == 1
+    assert [ path for path in data_dir.rglob("*") if path.is_file() ] == []
+    assert not data_dir.joinpath("checkpoints", "journal").exists()
+
+@pytest.mark.parametrize("phase", ["discovery", "reports", "reconciliation", "publish", "archiving", "sidecar", "deletion"])
+def test_crash_after_phase(daily, monkeypatch, phase):
+    crash_after_phase(monkeypatch, phase)
+    run_daily_with_retry(monkeypatch, *daily)
+
+@pytest.mark.parametrize("name", ["archive_processing_files", "write_event_sidecar", "remove_processing_files", 
+                                  "remove_reports_directory"])
+def test_crash_within_phase(daily, monkeypatch, name):
+    crash_after_call(monkeypatch, reporter, name)
+    run_daily_with_retry(monkeypatch, *daily)
+
+@pytest.mark.parametrize("snapshot_seconds", [0, 3600])
+@pytest.mark.parametrize("calls", [1, 5, 10])
+def test_crash_while_recording_reports(daily, monkeypatch, snapshot_seconds, calls):
+    monkeypatch.setattr(journal, "SNAPSHOT_SECONDS", snapshot_seconds)
+    crash_after_call(monkeypatch, journal.PhaseJournal, "record_report", calls)
+    run_daily_with_retry(monkeypatch, *daily)
@@ -0,0 +1,78 @@
+"""Tests of reconciliation from the granule names collected while counting.
+
+Reconciling from the runs written by intraday runs must list the same
+granules as reading the processing logs and registries again.
+"""
+
+# Standard imports
+import datetime
+import logging
+import os
+
+# Third-party imports
+import pytest
+
+# Local imports
+import reconcile as reconcile_module
+import reporter
+from workload import generate_tree, list_tree
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    """Processing file tree with granules missing from some logs and
+    registries."""
+
+    data_dir = tmp_path.joinpath("efs")
+    generate_tree(data_dir, 2, 300)
+    for index, path in enumerate(list_tree(data_dir)):
+        lines = path.read_text().splitlines(keepends=True)
+        step = 7 if path.suffix == ".dat" else 11
+        path.write_text("".join(line for number, line in enumerate(lines) if (number + index) % step))
+    monkeypatch.setattr(reporter, "DATA_DIR", data_dir)
+    return data_dir
+
+def reconcile(granules):
+    """Return reconciliation file and results of the tree."""
+
+    logger = logging.getLogger("test")
+    dataset_dict, _, _ = reporter.discover_processing_files(logger)
+    reconciliation_txt, results = reporter.reconcile_processing_files(dataset_dict, datetime.datetime.now(), False, logger,
+                                                                      granules=granules)
+    return reconciliation_txt.read_text(), results
+
+def run_intraday_in_halves(data_dir):
+    """Run intraday once on the first half of each file and again once the
+    rest has been appended."""
+
+    logger = logging.getLogger("test")
+    contents = { path: path.read_bytes() for path in list_tree(data_dir) }
+    for path, content in contents.items():
+        path.write_bytes(content[:len(content) // 2])    # Cut mid-line
+    reporter.run_intraday(2, False, logger)
+    for path, content in contents.items():
+        path.write_bytes(content)
+    reporter.run_intraday(2, False, logger)
+
+def test_runs_of_intraday_counts_match_files(tree, monkeypatch):
+    run_intraday_in_halves(tree)
+    expected = reconcile(None)
+
+    def fail(*args):
+        raise AssertionError("processing file read again to reconcile it")
+    monkeypatch.setattr(reconcile_module, "read_granules", fail)
+    runs = reporter.get_granule_runs(datetime.date.today().isoformat(), 2)
+    text, results = reconcile(runs)
+    assert (text, results) == expected
+    assert any(result["only_log"] and result["only_registry"]
+               for processing_dict in results.values() for result in processing_dict.values())
+
+def test_replaced_file_drops_its_runs(tree):
+    logger = logging.getLogger("test")
+    reporter.run_intraday(2, False, logger)
+    log = sorted(tree.joinpath("logs", "processing_logs").glob("*.txt"))[0]
+    replacement = log.with_suffix(".new")
+    replacement.write_text("".join(log.read_text().splitlines(keepends=True)[::2]))
+    os.replace(replacement, log)    # New inode so counting starts again
+    reporter.run_intraday(2, False, logger)
+    runs = reporter.get_granule_runs(datetime.date.today().isoformat(), 2)
+    assert reconcile(runs) == reconcile(None)
@@ -0,0 +1,104 @@
+"""Tests of the Python report engine against reports written by the Perl
+scripts it replaces.
+
+The fixture processing log and registries under fixtures/perl mix MODIS_A and
+MODIS_T lines, record granules with both the .nc and .nc.bz2 suffixes, have
+lines of another year and day on the same date and end with a partial line
+without a newline. The expected reports are the output of
+print_generic_daily_report.pl with the fixture directory, the current year
+and the time printed replaced by placeholders.
+
+Backfill reports are checked on lines written around midnight UTC in a
+local time zone whose day differs.
+"""
+
+# Standard imports
+import datetime
+import os
+import pathlib
+import shutil
+import subprocess
+import time
+
+# Third-party imports
+import pytest
+
+# Local imports
+import report_engine
+
+# Constants
+FIXTURES = pathlib.Path(__file__).resolve().parent.joinpath("fixtures", "perl")
+PERL_SCRIPT = pathlib.Path(__file__).resolve().parents[1].joinpath("reporter", "print_generic_daily_report.pl")
+UNIQUE_ID = "100000001"
+REPORTS = [
+    ("quicklook", "Jan 28", "modis_a_quicklook_jan_28.txt"),
+    ("refined", "Jan 28", "modis_a_refined_jan_28.txt"),
+    ("quicklook", "Mar  4", "modis_a_quicklook_mar_4.txt"),
+    ("quicklook", "Mar 14", "modis_a_quicklook_mar_14.txt")
+]
+
+def expected_report(name, now):
+    """Return text of the expected Perl report with its placeholders filled."""
+
+    text = FIXTURES.joinpath("expected", name).read_text()
+    return text.format(data_dir=FIXTURES, year=now.year, date_printed=report_engine.format_ascii_date(now))
+
+@pytest.mark.parametrize("processing_type, report_date, name", REPORTS)
+def test_python_report_matches_perl(tmp_path, processing_type, report_date, name):
+    report = report_engine.generate_daily_report(FIXTURES, "modis_a", processing_type, UNIQUE_ID,
+                                                 report_date=report_date, report_year=2008)
+    report_file = tmp_path.joinpath(name)
+    report_file.write_text(expected_report(name, datetime.datetime.now()))
+    perl_report = report_engine.read_report_file(report_file, UNIQUE_ID)
+    for key in ("product", "extracted_from", "num_files_processed", "num_files_registry", "registry"):
+        assert report[key] == perl_report[key]
+
+def test_partial_line_counted_but_not_consumed():
+    report = report_engine.generate_daily_report(FIXTURES, "modis_a", "quicklook", UNIQUE_ID,
+                                                 report_date="Mar  4", report_year=2008)
+    log_state = report["checkpoint"]["log"]
+    assert log_state["offset"] < log_state["size"]
+    assert log_state["count"] == report["num_files_processed"] - 1
+
+@pytest.mark.skipif(shutil.which("perl") is None, reason="perl is not installed")
+@pytest.mark.parametrize("processing_type, report_date, name", REPORTS)
+def test_fixtures_are_perl_output(processing_type, report_date, name):
+    env = dict(os.environ, SCRATCH_AREA=str(FIXTURES.joinpath("scratch")),
+               PROCESSING_LOGS=str(FIXTURES.joinpath("logs", "processing_logs")),
+               GHRSST_PERL_LIB_DIRECTORY=str(PERL_SCRIPT.parent))
+    process = subprocess.run(["perl", str(PERL_SCRIPT), "-u", UNIQUE_ID, "-i", "MODIS_A", "-d", processing_type.upper(),
+                              "-t", report_date, "-y", "2008"], capture_output=True, text=True, check=True, env=env)
+    expected = expected_report(name, datetime.datetime.now()).splitlines()
+    output = process.stdout.splitlines()
+    assert [ line for line in output if not line.startswith("Date_printed") ] \
+        == [ line for line in expected if not line.startswith("Date_printed") ]
+
+@pytest.fixture
+def pacific_time(monkeypatch):
+    """Local time zone whose day differs from the UTC day."""
+
+    monkeypatch.setenv("TZ", "America/Los_Angeles")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+def test_backfill_buckets_by_utc_day(tmp_path, pacific_time):
+    midnight = int(datetime.datetime(2024, 3, 10, tzinfo=datetime.timezone.utc).timestamp())
+    epochs = [midnight - 2 * 86400, midnight - 1, midnight, midnight + 1, midnight + 86399, midnight + 86400, midnight + 2 * 86400 + 5]
+    log_lines = [ f"{epoch},{time.ctime(epoch)},2024-MODIS_A-granule_{index}.nc,QUICKLOOK,SUCCESS_OVERALL_TOTAL_TIME: 10.0\n" for index, epoch in enumerate(epochs) ]
+    log_lines += [ f"{midnight},{time.ctime(midnight)},2024-MODIS_A-granule_failed.nc,QUICKLOOK,FAILURE_OVERALL_TOTAL_TIME: 10.0\n",
+                   f"{midnight},{time.ctime(midnight)},2024-MODIS_A-granule_refined.nc,REFINED,SUCCESS_OVERALL_TOTAL_TIME: 10.0\n" ]
+    registry_lines = [ f"2024-MODIS_A-granule_{index}.nc,{epoch},{time.ctime(epoch)}\n" for index, epoch in enumerate(epochs) ]
+    registry_lines.append(f"2024-MODIS_T-granule.nc,{midnight},{time.ctime(midnight)}\n")
+    log_file = report_engine.get_processing_log(tmp_path, "modis_a", UNIQUE_ID)
+    registry_file = report_engine.get_registry(tmp_path, "modis_a", "quicklook", UNIQUE_ID)
+    for path, lines in ((log_file, log_lines), (registry_file, registry_lines)):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("".join(lines))
+
+    report = report_engine.generate_backfill_report(tmp_path, "modis_a", "quicklook", UNIQUE_ID,
+                                                    datetime.date(2024, 3, 9), datetime.date(2024, 3, 11))
+    expected = { "2024-03-09": 1, "2024-03-10": 3, "2024-03-11": 1 }
+    assert report["days"] == { day: { "num_files_processed": count, "num_files_registry": count } for day, count in expected.items() }
+    assert report["bytes_read"] == log_file.stat().st_size + registry_file.stat().st_size
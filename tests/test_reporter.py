@@ -0,0 +1,47 @@
+"""Tests of the Lambda handler's checks of event arguments.
+
+Invalid arguments must be reported through handle_error so a failure notice
+is published before the handler exits.
+"""
+
+# Standard imports
+import pstats
+
+# Third-party imports
+import pytest
+
+# Local imports
+from conftest import BUCKET, get_notifications
+import metrics
+import reporter
+from workload import generate_tree
+
+@pytest.mark.parametrize("event", [{ "workers": "many" }, { "workers": None }, { "periods": "4 weeks", "mode": "trend" },
+                                   { "shards": [8], "mode": "coordinator" }])
+def test_invalid_integer_argument_is_notified(aws, event):
+    with pytest.raises(SystemExit):
+        reporter.event_handler({ "prefix": BUCKET, **event }, None)
+    notifications = get_notifications(aws["failure"])
+    assert len(notifications) == 1
+    assert "must be an integer" in notifications[0]
+
+@pytest.mark.parametrize("event, description", [
+    ({ "compression": "deflate", "compression_level": 12 }, "Compression level must be from -1 to 9"),
+    ({ "compression": "bzip2", "compression_level": 0 }, "Compression level must be from 1 to 9"),
+    ({ "compression": "lzma", "compression_level": 6 }, "Lzma compression does not take a compression level"),
+    ({ "compression": "deflate", "compression_level": "best" }, "Compression level must be an integer")
+])
+def test_invalid_compression_level_is_notified(aws, event, description):
+    with pytest.raises(SystemExit):
+        reporter.event_handler({ "prefix": BUCKET, **event }, None)
+    notifications = get_notifications(aws["failure"])
+    assert len(notifications) == 1
+    assert description in notifications[0]
+
+def test_profiled_run_sees_report_workers(aws, tmp_path, monkeypatch):
+    data_dir = tmp_path.joinpath("efs")
+    generate_tree(data_dir, 2, 100)
+    monkeypatch.setattr(reporter, "DATA_DIR", data_dir)
+    reporter.event_handler({ "prefix": BUCKET, "mode": "intraday", "workers": 4, "profile": True }, None)
+    functions = { function for _, _, function in pstats.Stats(metrics.PROFILE_FILE).stats }
+    assert { "generate_daily_report", "count_lines" } <= functions
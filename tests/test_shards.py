@@ -0,0 +1,91 @@
+"""Tests of the daily report fanned out over shards on the local executor.
+
+A coordinator run with the local executor runs its workers and the merge in
+process once it returns. The merge must publish the same email as a daily
+run of the same tree and leave no files or run directories on the EFS, also
+when it is retried after a crash.
+"""
+
+# Standard imports
+import datetime
+
+# Third-party imports
+import pytest
+
+# Local imports
+from conftest import BUCKET, get_notifications
+import journal
+import reporter
+from workload import generate_tree
+
+# Constants
+COORDINATOR_EVENT = { "prefix": BUCKET, "mode": "coordinator", "executor": "local", "shards": 3 }
+
+class Crash(Exception):
+    """Stands in for a Lambda timeout or error part way through a merge."""
+
+@pytest.fixture
+def trees(tmp_path):
+    """Two identical processing file trees, one for each mode."""
+
+    date = datetime.datetime.now()
+    data_dirs = []
+    for name in ("daily", "sharded"):
+        data_dir = tmp_path.joinpath(name, "efs")
+        generate_tree(data_dir, 3, 200, date=date, duplicate_fraction=0.2)
+        data_dirs.append(data_dir)
+    return data_dirs
+
+def run_daily_email(data_dir, topic_arn, monkeypatch):
+    """Return the email published by a daily run of the tree."""
+
+    monkeypatch.setattr(reporter, "DATA_DIR", data_dir)
+    reporter.event_handler({ "prefix": BUCKET }, None)
+    return get_notifications(topic_arn)[-1]
+
+def without_times(email):
+    """Return lines of email without the times it was printed at."""
+
+    return [ line for line in email.splitlines() if not line.startswith(("Generate Processing Report", "Date_printed")) ]
+
+def assert_removed(data_dir):
+    """Check that no files, shards or journal are left on the EFS."""
+
+    assert [ path for path in data_dir.rglob("*") if path.is_file() ] == []
+    assert not data_dir.joinpath("scratch", "shards").exists()
+
+@pytest.mark.parametrize("shard_store", ["efs", "s3"])
+def test_sharded_email_matches_daily(aws, trees, monkeypatch, shard_store):
+    expected = run_daily_email(trees[0], aws["report"], monkeypatch)
+    monkeypatch.setattr(reporter, "DATA_DIR", trees[1])
+    reporter.event_handler({ **COORDINATOR_EVENT, "shard_store": shard_store }, None)
+
+    notifications = get_notifications(aws["report"])
+    assert len(notifications) == 2
+    assert without_times(notifications[-1]) == without_times(expected)
+    assert get_notifications(aws["failure"]) == []
+    assert_removed(trees[1])
+
+@pytest.mark.parametrize("phase", ["publish", "archiving", "deletion"])
+def test_retried_merge_resumes_from_run_journal(aws, trees, monkeypatch, phase):
+    expected = run_daily_email(trees[0], aws["report"], monkeypatch)
+    monkeypatch.setattr(reporter, "DATA_DIR", trees[1])
+    complete = journal.PhaseJournal.complete
+
+    def crashing(self, name, outputs=None):
+        complete(self, name, outputs)
+        if name == phase: raise Crash(f"after {name}")
+
+    monkeypatch.setattr(journal.PhaseJournal, "complete", crashing)
+    with pytest.raises(Crash):
+        reporter.event_handler(COORDINATOR_EVENT, None)
+    run_dirs = list(trees[1].joinpath("scratch", "shards").iterdir())
+    assert len(run_dirs) == 1 and run_dirs[0].joinpath("journal", journal.JOURNAL_NAME).exists()
+    assert not trees[1].joinpath(journal.JOURNAL_DIR).exists()
+
+    monkeypatch.setattr(journal.PhaseJournal, "complete", complete)
+    reporter.event_handler({ **COORDINATOR_EVENT, "mode": "merge", "run_id": run_dirs[0].name }, None)
+    notifications = get_notifications(aws["report"])
+    assert len(notifications) == 2
+    assert without_times(notifications[-1]) == without_times(expected)
+    assert_removed(trees[1])
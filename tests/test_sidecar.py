@@ -0,0 +1,129 @@
+"""Tests of the granule events written to the Parquet sidecar.
+
+Events are the lines the reports count on any day, collected while the
+reports count them. Reading the collected parts must give the same events
+as reading the processing files again.
+"""
+
+# Standard imports
+import datetime
+import logging
+
+# Third-party imports
+import pytest
+
+# Local imports
+import checkpoint
+import reporter
+import sidecar
+from workload import generate_tree, list_tree
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    """Processing file tree where every fifth processing log line failed."""
+
+    data_dir = tmp_path.joinpath("efs")
+    generate_tree(data_dir, 2, 300)
+    for path in data_dir.joinpath("logs", "processing_logs").iterdir():
+        lines = path.read_text().splitlines(keepends=True)
+        path.write_text("".join(line.replace("SUCCESS_", "FAILURE_") if number % 5 == 0 else line
+                                for number, line in enumerate(lines)))
+    monkeypatch.setattr(reporter, "DATA_DIR", data_dir)
+    return data_dir
+
+def read_rows(data_dir, parts=None):
+    """Return sorted rows of every event of the tree."""
+
+    dataset_dict, _, _ = reporter.discover_processing_files(logging.getLogger("test"))
+    rows = []
+    for table in sidecar.read_event_tables(data_dir, dataset_dict, parts=parts):
+        rows.extend(zip(*[ table[name].to_pylist() for name in ("unique_id", "source", "epoch", "granule", "latency") ]))
+    return sorted(rows)
+
+def run_intraday_in_halves(data_dir):
+    """Run intraday once on the first half of each file and again once the
+    rest has been appended."""
+
+    logger = logging.getLogger("test")
+    contents = { path: path.read_bytes() for path in list_tree(data_dir) }
+    for path, content in contents.items():
+        path.write_bytes(content[:len(content) // 2])    # Cut mid-line
+    reporter.run_intraday(2, False, logger)
+    for path, content in contents.items():
+        path.write_bytes(content)
+    reporter.run_intraday(2, False, logger)
+
+def test_only_counted_lines_are_events(tree):
+    rows = read_rows(tree)
+    num_success = sum(line.count("SUCCESS_") for line in (path.read_text() for path in tree.joinpath("logs", "processing_logs").iterdir()))
+    num_registry = sum(len(path.read_text().splitlines()) for path in tree.joinpath("scratch").glob("*.dat"))
+    assert len([ row for row in rows if row[1] == "processing_log" ]) == num_success
+    assert len([ row for row in rows if row[1] == "registry" ]) == num_registry
+    assert all(row[4] is not None for row in rows if row[1] == "processing_log")
+
+def test_daily_throughput_counts_processed_granules(tree, tmp_path):
+    dataset_dict, _, _ = reporter.discover_processing_files(logging.getLogger("test"))
+    day_dir = tmp_path.joinpath("days")
+    day_dir.mkdir()
+    written = sidecar.write_day_files(day_dir, sidecar.read_event_tables(tree, dataset_dict))
+    root = tmp_path.joinpath("events")
+    for day, file in written["files"].items():
+        partition = root.joinpath(f"year={day.year}", f"day={day.isoformat()}")
+        partition.mkdir(parents=True)
+        file.rename(partition.joinpath(file.name))
+
+    today = datetime.date.today()
+    table = sidecar.daily_throughput(today - datetime.timedelta(days=2), today + datetime.timedelta(days=1), root=str(root))
+    assert sum(table["granules"].to_pylist()) == len([ row for row in read_rows(tree) if row[1] == "processing_log" ])
+
+def test_parts_of_intraday_counts_match_files(tree, monkeypatch):
+    run_intraday_in_halves(tree)
+    expected = read_rows(tree)
+
+    def fail(*args):
+        raise AssertionError("processing file read again for the sidecar")
+    monkeypatch.setattr(sidecar, "read_events", fail)
+    assert read_rows(tree, sidecar.EventParts(tree)) == expected
+
+def test_parts_of_stopped_runs_are_skipped(tree):
+    """Parts written by daily runs that resumed from the same checkpoint
+    overlap and only the longest is read."""
+
+    logger = logging.getLogger("test")
+    contents = { path: path.read_bytes() for path in list_tree(tree) }
+    for path, content in contents.items():
+        path.write_bytes(content[:len(content) // 3])
+    reporter.run_intraday(2, False, logger)
+    report_day = datetime.date.today().isoformat()
+    for fraction in (2, 1):
+        for path, content in contents.items():
+            path.write_bytes(content[:len(content) * 2 // 3] if fraction == 2 else content)
+        checkpoints = checkpoint.load_checkpoints(tree, report_day, logger)
+        reporter.create_reports("python", 2, checkpoints, False, logger, events=sidecar.EventParts(tree))
+    parts = sidecar.EventParts(tree)
+    assert read_rows(tree, parts) == read_rows(tree)
+    dataset_dict, _, _ = reporter.discover_processing_files(logger)
+    unique_id = dataset_dict["modis_a"]["quicklook"][0]
+    assert len(list(parts.get_part_dir("modis_a", "quicklook", unique_id, "processing_log").iterdir())) == 3
+
+def test_failed_collector_reads_file(tree, monkeypatch):
+    logger = logging.getLogger("test")
+    contents = { path: path.read_bytes() for path in list_tree(tree) }
+    for path, content in contents.items():
+        path.write_bytes(content[:len(content) // 2])
+    write_batch = sidecar.EventCollector.write_batch
+
+    def failing(self):
+        self.failed = True
+    monkeypatch.setattr(sidecar.EventCollector, "write_batch", failing)
+    reporter.run_intraday(2, False, logger)
+    monkeypatch.setattr(sidecar.EventCollector, "write_batch", write_batch)
+    for path, content in contents.items():
+        path.write_bytes(content)
+    reporter.run_intraday(2, False, logger)
+
+    parts = sidecar.EventParts(tree)
+    dataset_dict, _, _ = reporter.discover_processing_files(logger)
+    unique_id = dataset_dict["viirs"]["refined"][0]
+    assert parts.list_parts("viirs", "refined", unique_id, "processing_log") is None
+    assert read_rows(tree, parts) == read_rows(tree)